@@ -0,0 +1,85 @@
+"""
+Per-request overhead of the metrics middleware implementations.
+
+Calls the ASGI app directly (no server, no HTTP client) so the numbers
+only reflect routing, the endpoint and the middleware itself.
+
+Usage:
+    python benchmarks/middleware_overhead.py [requests]
+"""
+
+import asyncio
+import sys
+import time
+from fastapi import FastAPI
+from fastapi_metrics import Metrics
+
+
+def build_app(middleware_mode=None) -> FastAPI:
+    """Build a minimal app, optionally instrumented with the given mode."""
+    app = FastAPI()
+    if middleware_mode:
+        Metrics(app, storage="memory://", enable_cleanup=False, middleware_mode=middleware_mode)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    """Send ``requests`` GET /ping calls and return seconds per request."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+    async def send(_message):
+        return None
+
+    async def call():
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Like a real server: block until the client disconnects
+            await asyncio.Event().wait()
+
+        await app(dict(scope), receive, send)
+
+    # Warm up routing and middleware stack construction
+    for _ in range(200):
+        await call()
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call()
+    return (time.perf_counter() - start) / requests
+
+
+async def main(requests: int) -> None:
+    """Run every configuration and print per-request cost and overhead."""
+    baseline = await run(build_app(), requests)
+    print(f"{'mode':<10}{'us/request':>12}{'overhead us':>14}")
+    print(f"{'none':<10}{baseline * 1e6:>12.1f}{0.0:>14.1f}")
+    for mode in ("base", "asgi"):
+        per_request = await run(build_app(mode), requests)
+        print(f"{mode:<10}{per_request * 1e6:>12.1f}{(per_request - baseline) * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000))
@@ -0,0 +1,272 @@
+"""Streaming pre-aggregation of HTTP metrics into rollup buckets."""
+
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .sketch import DDSketch
+
+logger = logging.getLogger(__name__)
+
+# Rollup resolutions in seconds: 10s, 1m and 1h buckets
+RESOLUTIONS = (10, 60, 3600)
+
+
+class Rollup:
+    """Count, sum, min, max and latency sketch of one bucket."""
+
+    __slots__ = ("count", "sum", "min", "max", "sketch")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.sketch = DDSketch()
+
+    def add(self, latency_ms: float) -> None:
+        """Fold one request into the bucket."""
+        self.count += 1
+        self.sum += latency_ms
+        self.min = min(self.min, latency_ms)
+        self.max = max(self.max, latency_ms)
+        self.sketch.add(latency_ms)
+
+    def merge(self, other: "Rollup") -> None:
+        """Fold another bucket into this one."""
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Rollup":
+        """Rebuild a bucket from a stored rollup row."""
+        rollup = cls()
+        rollup.count = row["count"]
+        rollup.sum = row["sum"]
+        rollup.min = row["min"]
+        rollup.max = row["max"]
+        rollup.sketch = DDSketch.from_dict(row["sketch"])
+        return rollup
+
+
+def pick_resolution(window_seconds: float) -> int:
+    """Coarsest resolution that still gives at least 60 buckets over the window."""
+    for resolution in sorted(RESOLUTIONS, reverse=True):
+        if window_seconds / resolution >= 60:
+            return resolution
+    return min(RESOLUTIONS)
+
+
+def merge_rollup_rows(
+    rows: Iterable[Dict[str, Any]], key_fields: Tuple[str, ...]
+) -> Dict[Tuple[Any, ...], Rollup]:
+    """Merge rollup rows that share the same values for ``key_fields``."""
+    merged: Dict[Tuple[Any, ...], Rollup] = {}
+    for row in rows:
+        key = tuple(row[f] for f in key_fields)
+        rollup = Rollup.from_row(row)
+        if key in merged:
+            merged[key].merge(rollup)
+        else:
+            merged[key] = rollup
+    return merged
+
+
+class RollupAggregator:
+    """Aggregate HTTP metrics in-process and flush compact rollup rows.
+
+    Every request updates one bucket per resolution, keyed by
+    ``(endpoint, method, status class, bucket start)``. A background task
+    periodically writes buckets that have closed to the storage backend's
+    rollup table; the remaining open buckets are flushed on ``stop()``.
+    Stored rows are append-only (several instances may flush the same
+    bucket) and are merged at read time together with still-open buckets.
+    """
+
+    def __init__(
+        self,
+        storage: Any,
+        resolutions: Tuple[int, ...] = RESOLUTIONS,
+        flush_interval: float = 10.0,
+    ) -> None:
+        self.storage = storage
+        self.resolutions = resolutions
+        self.flush_interval = flush_interval
+        self._buckets: Dict[Tuple[int, float, str, str, int], Rollup] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(
+        self,
+        timestamp: datetime.datetime,
+        endpoint: str,
+        method: str,
+        status_code: int,
+        latency_ms: float,
+    ) -> None:
+        """Fold one HTTP request into the open buckets."""
+        ts = timestamp.timestamp()
+        status_class = status_code // 100
+        for resolution in self.resolutions:
+            key = (resolution, ts - ts % resolution, endpoint, method, status_class)
+            rollup = self._buckets.get(key)
+            if rollup is None:
+                rollup = self._buckets[key] = Rollup()
+            rollup.add(latency_ms)
+
+    async def flush(self, force: bool = False) -> int:
+        """Write closed buckets (all buckets if ``force``) to storage.
+
+        Returns the number of rollup rows written.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+        keys = [k for k in self._buckets if force or k[1] + k[0] <= now]
+        if not keys:
+            return 0
+
+        flushed = {key: self._buckets.pop(key) for key in keys}
+        try:
+            await self.storage.store_rollups([_to_row(k, r) for k, r in flushed.items()])
+        except Exception:
+            # Put the buckets back so the next flush retries them
+            for key, rollup in flushed.items():
+                if key in self._buckets:
+                    self._buckets[key].merge(rollup)
+                else:
+                    self._buckets[key] = rollup
+            raise
+        return len(flushed)
+
+    def start(self) -> None:
+        """Start the periodic flush task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flush task and write out every open bucket."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush(force=True)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Failed to flush rollups on shutdown: %s", e)
+
+    async def _flush_loop(self) -> None:
+        """Background task that flushes closed buckets."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Failed to flush rollups: %s", e)
+
+    async def query(
+        self,
+        resolution: int,
+        from_time: datetime.datetime,
+        to_time: datetime.datetime,
+        endpoint: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Rollup rows for a time range: stored rows merged with open buckets."""
+        # Include the bucket that contains from_time
+        start = from_time - datetime.timedelta(seconds=from_time.timestamp() % resolution)
+        rows = await self.storage.query_rollups(
+            resolution=resolution,
+            from_time=start,
+            to_time=to_time,
+            endpoint=endpoint,
+            method=method,
+        )
+
+        from_ts, to_ts = start.timestamp(), to_time.timestamp()
+        for key, rollup in self._buckets.items():
+            if key[0] != resolution or not from_ts <= key[1] <= to_ts:
+                continue
+            if (endpoint and key[2] != endpoint) or (method and key[3] != method):
+                continue
+            rows.append(_to_row(key, rollup))
+
+        fields = ("bucket", "endpoint", "method", "status_class")
+        return [
+            _to_row((resolution, bucket.timestamp(), ep, meth, status_class), rollup)
+            for (bucket, ep, meth, status_class), rollup in sorted(
+                merge_rollup_rows(rows, fields).items(), key=lambda item: item[0][0]
+            )
+        ]
+
+    async def endpoint_stats(
+        self, from_time: datetime.datetime, to_time: datetime.datetime
+    ) -> List[Dict[str, Any]]:
+        """Per-endpoint statistics over a window, in ``get_endpoint_stats`` shape."""
+        resolution = pick_resolution((to_time - from_time).total_seconds())
+        rows = await self.query(resolution, from_time, to_time)
+
+        totals = merge_rollup_rows(rows, ("endpoint", "method"))
+        errors: Dict[Tuple[str, str], int] = {}
+        for row in rows:
+            if row["status_class"] >= 4:
+                key = (row["endpoint"], row["method"])
+                errors[key] = errors.get(key, 0) + row["count"]
+
+        stats = [
+            {
+                "endpoint": endpoint,
+                "method": method,
+                "count": rollup.count,
+                "avg_latency_ms": rollup.sum / rollup.count,
+                "min_latency_ms": rollup.min,
+                "max_latency_ms": rollup.max,
+                "p50_latency_ms": rollup.sketch.quantile(0.50),
+                "p95_latency_ms": rollup.sketch.quantile(0.95),
+                "p99_latency_ms": rollup.sketch.quantile(0.99),
+                "error_rate": errors.get((endpoint, method), 0) / rollup.count,
+            }
+            for (endpoint, method), rollup in totals.items()
+        ]
+        stats.sort(key=lambda s: s["count"], reverse=True)
+        return stats
+
+    async def summary(
+        self,
+        from_time: datetime.datetime,
+        to_time: datetime.datetime,
+        endpoint: Optional[str] = None,
+    ) -> Optional[Tuple[Rollup, int]]:
+        """Merged rollup and error count over a window, or None without data."""
+        resolution = pick_resolution((to_time - from_time).total_seconds())
+        rows = await self.query(resolution, from_time, to_time, endpoint=endpoint)
+        if not rows:
+            return None
+
+        total = Rollup()
+        errors = 0
+        for row in rows:
+            total.merge(Rollup.from_row(row))
+            if row["status_class"] >= 4:
+                errors += row["count"]
+        return total, errors
+
+
+def _to_row(key: Tuple[int, float, str, str, int], rollup: Rollup) -> Dict[str, Any]:
+    """Storage row for a bucket key and its aggregate."""
+    resolution, bucket, endpoint, method, status_class = key
+    return {
+        "resolution": resolution,
+        "bucket": datetime.datetime.fromtimestamp(bucket, tz=datetime.timezone.utc),
+        "endpoint": endpoint,
+        "method": method,
+        "status_class": status_class,
+        "count": rollup.count,
+        "sum": rollup.sum,
+        "min": rollup.min,
+        "max": rollup.max,
+        "sketch": rollup.sketch.to_dict(),
+    }
@@ -4,6 +4,7 @@ import asyncio
 import logging
 from typing import Optional, Dict, Any, TYPE_CHECKING
 import datetime
+from .sketch import DDSketch
 
 logger = logging.getLogger(__name__)
 
@@ -133,6 +134,9 @@ class AlertManager:
 
         Returns ``None`` when there is no data to evaluate.
         """
+        if self.metrics.rollups:
+            return await self._compute_rollup_value(alert, from_time, to_time)
+
         http_data = await self.metrics.storage.query_http_metrics(
             from_time=from_time,
             to_time=to_time,
@@ -142,21 +146,47 @@ class AlertManager:
         if not http_data:
             return None
 
+        # Sampled rows stand for ``weight`` requests each
+        latencies = DDSketch()
+        errors = 0.0
+        for m in http_data:
+            weight = m.get("weight") or 1
+            latencies.add(m.get("latency_ms", 0), weight)
+            if m.get("status_code", 0) >= 400:
+                errors += weight
+
         metric = alert.metric_name
         if metric == "error_rate":
-            return len([m for m in http_data if m.get("status_code", 0) >= 400]) / len(http_data)
+            return errors / latencies.count
         if metric == "request_count":
-            return float(len(http_data))
+            return latencies.count
         if metric == "avg_latency":
-            return sum(m.get("latency_ms", 0) for m in http_data) / len(http_data)
+            return latencies.sum / latencies.count
         if metric in ("p95_latency", "p99_latency"):
-            latencies = sorted(m.get("latency_ms", 0) for m in http_data)
-            p = 95 if metric == "p95_latency" else 99
-            idx = int(len(latencies) * p / 100)
-            return latencies[min(idx, len(latencies) - 1)]
+            return latencies.quantile(0.95 if metric == "p95_latency" else 0.99)
         # Unknown HTTP metric name — skip
         return None
 
+    async def _compute_rollup_value(
+        self, alert: "Alert", from_time: datetime.datetime, to_time: datetime.datetime
+    ) -> Optional[float]:
+        """Compute the HTTP metric value for an alert from rollup buckets."""
+        summary = await self.metrics.rollups.summary(from_time, to_time, endpoint=alert.endpoint)
+        if summary is None:
+            return None
+
+        rollup, errors = summary
+        metric = alert.metric_name
+        if metric == "error_rate":
+            return errors / rollup.count
+        if metric == "request_count":
+            return float(rollup.count)
+        if metric == "avg_latency":
+            return rollup.sum / rollup.count
+        if metric in ("p95_latency", "p99_latency"):
+            return rollup.sketch.quantile(0.95 if metric == "p95_latency" else 0.99)
+        return None
+
     async def _trigger_alert(self, alert: Alert, value: float):
         """Trigger an alert."""
         message = {
@@ -12,6 +12,7 @@ from typing import Optional
 from rich.console import Console
 from rich.table import Table
 from rich import box
+from fastapi_metrics.sketch import DDSketch
 
 console = Console()
 
@@ -57,16 +58,17 @@ async def cmd_show(args):
         http_data = await storage.query_http_metrics(from_time=from_time, to_time=to_time)
 
         # Calculate stats
-        total = len(http_data)
-        errors = sum(1 for r in http_data if r.get("status_code", 0) >= 400)
-        latencies = [r.get("latency_ms", 0) for r in http_data]
-
-        def percentile(data, p):
-            if not data:
-                return 0
-            s = sorted(data)
-            idx = int(len(s) * p / 100)
-            return s[min(idx, len(s) - 1)]
+        latencies = DDSketch()
+        errors = 0
+        for r in http_data:
+            weight = r.get("weight") or 1
+            latencies.add(r.get("latency_ms", 0), weight)
+            if r.get("status_code", 0) >= 400:
+                errors += weight
+        total = round(latencies.count)
+
+        def percentile(sketch, p):
+            return sketch.quantile(p / 100) or 0
 
         if args.json:
             result = {
@@ -4,21 +4,26 @@ import datetime
 from typing import Any, List, Optional, Union, Dict
 import asyncio
 import json
-import statistics
 import hashlib
 from fastapi import FastAPI, Response
-from .storage.base import StorageBackend
-from .storage.redis import RedisStorage
+from .storage.base import StorageBackend, bucket_seconds, decode_cursor
+from .storage.redis import PackedRedisStorage, RedisStorage
 from .storage.memory import MemoryStorage
 from .storage.sqlite import SQLiteStorage
 from .storage.custom import PostgreSQLStorage, DynamoDBStorage
-from .middleware import MetricsMiddleware
+from .middleware import MetricsMiddleware, ASGIMetricsMiddleware
 from .health.endpoints import HealthManager
 from .health.checks import RedisCheck, DiskSpaceCheck, MemoryCheck, DatabaseCheck
 from .collectors.llm_costs import LLMCostTracker
 from .collectors.system import SystemMetricsCollector
 from .exporters.prometheus import PrometheusExporter
 from .alerting import AlertManager
+from .ingest import ErrorCoalescer, IngestQueue
+from .routing import EndpointLabeler
+from .aggregation import RESOLUTIONS, RollupAggregator
+from .sketch import DDSketch
+from .sampling import Sampler
+from .snapshot import LiveSnapshot
 
 
 class Metrics:
@@ -35,6 +40,19 @@ class Metrics:
         enable_error_tracking: bool = True,
         alert_webhook_url: Optional[str] = None,
         exclude_paths: Optional[List[str]] = None,
+        ingest_queue_size: Optional[int] = None,
+        ingest_queue_policy: str = "drop",
+        middleware_mode: str = "base",
+        group_paths: bool = True,
+        max_endpoints: int = 1000,
+        enable_rollups: bool = False,
+        sample_rate: float = 1.0,
+        sample_endpoint_rates: Optional[Dict[str, float]] = None,
+        sample_keep_errors: bool = True,
+        sample_slow_ms: Optional[float] = None,
+        sample_target_per_sec: Optional[float] = None,
+        live_metrics: bool = False,
+        error_coalesce_window: Optional[float] = None,
     ):
         """
         Initialize metrics for a FastAPI application.
@@ -42,7 +60,23 @@ class Metrics:
         Args:
             app: FastAPI application instance
             storage: Storage backend ("memory://", "sqlite://path",
-                "redis://host:port/db") or StorageBackend instance
+                "redis://host:port/db") or StorageBackend instance.
+                "memory://?max_events=N" (or "?max_bytes=N") keeps HTTP
+                metrics in a fixed-size ring buffer.
+                "sqlite://path?commit_batch_size=N&commit_interval_ms=M"
+                group-commits single writes every N rows or M milliseconds;
+                "?partition_by=hour" (or "day") stores HTTP and custom
+                metrics in time-partitioned tables dropped on retention.
+                "?read_pool_size=N&analytics_pool_size=M" sizes the
+                read-only connections for short queries and for
+                aggregations.
+                "redis://host:port/db?batch_size=N&batch_interval_ms=M"
+                coalesces concurrent writes into one pipeline every N
+                metrics or M milliseconds; "?layout=packed" stores
+                metrics in compact per-minute lists. "rediss://" connects
+                over TLS; "?max_connections=N", "?unix_socket_path=PATH",
+                "?socket_keepalive=false" and "?protocol=3" configure the
+                connection pool.
             retention_hours: How long to keep metrics data (hours)
             enable_cleanup: Whether to enable automatic cleanup of old data
             enable_health_checks: Enable Kubernetes health check endpoints
@@ -52,6 +86,45 @@ class Metrics:
             exclude_paths: List of URL paths to skip tracking entirely
                 (e.g. ["/docs", "/health"]). Defaults to ["/docs",
                 "/openapi.json", "/redoc"].
+            ingest_queue_size: Capacity of the write-behind ingest queue.
+                When set, requests enqueue their metrics and a background
+                task writes them to storage. None (default) writes inline.
+            ingest_queue_policy: What to do when the ingest queue is full:
+                "drop" discards the event, "block" waits for free space.
+            middleware_mode: "base" (default) uses the BaseHTTPMiddleware
+                implementation; "asgi" uses a pure ASGI middleware with
+                lower per-request overhead that leaves streaming responses
+                and background tasks untouched.
+            group_paths: Record the matched route template (e.g.
+                "/users/{user_id}") instead of the raw request path.
+            max_endpoints: Maximum number of distinct raw paths recorded
+                for requests that match no route; further ones are recorded
+                as "__other__".
+            enable_rollups: Pre-aggregate HTTP metrics in-process into
+                10s/1m/1h rollup buckets that are flushed to storage.
+                Endpoint stats, Prometheus export and HTTP alerts are then
+                computed from rollups instead of raw request rows.
+            sample_rate: Fraction of HTTP requests to record (0 < rate <= 1).
+                Recorded rows store a weight of 1 / rate so that totals,
+                error rates and percentiles stay unbiased. Rollups still
+                see every request.
+            sample_endpoint_rates: Per-endpoint sample rates, keyed by
+                endpoint label, overriding ``sample_rate``.
+            sample_keep_errors: Always record requests with status >= 400.
+            sample_slow_ms: Always record requests at least this slow.
+            sample_target_per_sec: Adaptively lower the sample rate so that
+                roughly this many requests are recorded per second.
+            live_metrics: Serve /metrics from running aggregates updated as
+                requests and custom metrics are recorded (constant time per
+                scrape). Opt-in: the aggregates only cover what this process
+                recorded since it started, so the default recomputes /metrics
+                from storage on every call, which also includes data from
+                before a restart and from every instance sharing a backend.
+            error_coalesce_window: Seconds during which repeats of an
+                already recorded error are only counted in-process and then
+                written as one update. Requires a storage backend whose
+                store_error accepts ``count``. None or 0 (the default)
+                writes every occurrence.
         """
         self.app = app
         self.retention_hours = retention_hours
@@ -68,11 +141,50 @@ class Metrics:
         # Initialize storage
         if isinstance(storage, str):
             if storage.startswith("memory://"):
-                self.storage = MemoryStorage()
+                # Format: memory://?max_events=100000 (or max_bytes=...)
+                from urllib.parse import urlparse, parse_qs
+
+                params = parse_qs(urlparse(storage).query)
+                self.storage = MemoryStorage(
+                    max_events=int(params["max_events"][0]) if "max_events" in params else None,
+                    max_bytes=int(params["max_bytes"][0]) if "max_bytes" in params else None,
+                )
             elif storage.startswith("sqlite://"):
-                self.storage = SQLiteStorage(storage.replace("sqlite://", ""))
-            elif storage.startswith("redis://"):
-                self.storage = RedisStorage(storage)
+                # Format: sqlite://metrics.db?commit_batch_size=1000&commit_interval_ms=50
+                from urllib.parse import parse_qs
+
+                path, _, query = storage[len("sqlite://") :].partition("?")
+                params = parse_qs(query)
+                self.storage = SQLiteStorage(
+                    path,
+                    commit_batch_size=(
+                        int(params["commit_batch_size"][0])
+                        if "commit_batch_size" in params
+                        else None
+                    ),
+                    commit_interval_ms=float(params.get("commit_interval_ms", ["100"])[0]),
+                    partition_by=params.get("partition_by", [None])[0],
+                    read_pool_size=int(params.get("read_pool_size", ["2"])[0]),
+                    analytics_pool_size=int(params.get("analytics_pool_size", ["1"])[0]),
+                )
+            elif storage.startswith(("redis://", "rediss://")):
+                # Format: redis://host:port/db?batch_size=200&batch_interval_ms=2
+                # &max_connections=50&unix_socket_path=/run/redis.sock
+                from urllib.parse import urlparse, parse_qs
+
+                params = parse_qs(urlparse(storage).query)
+                packed = params.get("layout", ["hash"])[0] == "packed"
+                self.storage = (PackedRedisStorage if packed else RedisStorage)(
+                    storage,
+                    batch_size=int(params["batch_size"][0]) if "batch_size" in params else None,
+                    batch_interval_ms=float(params.get("batch_interval_ms", ["2"])[0]),
+                    max_connections=(
+                        int(params["max_connections"][0]) if "max_connections" in params else None
+                    ),
+                    socket_keepalive=params.get("socket_keepalive", ["true"])[0] == "true",
+                    unix_socket_path=params.get("unix_socket_path", [None])[0],
+                    protocol=int(params["protocol"][0]) if "protocol" in params else None,
+                )
             elif storage.startswith("postgresql://"):
                 self.storage = PostgreSQLStorage(storage)
             elif storage.startswith("dynamodb://"):
@@ -89,15 +201,58 @@ class Metrics:
             # Custom storage instance
             self.storage = storage
 
+        if enable_rollups and not self._supports_rollups(self.storage):
+            raise ValueError(
+                "enable_rollups requires a storage backend with rollup support; "
+                f"{type(self.storage).__name__} does not implement store_rollups "
+                "and query_rollups"
+            )
+        self.rollups = RollupAggregator(self.storage) if enable_rollups else None
+        self.live_snapshot = LiveSnapshot(window_hours=retention_hours) if live_metrics else None
+
+        self.ingest_queue = (
+            IngestQueue(self.storage, maxsize=ingest_queue_size, policy=ingest_queue_policy)
+            if ingest_queue_size
+            else None
+        )
+
+        self.sampler = (
+            Sampler(
+                rate=sample_rate,
+                endpoint_rates=sample_endpoint_rates,
+                keep_errors=sample_keep_errors,
+                slow_threshold_ms=sample_slow_ms,
+                target_events_per_sec=sample_target_per_sec,
+            )
+            if sample_rate < 1.0 or sample_endpoint_rates or sample_target_per_sec
+            else None
+        )
+
         self.enable_error_tracking = enable_error_tracking
+        self.error_coalescer = (
+            ErrorCoalescer(self._write_error, window=error_coalesce_window)
+            if enable_error_tracking and error_coalesce_window
+            else None
+        )
+
+        self.endpoint_labeler = (
+            EndpointLabeler(app.router, max_endpoints=max_endpoints) if group_paths else None
+        )
 
         _default_excludes = ["/docs", "/openapi.json", "/redoc"]
         self.exclude_paths: List[str] = (
             exclude_paths if exclude_paths is not None else _default_excludes
         )
 
+        if middleware_mode == "base":
+            middleware_class = MetricsMiddleware
+        elif middleware_mode == "asgi":
+            middleware_class = ASGIMetricsMiddleware
+        else:
+            raise ValueError(f"Unknown middleware mode: {middleware_mode}")
+
         app.add_middleware(
-            MetricsMiddleware,
+            middleware_class,
             metrics_instance=self,
             track_errors=enable_error_tracking,
             exclude_paths=self.exclude_paths,
@@ -123,6 +278,15 @@ class Metrics:
                 ):
                     self.health_manager.add_check("redis", RedisCheck(self.storage.client))
 
+            # Start the write-behind flusher before traffic arrives
+            if self.ingest_queue:
+                self.ingest_queue.start()
+            if self.error_coalescer:
+                self.error_coalescer.start()
+
+            if self.rollups:
+                self.rollups.start()
+
             # Start alert background checker
             self.alert_manager.start()
 
@@ -131,6 +295,15 @@ class Metrics:
                 self._cleanup_task = asyncio.create_task(self._cleanup_loop())
 
         async def shutdown():
+            # Flush open rollup buckets and drain queued events while
+            # storage is still open
+            if self.rollups:
+                await self.rollups.stop()
+            if self.error_coalescer:
+                await self.error_coalescer.stop()
+            if self.ingest_queue:
+                await self.ingest_queue.stop()
+            await self.storage.flush()
             await self.storage.close()
             await self.alert_manager.stop()
             if self.enable_cleanup and self._cleanup_task:
@@ -146,6 +319,15 @@ class Metrics:
         # Register metrics endpoints
         self._register_endpoints()
 
+    @staticmethod
+    def _supports_rollups(storage: Any) -> bool:
+        """Whether ``storage`` overrides both rollup methods of ``StorageBackend``."""
+        return all(
+            callable(getattr(storage, name, None))
+            and getattr(type(storage), name, None) is not getattr(StorageBackend, name)
+            for name in ("store_rollups", "query_rollups")
+        )
+
     def _register_endpoints(self):
         """Register metrics API endpoints."""
 
@@ -159,110 +341,33 @@ class Metrics:
             to_time = datetime.datetime.now(datetime.timezone.utc)
             from_time = to_time - datetime.timedelta(hours=from_hours)
 
-            # Use the correct storage method names — fetch all data for aggregation
-            http_data = await self.storage.query_http_metrics(
-                from_time=from_time,
-                to_time=to_time,
-                limit=100_000,
-            )
-
-            # Aggregate HTTP metrics
-            total_requests = len(http_data)
-            status_codes = {}
-            endpoints = {}
-            latencies = []
-            error_count = 0
-
-            for record in http_data:
-                status = record.get("status_code", 0)
-                status_codes[status] = status_codes.get(status, 0) + 1
-
-                endpoint = record.get("endpoint", "unknown")
-                method = record.get("method", "GET")
-                key = f"{endpoint}:{method}"
-                if key not in endpoints:
-                    endpoints[key] = {"count": 0, "latencies": []}
-                endpoints[key]["count"] += 1
-
-                latency = record.get("latency_ms", 0)
-                latencies.append(latency)
-                endpoints[key]["latencies"].append(latency)
-
-                if status >= 400:
-                    error_count += 1
-
-            def percentile(data, p):
-                if not data:
-                    return 0
-                s = sorted(data)
-                idx = int(len(s) * p / 100)
-                return s[min(idx, len(s) - 1)]
-
-            # Format endpoints
-            requests_per_endpoint = {}
-            for key, data in endpoints.items():
-                ep, meth = key.split(":")
-                if ep not in requests_per_endpoint:
-                    requests_per_endpoint[ep] = {}
-                requests_per_endpoint[ep][meth] = data["count"]
+            if self.live_snapshot:
+                sections = self.live_snapshot.window(from_time, to_time).to_metrics()
+            else:
+                sections = await self._metrics_from_storage(from_time, to_time)
 
             # Build response
             metrics = {
-                "http": {
-                    "total_requests": total_requests,
-                    "requests_per_endpoint": requests_per_endpoint,
-                    "status_codes": status_codes,
-                    "latency": {
-                        "p50": round(percentile(latencies, 50), 2) if latencies else 0,
-                        "p95": round(percentile(latencies, 95), 2) if latencies else 0,
-                        "p99": round(percentile(latencies, 99), 2) if latencies else 0,
-                        "avg": round(statistics.mean(latencies), 2) if latencies else 0,
-                    },
-                    "error_rate": (
-                        round(error_count / total_requests, 3) if total_requests > 0 else 0
-                    ),
-                    "active_requests": self._active_requests,
-                },
+                "http": {**sections["http"], "active_requests": self._active_requests},
                 "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat() + "Z",
             }
 
+            if self.ingest_queue:
+                metrics["ingest"] = self.ingest_queue.stats()
+            if self.sampler:
+                metrics["sampling"] = self.sampler.stats()
+            if isinstance(self.storage, MemoryStorage) and self.storage.http.capacity:
+                metrics["storage"] = self.storage.stats()
+            elif isinstance(self.storage, RedisStorage):
+                metrics["storage"] = self.storage.stats()
+
             # Add system metrics if enabled
             if self.system_metrics:
                 system_data = await self.system_metrics.collect()
                 metrics["system"] = system_data
 
-            # Add custom metrics summary — fetch all data for aggregation
-            custom_data = await self.storage.query_custom_metrics(
-                from_time=from_time,
-                to_time=to_time,
-                limit=100_000,
-            )
-
-            if custom_data:
-                custom_summary = {}
-                for record in custom_data:
-                    name = record.get("name") or record.get("metric_name", "unknown")
-                    value = record.get("value", 0)
-
-                    if name not in custom_summary:
-                        custom_summary[name] = {
-                            "count": 0,
-                            "sum": 0,
-                            "min": float("inf"),
-                            "max": float("-inf"),
-                        }
-
-                    custom_summary[name]["count"] += 1
-                    custom_summary[name]["sum"] += value
-                    custom_summary[name]["min"] = min(custom_summary[name]["min"], value)
-                    custom_summary[name]["max"] = max(custom_summary[name]["max"], value)
-
-                for name, data in custom_summary.items():
-                    data["avg"] = round(data["sum"] / data["count"], 2)
-                    data["total"] = data["sum"]
-                    del data["sum"]
-
-                metrics["custom"] = custom_summary
+            if sections["custom"]:
+                metrics["custom"] = sections["custom"]
 
             return metrics
 
@@ -275,8 +380,10 @@ class Metrics:
             method: Optional[str] = None,
             name: Optional[str] = None,
             group_by: Optional[str] = None,
+            fill_gaps: bool = False,
             page: int = 1,
             limit: int = 100,
+            cursor: Optional[str] = None,
         ):
             """
             Query metrics with time range, filters, and pagination.
@@ -288,9 +395,12 @@ class Metrics:
                 endpoint: Filter by endpoint (HTTP only)
                 method: Filter by method (HTTP only)
                 name: Filter by metric name (custom only)
-                group_by: Group results by "hour" or None
+                group_by: Time bucket width such as "10s", "5m", "1h", "1d" or "hour"
+                fill_gaps: Return empty buckets too when grouping
                 page: Page number, 1-based (default: 1)
                 limit: Results per page, max 1000 (default: 100)
+                cursor: ``next_cursor`` of the previous response; pages by
+                    (timestamp, id) instead of ``page`` so deep pages stay cheap
             """
             limit = min(max(1, limit), 1000)
             page = max(1, page)
@@ -300,6 +410,23 @@ class Metrics:
             from_time = now - datetime.timedelta(hours=from_hours)
             to_time = now - datetime.timedelta(hours=to_hours)
 
+            try:
+                if group_by:
+                    bucket_seconds(group_by)
+                if cursor:
+                    if group_by:
+                        return {"error": "cursor cannot be combined with group_by"}
+                    decode_cursor(cursor)
+            except ValueError as e:
+                return {"error": str(e)}
+
+            # Only pass the newer options when used so custom backends keep working
+            paging: Dict[str, Any] = {}
+            if fill_gaps:
+                paging["fill_gaps"] = True
+            if cursor:
+                paging["cursor"] = cursor
+
             if metric_type == "http":
                 results = await self.storage.query_http_metrics(
                     from_time=from_time,
@@ -309,6 +436,7 @@ class Metrics:
                     group_by=group_by,
                     limit=limit,
                     offset=offset,
+                    **paging,
                 )
             elif metric_type == "custom":
                 results = await self.storage.query_custom_metrics(
@@ -318,6 +446,7 @@ class Metrics:
                     group_by=group_by,
                     limit=limit,
                     offset=offset,
+                    **paging,
                 )
             else:
                 return {"error": "Invalid metric_type. Use 'http' or 'custom'"}
@@ -330,6 +459,7 @@ class Metrics:
                 "limit": limit,
                 "count": len(results),
                 "results": results,
+                "next_cursor": getattr(results, "next_cursor", None),
             }
 
         @self.app.get("/metrics/endpoints")
@@ -337,13 +467,63 @@ class Metrics:
             """Get aggregated statistics per endpoint within a time window."""
             now = datetime.datetime.now(datetime.timezone.utc)
             from_time = now - datetime.timedelta(hours=hours)
-            stats = await self.storage.get_endpoint_stats(from_time=from_time, to_time=now)
+            if self.rollups:
+                stats = await self.rollups.endpoint_stats(from_time=from_time, to_time=now)
+            else:
+                stats = await self.storage.get_endpoint_stats(from_time=from_time, to_time=now)
             return {
                 "timestamp": now.isoformat(),
                 "period_hours": hours,
                 "endpoints": stats,
             }
 
+        if self.rollups:
+
+            @self.app.get("/metrics/rollups")
+            async def get_rollups(
+                resolution: int = 60,
+                hours: int = 1,
+                endpoint: Optional[str] = None,
+                method: Optional[str] = None,
+            ):
+                """Get pre-aggregated rollup buckets within a time window.
+
+                Args:
+                    resolution: Bucket width in seconds (10, 60 or 3600)
+                    hours: How many hours back to include (default: 1)
+                    endpoint: Filter by endpoint
+                    method: Filter by method
+                """
+                if resolution not in RESOLUTIONS:
+                    return {"error": f"Invalid resolution. Use one of {list(RESOLUTIONS)}"}
+
+                now = datetime.datetime.now(datetime.timezone.utc)
+                rows = await self.rollups.query(
+                    resolution,
+                    now - datetime.timedelta(hours=hours),
+                    now,
+                    endpoint=endpoint,
+                    method=method,
+                )
+                return {
+                    "resolution": resolution,
+                    "period_hours": hours,
+                    "count": len(rows),
+                    "rollups": [
+                        {
+                            "bucket": row["bucket"].isoformat(),
+                            "endpoint": row["endpoint"],
+                            "method": row["method"],
+                            "status_class": row["status_class"],
+                            "count": row["count"],
+                            "avg_latency_ms": round(row["sum"] / row["count"], 2),
+                            "min_latency_ms": row["min"],
+                            "max_latency_ms": row["max"],
+                        }
+                        for row in rows
+                    ],
+                }
+
         @self.app.post("/metrics/cleanup")
         async def cleanup_metrics(hours_to_keep: int = None):
             """Manually trigger cleanup of old metrics data."""
@@ -431,7 +611,7 @@ class Metrics:
         @self.app.get("/metrics/export/prometheus")
         async def export_prometheus(hours: int = 1):
             """Export metrics in Prometheus format."""
-            exporter = PrometheusExporter(self.storage)
+            exporter = PrometheusExporter(self.storage, rollups=self.rollups)
             output = await exporter.export_http_metrics(hours=hours)
             return Response(
                 content=output,
@@ -455,6 +635,96 @@ class Metrics:
 
             return {"timestamp": now.isoformat(), "count": len(errors), "errors": errors[:limit]}
 
+    async def _metrics_from_storage(
+        self, from_time: datetime.datetime, to_time: datetime.datetime
+    ) -> Dict[str, Any]:
+        """``http`` and ``custom`` /metrics sections recomputed from storage."""
+        # Fetch all data for aggregation
+        http_data = await self.storage.query_http_metrics(
+            from_time=from_time,
+            to_time=to_time,
+            limit=100_000,
+        )
+
+        # Aggregate HTTP metrics; sampled rows count for their weight
+        total_requests = 0
+        status_codes = {}
+        endpoints = {}
+        latencies = DDSketch()
+        error_count = 0
+
+        for record in http_data:
+            weight = record.get("weight") or 1
+            total_requests += weight
+            status = record.get("status_code", 0)
+            status_codes[status] = status_codes.get(status, 0) + weight
+
+            endpoint = record.get("endpoint", "unknown")
+            method = record.get("method", "GET")
+            key = f"{endpoint}:{method}"
+            if key not in endpoints:
+                endpoints[key] = {"count": 0}
+            endpoints[key]["count"] += weight
+
+            latencies.add(record.get("latency_ms", 0), weight)
+
+            if status >= 400:
+                error_count += weight
+
+        # Format endpoints
+        requests_per_endpoint = {}
+        for key, data in endpoints.items():
+            ep, meth = key.split(":")
+            if ep not in requests_per_endpoint:
+                requests_per_endpoint[ep] = {}
+            requests_per_endpoint[ep][meth] = round(data["count"])
+
+        # Custom metrics summary — fetch all data for aggregation
+        custom_data = await self.storage.query_custom_metrics(
+            from_time=from_time,
+            to_time=to_time,
+            limit=100_000,
+        )
+
+        custom_summary = {}
+        for record in custom_data:
+            name = record.get("name") or record.get("metric_name", "unknown")
+            value = record.get("value", 0)
+
+            if name not in custom_summary:
+                custom_summary[name] = {
+                    "count": 0,
+                    "sum": 0,
+                    "min": float("inf"),
+                    "max": float("-inf"),
+                }
+
+            custom_summary[name]["count"] += 1
+            custom_summary[name]["sum"] += value
+            custom_summary[name]["min"] = min(custom_summary[name]["min"], value)
+            custom_summary[name]["max"] = max(custom_summary[name]["max"], value)
+
+        for name, data in custom_summary.items():
+            data["avg"] = round(data["sum"] / data["count"], 2)
+            data["total"] = data["sum"]
+            del data["sum"]
+
+        return {
+            "http": {
+                "total_requests": round(total_requests),
+                "requests_per_endpoint": requests_per_endpoint,
+                "status_codes": {k: round(v) for k, v in status_codes.items()},
+                "latency": {
+                    "p50": round(latencies.quantile(0.50) or 0, 2),
+                    "p95": round(latencies.quantile(0.95) or 0, 2),
+                    "p99": round(latencies.quantile(0.99) or 0, 2),
+                    "avg": round(latencies.sum / latencies.count, 2) if total_requests else 0,
+                },
+                "error_rate": (round(error_count / total_requests, 3) if total_requests > 0 else 0),
+            },
+            "custom": custom_summary,
+        }
+
     async def _store_http_metric(
         self,
         timestamp: datetime,
@@ -465,14 +735,30 @@ class Metrics:
         labels: Optional[Dict[str, Any]] = None,
     ):
         """Internal method to store HTTP metrics."""
-        await self.storage.store_http_metric(
-            timestamp=timestamp,
-            endpoint=endpoint,
-            method=method,
-            status_code=status_code,
-            latency_ms=latency_ms,
-            labels=labels,
-        )
+        if self.rollups:
+            self.rollups.add(timestamp, endpoint, method, status_code, latency_ms)
+        if self.live_snapshot:
+            self.live_snapshot.add_http(timestamp, endpoint, method, status_code, latency_ms)
+        weight = 1.0
+        if self.sampler:
+            weight = self.sampler.weight(endpoint, status_code, latency_ms)
+            if not weight:
+                return
+        record = {
+            "timestamp": timestamp,
+            "endpoint": endpoint,
+            "method": method,
+            "status_code": status_code,
+            "latency_ms": latency_ms,
+            "labels": labels,
+        }
+        # Only pass the weight when sampling so custom backends keep working
+        if weight != 1.0:
+            record["weight"] = weight
+        if self.ingest_queue and self.ingest_queue.running:
+            await self.ingest_queue.put("http", record)
+            return
+        await self.storage.store_http_metric(**record)
 
     async def track(
         self,
@@ -492,12 +778,18 @@ class Metrics:
             await metrics.track("revenue", 99.99, user_id=123, plan="pro")
             await metrics.track("signups", 1, source="organic")
         """
-        await self.storage.store_custom_metric(
-            timestamp=datetime.datetime.now(datetime.timezone.utc),
-            name=name,
-            value=value,
-            labels=labels if labels else None,
-        )
+        record = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc),
+            "name": name,
+            "value": value,
+            "labels": labels if labels else None,
+        }
+        if self.live_snapshot:
+            self.live_snapshot.add_custom(record["timestamp"], name, value)
+        if self.ingest_queue and self.ingest_queue.running:
+            await self.ingest_queue.put("custom", record)
+            return
+        await self.storage.store_custom_metric(**record)
 
     def track_sync(self, name: str, value: float, **labels: Any):
         """
@@ -557,16 +849,27 @@ class Metrics:
             f"{endpoint}:{error_type}:{stack_trace[:200]}".encode()
         ).hexdigest()[:12]
 
-        await self.storage.store_error(
-            timestamp=timestamp,
-            endpoint=endpoint,
-            method=method,
-            error_type=error_type,
-            error_message=error_message,
-            error_hash=error_hash,
-            stack_trace=stack_trace,
-            user_agent=user_agent,
-        )
+        record = {
+            "timestamp": timestamp,
+            "endpoint": endpoint,
+            "method": method,
+            "error_type": error_type,
+            "error_message": error_message,
+            "error_hash": error_hash,
+            "stack_trace": stack_trace,
+            "user_agent": user_agent,
+        }
+        if self.error_coalescer and self.error_coalescer.running:
+            await self.error_coalescer.add(record)
+            return
+        await self._write_error(record)
+
+    async def _write_error(self, record: Dict[str, Any]) -> None:
+        """Hand an error record to the ingest queue or storage."""
+        if self.ingest_queue and self.ingest_queue.running:
+            await self.ingest_queue.put("error", record)
+            return
+        await self.storage.store_error(**record)
 
     async def _cleanup_loop(self):
         """Background task that periodically removes old metrics data."""
@@ -1,22 +1,31 @@
 """Prometheus export format."""
 
-from typing import Any
+from typing import Any, Optional
 import datetime
 
 
 class PrometheusExporter:
-    """Export metrics in Prometheus format."""
+    """Export metrics in Prometheus format.
 
-    def __init__(self, storage: Any) -> None:
+    When a rollup aggregator is given, HTTP metrics are computed from its
+    pre-aggregated buckets over the requested window instead of from raw
+    request rows.
+    """
+
+    def __init__(self, storage: Any, rollups: Optional[Any] = None) -> None:
         self.storage = storage
+        self.rollups = rollups
 
     async def export_http_metrics(self, hours: int = 1) -> str:
         """Export HTTP metrics in Prometheus format."""
         now = datetime.datetime.now(datetime.timezone.utc)
-        _ = now - datetime.timedelta(hours=hours)
+        from_time = now - datetime.timedelta(hours=hours)
 
         # Get endpoint stats
-        stats = await self.storage.get_endpoint_stats()
+        if self.rollups:
+            stats = await self.rollups.endpoint_stats(from_time=from_time, to_time=now)
+        else:
+            stats = await self.storage.get_endpoint_stats()
 
         lines = []
 
@@ -0,0 +1,201 @@
+"""Write-behind ingest queue and error coalescing between the request path and storage."""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """Bounded in-process queue drained by a background flusher task.
+
+    The middleware enqueues events and returns immediately; a single flusher
+    task writes them to the storage backend, so request latency no longer
+    depends on how fast the backend is.
+
+    When the queue is full, ``policy="drop"`` discards the new event (and
+    counts it in ``dropped``) while ``policy="block"`` makes the caller wait
+    for free space.
+    """
+
+    POLICIES = ("drop", "block")
+
+    def __init__(
+        self,
+        storage: Any,
+        maxsize: int = 10_000,
+        policy: str = "drop",
+        batch_size: int = 500,
+    ) -> None:
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown ingest queue policy: {policy}")
+        if maxsize < 1:
+            raise ValueError("Ingest queue size must be at least 1")
+
+        self.storage = storage
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        # Created in start() so the queue binds to the running event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background flusher is accepting events."""
+        return self._task is not None
+
+    def start(self) -> None:
+        """Start the background flusher task."""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self, timeout: Optional[float] = 30.0) -> None:
+        """Drain all queued events to storage, then stop the flusher."""
+        if self._task is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Ingest queue drain timed out with %d events pending", self._queue.qsize())
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def put(self, kind: str, record: Dict[str, Any]) -> bool:
+        """Enqueue an event. Returns False if it was dropped."""
+        if self.policy == "block":
+            await self._queue.put((kind, record))
+            return True
+
+        try:
+            self._queue.put_nowait((kind, record))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and counters for observability."""
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "capacity": self.maxsize,
+            "policy": self.policy,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def _flush_loop(self) -> None:
+        """Wait for events and write them out in batches."""
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            try:
+                await self._write(batch)
+                self.written += len(batch)
+            except Exception as e:  # pylint: disable=broad-except
+                self.failed += len(batch)
+                logger.error("Failed to write %d metric events: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Write a batch of events to storage using the bulk write API."""
+        http = [record for kind, record in batch if kind == "http"]
+        custom = [record for kind, record in batch if kind == "custom"]
+
+        if http:
+            await self.storage.store_http_metrics_batch(http)
+        if custom:
+            await self.storage.store_custom_metrics_batch(custom)
+        for kind, record in batch:
+            if kind == "error":
+                await self.storage.store_error(**record)
+
+
+class ErrorCoalescer:
+    """Merge repeated errors in-process before they reach storage.
+
+    The first occurrence of an error hash is written straight away. Further
+    occurrences within the next ``window`` seconds only bump a counter, and
+    are written as a single ``store_error(count=n)`` call when the window
+    closes, so a burst of the same exception costs one extra write.
+    """
+
+    def __init__(
+        self, write: Callable[[Dict[str, Any]], Awaitable[None]], window: float = 1.0
+    ) -> None:
+        if window <= 0:
+            raise ValueError("Error coalescing window must be positive")
+
+        self.window = window
+        self.coalesced = 0
+        self._write = write
+        # error hash -> latest record, with the occurrences not yet written
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background flusher is running."""
+        return self._task is not None
+
+    def start(self) -> None:
+        """Start the background flusher task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out the remaining counts."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def add(self, record: Dict[str, Any]) -> None:
+        """Record one error occurrence."""
+        pending = self._pending.get(record["error_hash"])
+        if pending is not None:
+            pending.update(record, count=pending["count"] + 1)
+            self.coalesced += 1
+            return
+        self._pending[record["error_hash"]] = {**record, "count": 0}
+        await self._write(record)
+
+    async def flush(self) -> None:
+        """Write the coalesced counts and start new windows."""
+        pending, self._pending = self._pending, {}
+        for record in pending.values():
+            if record["count"]:
+                await self._write(record)
+
+    async def _flush_loop(self) -> None:
+        """Close the coalescing windows periodically."""
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await self.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Failed to write coalesced errors: %s", e)
@@ -6,7 +6,10 @@ import datetime
 import traceback
 from typing import Any, Callable
 from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
 class MetricsMiddleware(BaseHTTPMiddleware):
@@ -33,6 +36,8 @@ class MetricsMiddleware(BaseHTTPMiddleware):
             return await call_next(request)
 
         start_time = time.perf_counter()
+        # Routing rewrites root_path for mounted apps; remember the original
+        root_path = request.scope.get("root_path", "")
 
         # Extract or generate a request ID for trace correlation
         request_id = request.headers.get("x-request-id") or request.headers.get("x-trace-id")
@@ -52,7 +57,7 @@ class MetricsMiddleware(BaseHTTPMiddleware):
             # pylint: disable=protected-access
             await self.metrics._store_http_metric(
                 timestamp=datetime.datetime.now(datetime.timezone.utc),
-                endpoint=request.url.path,
+                endpoint=_endpoint_label(self.metrics, request.scope, root_path),
                 method=request.method,
                 status_code=status_code,
                 latency_ms=latency_ms,
@@ -75,7 +80,7 @@ class MetricsMiddleware(BaseHTTPMiddleware):
                 # pylint: disable=protected-access
                 await self.metrics._store_error(
                     timestamp=datetime.datetime.now(datetime.timezone.utc),
-                    endpoint=request.url.path,
+                    endpoint=_endpoint_label(self.metrics, request.scope, root_path),
                     method=request.method,
                     error_type=type(e).__name__,
                     error_message=str(e),
@@ -85,7 +90,7 @@ class MetricsMiddleware(BaseHTTPMiddleware):
             # pylint: disable=protected-access
             await self.metrics._store_http_metric(
                 timestamp=datetime.datetime.now(datetime.timezone.utc),
-                endpoint=request.url.path,
+                endpoint=_endpoint_label(self.metrics, request.scope, root_path),
                 method=request.method,
                 status_code=500,
                 latency_ms=latency_ms,
@@ -99,18 +104,125 @@ class MetricsMiddleware(BaseHTTPMiddleware):
             # Return 500 response when not re-raising
             # Preventing the application to crash, returning the error as API response
             # use environment variable in STG => DEBUG=true to activate
-            from fastapi.responses import JSONResponse
-
-            is_debug = os.getenv("DEBUG", "false").lower() == "true"
-            resp = JSONResponse(
-                status_code=500,
-                content={
-                    "detail": "Internal Server Error",
-                    "error": str(e) if is_debug else None,
-                    "type": type(e).__name__ if is_debug else None,
-                    "traceback": traceback.format_exc() if is_debug else None,
-                },
-            )
+            resp = _error_response(e)
             if request_id:
                 resp.headers["x-request-id"] = request_id
             return resp
+
+
+class ASGIMetricsMiddleware:
+    """Pure ASGI middleware to track HTTP request metrics.
+
+    Behaves like ``MetricsMiddleware`` but wraps ``send`` instead of going
+    through ``BaseHTTPMiddleware``, so there is no per-request task and
+    stream wrapping, and streaming responses and background tasks run
+    exactly as they would without the middleware.
+
+    ``latency_ms`` is the time until the first response body message is
+    sent, which matches what ``MetricsMiddleware`` measures for regular
+    responses without counting the time spent streaming the body.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        metrics_instance: Any,
+        track_errors: bool = False,
+        exclude_paths: list = None,
+    ) -> None:
+        self.app = app
+        self.metrics = metrics_instance
+        self.error_reporting = track_errors
+        self.exclude_paths = set(exclude_paths or [])
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        root_path = scope.get("root_path", "")
+        headers = Headers(scope=scope)
+        request_id = headers.get("x-request-id") or headers.get("x-trace-id")
+        labels = {"request_id": request_id} if request_id else None
+
+        status_code = 500
+        response_started = False
+        first_byte_time = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_started, first_byte_time
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                # Echo request ID back in response headers for caller correlation
+                if request_id:
+                    MutableHeaders(scope=message)["x-request-id"] = request_id
+            elif message["type"] == "http.response.body" and first_byte_time is None:
+                first_byte_time = time.perf_counter()
+            await send(message)
+
+        self.metrics._active_requests += 1  # pylint: disable=protected-access
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:  # pylint: disable=broad-except
+            latency_ms = ((first_byte_time or time.perf_counter()) - start_time) * 1000
+            if self.error_reporting:
+                # pylint: disable=protected-access
+                await self.metrics._store_error(
+                    timestamp=datetime.datetime.now(datetime.timezone.utc),
+                    endpoint=_endpoint_label(self.metrics, scope, root_path),
+                    method=scope["method"],
+                    error_type=type(e).__name__,
+                    error_message=str(e),
+                    stack_trace=traceback.format_exc(),
+                    user_agent=headers.get("user-agent"),
+                )
+            # pylint: disable=protected-access
+            await self.metrics._store_http_metric(
+                timestamp=datetime.datetime.now(datetime.timezone.utc),
+                endpoint=_endpoint_label(self.metrics, scope, root_path),
+                method=scope["method"],
+                status_code=500,
+                latency_ms=latency_ms,
+                labels=labels,
+            )
+            # A response that has already started cannot be replaced
+            if self.error_reporting or response_started:
+                raise
+            await _error_response(e)(scope, receive, send_wrapper)
+            return
+        finally:
+            self.metrics._active_requests -= 1  # pylint: disable=protected-access
+
+        latency_ms = ((first_byte_time or time.perf_counter()) - start_time) * 1000
+        # pylint: disable=protected-access
+        await self.metrics._store_http_metric(
+            timestamp=datetime.datetime.now(datetime.timezone.utc),
+            endpoint=_endpoint_label(self.metrics, scope, root_path),
+            method=scope["method"],
+            status_code=status_code,
+            latency_ms=latency_ms,
+            labels=labels,
+        )
+
+
+def _endpoint_label(metrics: Any, scope: Scope, root_path: str) -> str:
+    """Endpoint to record: the route template, or the raw path if disabled."""
+    if metrics.endpoint_labeler is None:
+        return scope["path"]
+    return metrics.endpoint_labeler.label(scope, root_path)
+
+
+def _error_response(exc: Exception) -> JSONResponse:
+    """Build the 500 response returned when errors are not re-raised."""
+    is_debug = os.getenv("DEBUG", "false").lower() == "true"
+    return JSONResponse(
+        status_code=500,
+        content={
+            "detail": "Internal Server Error",
+            "error": str(exc) if is_debug else None,
+            "type": type(exc).__name__ if is_debug else None,
+            "traceback": traceback.format_exc() if is_debug else None,
+        },
+    )
@@ -0,0 +1,88 @@
+"""Endpoint labelling by route template to keep metric cardinality bounded."""
+
+from collections import OrderedDict
+from typing import Any, Optional, Set, Tuple
+from starlette.routing import Match
+from starlette.types import Scope
+
+
+class EndpointLabeler:
+    """Resolve request paths to route templates such as ``/users/{id}``.
+
+    Recording the raw path turns every ``/users/1``, ``/users/2``... into a
+    separate endpoint. Instead, the template of the matched route is used:
+    it is read from the scope after routing when available, otherwise it is
+    looked up by matching the router's routes and cached per path.
+
+    Templates of declared routes are bounded by the app itself. Paths that
+    match no route (404s, scanners) keep their raw value, but only up to
+    ``max_endpoints`` distinct values; the rest collapse into ``OTHER``.
+    """
+
+    OTHER = "__other__"
+
+    def __init__(self, router: Any, max_endpoints: int = 1000, cache_size: int = 10_000):
+        self.router = router
+        self.max_endpoints = max_endpoints
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._unmatched: Set[str] = set()
+
+    def label(self, scope: Scope, root_path: str = "") -> str:
+        """Return the endpoint label for a request that went through routing.
+
+        ``root_path`` is the scope's root path before routing, used to
+        restore the prefix of routes inside mounted sub-applications.
+        """
+        route = scope.get("route")
+        if route is not None and hasattr(route, "path"):
+            prefix = scope.get("root_path", "")[len(root_path) :]
+            return prefix + route.path
+
+        key = (scope.get("method", ""), scope["path"])
+        template = self._cache.get(key)
+        if template is not None:
+            self._cache.move_to_end(key)
+            return template
+
+        template = self._match(self.router.routes, {**scope, "root_path": root_path})
+        if template is None:
+            template = self._cap(scope["path"])
+
+        self._cache[key] = template
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return template
+
+    def _match(self, routes: Any, scope: Scope) -> Optional[str]:
+        """Find the template of the route matching ``scope``, if any."""
+        partial = None
+        for route in routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.NONE:
+                continue
+
+            sub_routes = getattr(route, "routes", None)
+            if sub_routes:
+                # Mounted application: resolve inside it and keep the prefix
+                inner = self._match(sub_routes, {**scope, **child_scope})
+                if inner is None:
+                    continue
+                template = route.path + inner
+            else:
+                template = route.path
+
+            if match == Match.FULL:
+                return template
+            # Path matched but method did not (405); keep looking for a full match
+            partial = partial or template
+        return partial
+
+    def _cap(self, path: str) -> str:
+        """Admit an unmatched path as a label until the cap is reached."""
+        if path in self._unmatched:
+            return path
+        if len(self._unmatched) < self.max_endpoints:
+            self._unmatched.add(path)
+            return path
+        return self.OTHER
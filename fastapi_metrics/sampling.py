@@ -0,0 +1,95 @@
+"""Sampling of HTTP metric capture under load."""
+
+import random
+import time
+from typing import Any, Dict, Optional
+
+
+class Sampler:
+    """Decide which HTTP requests are recorded, and with which weight.
+
+    A request is kept with probability ``rate``, or the rate configured for
+    its endpoint in ``endpoint_rates``. Errors (status >= 400, when
+    ``keep_errors``) and requests slower than ``slow_threshold_ms`` are
+    always kept.
+
+    With ``target_events_per_sec`` the probability is scaled down further
+    so that roughly that many sampled events are recorded per second; the
+    scale is re-evaluated every ``window`` seconds from the traffic seen in
+    the previous window. Always-kept requests do not count against the
+    target.
+
+    Each kept request carries a weight of ``1 / probability``, so sums of
+    weights are unbiased estimates of the real request counts.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        endpoint_rates: Optional[Dict[str, float]] = None,
+        keep_errors: bool = True,
+        slow_threshold_ms: Optional[float] = None,
+        target_events_per_sec: Optional[float] = None,
+        window: float = 1.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        endpoint_rates = dict(endpoint_rates or {})
+        for value in (rate, *endpoint_rates.values()):
+            if not 0 < value <= 1:
+                raise ValueError(f"Sample rate must be in (0, 1], got {value}")
+        if target_events_per_sec is not None and target_events_per_sec <= 0:
+            raise ValueError("Target events per second must be positive")
+
+        self.rate = rate
+        self.endpoint_rates = endpoint_rates
+        self.keep_errors = keep_errors
+        self.slow_threshold_ms = slow_threshold_ms
+        self.target_events_per_sec = target_events_per_sec
+        self.window = window
+        self.seen = 0
+        self.kept = 0
+        self._random = random.Random(seed).random
+        self._scale = 1.0
+        self._window_start = time.monotonic()
+        # Expected number of kept events in the current window at scale 1
+        self._demand = 0.0
+
+    def weight(self, endpoint: str, status_code: int, latency_ms: float) -> float:
+        """Weight to record a request with, or 0.0 to skip it."""
+        self.seen += 1
+        if (self.keep_errors and status_code >= 400) or (
+            self.slow_threshold_ms is not None and latency_ms >= self.slow_threshold_ms
+        ):
+            self.kept += 1
+            return 1.0
+
+        probability = self.endpoint_rates.get(endpoint, self.rate)
+        if self.target_events_per_sec is not None:
+            self._demand += probability
+            self._adapt()
+            probability *= self._scale
+
+        if probability < 1.0 and self._random() >= probability:
+            return 0.0
+        self.kept += 1
+        return 1.0 / probability
+
+    def _adapt(self) -> None:
+        """Recompute the adaptive scale once per window."""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        demand_per_sec = self._demand / elapsed
+        self._scale = min(1.0, self.target_events_per_sec / demand_per_sec)
+        self._window_start = now
+        self._demand = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Sampling counters for the /metrics snapshot."""
+        return {
+            "seen": self.seen,
+            "kept": self.kept,
+            "rate": self.rate,
+            "adaptive_scale": round(self._scale, 4),
+        }
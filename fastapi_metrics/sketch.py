@@ -0,0 +1,151 @@
+"""Mergeable quantile sketch for latency percentiles."""
+
+import math
+from typing import Any, Dict, Iterable, Optional
+
+# Values at or below this are counted in the zero bucket
+MIN_INDEXABLE_VALUE = 1e-6
+
+
+class DDSketch:
+    """Quantile sketch with bounded relative error (DDSketch).
+
+    Values are counted in logarithmically sized bins, so any quantile is
+    estimated within ``relative_accuracy`` of the true value while memory
+    only depends on the range of values, not on how many were added.
+    Sketches with the same accuracy merge by adding bin counts, which makes
+    them suitable for combining time buckets and instances.
+
+    Weights may be fractional so that sampled events can stand in for the
+    events that were not recorded.
+    """
+
+    __slots__ = (
+        "relative_accuracy",
+        "max_bins",
+        "gamma",
+        "_log_gamma",
+        "bins",
+        "zero_count",
+        "count",
+        "sum",
+        "min",
+        "max",
+    )
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, float] = {}
+        self.zero_count = 0.0
+        self.count = 0.0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], **kwargs: Any) -> "DDSketch":
+        """Build a sketch from an iterable of values."""
+        sketch = cls(**kwargs)
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def index(self, value: float) -> Optional[int]:
+        """Key of the bin ``value`` is counted in, or None for the zero bucket."""
+        if value <= MIN_INDEXABLE_VALUE:
+            return None
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def value(self, key: int) -> float:
+        """Representative value of bin ``key``: its midpoint in relative terms."""
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        """Record a value, optionally counting it ``weight`` times."""
+        key = self.index(value)
+        if key is None:
+            self.zero_count += weight
+        else:
+            self.bins[key] = self.bins.get(key, 0.0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "DDSketch") -> None:
+        """Add the contents of another sketch into this one."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0.0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the q-quantile (0 <= q <= 1), or None if empty."""
+        if self.count <= 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return max(self.min, 0.0)
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # Midpoint of the bin in relative terms
+                return min(max(self.value(key), self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact JSON-serialisable form."""
+        return {
+            "a": self.relative_accuracy,
+            "b": {str(k): c for k, c in self.bins.items()},
+            "z": self.zero_count,
+            "n": self.count,
+            "s": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DDSketch":
+        """Rebuild a sketch from ``to_dict`` output."""
+        sketch = cls(relative_accuracy=data.get("a", 0.01))
+        sketch.bins = {int(k): c for k, c in data.get("b", {}).items()}
+        sketch.zero_count = data.get("z", 0.0)
+        sketch.count = data.get("n", 0.0)
+        sketch.sum = data.get("s", 0.0)
+        if data.get("min") is not None:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+    def _collapse(self) -> None:
+        """Fold the lowest bins together to respect ``max_bins``.
+
+        Accuracy is only lost for the smallest values, which matter least
+        for tail latency.
+        """
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        folded = sum(self.bins.pop(k) for k in keys[:excess])
+        target = keys[excess]
+        self.bins[target] += folded
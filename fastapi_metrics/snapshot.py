@@ -0,0 +1,194 @@
+"""Running aggregates that serve the /metrics snapshot without scanning storage."""
+
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from .sketch import DDSketch
+
+MINUTE = 60
+HOUR = 3600
+
+
+class SnapshotBucket:
+    """Request counts, latency sketch and custom metric totals of a time slice."""
+
+    __slots__ = ("requests", "errors", "status_codes", "endpoints", "latency", "custom")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.status_codes: Dict[int, int] = {}
+        self.endpoints: Dict[Tuple[str, str], int] = {}
+        self.latency = DDSketch()
+        # name -> [count, sum, min, max]
+        self.custom: Dict[str, List[float]] = {}
+
+    def add_http(self, endpoint: str, method: str, status_code: int, latency_ms: float) -> None:
+        """Count one HTTP request."""
+        self.requests += 1
+        if status_code >= 400:
+            self.errors += 1
+        self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+        key = (endpoint, method)
+        self.endpoints[key] = self.endpoints.get(key, 0) + 1
+        self.latency.add(latency_ms)
+
+    def add_custom(self, name: str, value: float) -> None:
+        """Count one custom metric value."""
+        totals = self.custom.get(name)
+        if totals is None:
+            self.custom[name] = [1, value, value, value]
+            return
+        totals[0] += 1
+        totals[1] += value
+        totals[2] = min(totals[2], value)
+        totals[3] = max(totals[3], value)
+
+    def merge(self, other: "SnapshotBucket") -> None:
+        """Fold another bucket into this one."""
+        self.requests += other.requests
+        self.errors += other.errors
+        for code, count in other.status_codes.items():
+            self.status_codes[code] = self.status_codes.get(code, 0) + count
+        for key, count in other.endpoints.items():
+            self.endpoints[key] = self.endpoints.get(key, 0) + count
+        self.latency.merge(other.latency)
+        for name, (count, total, low, high) in other.custom.items():
+            totals = self.custom.get(name)
+            if totals is None:
+                self.custom[name] = [count, total, low, high]
+                continue
+            totals[0] += count
+            totals[1] += total
+            totals[2] = min(totals[2], low)
+            totals[3] = max(totals[3], high)
+
+    def to_metrics(self) -> Dict[str, Any]:
+        """``http`` and ``custom`` sections of the /metrics response."""
+        requests_per_endpoint: Dict[str, Dict[str, int]] = {}
+        for (endpoint, method), count in self.endpoints.items():
+            requests_per_endpoint.setdefault(endpoint, {})[method] = count
+
+        latency = self.latency
+        http = {
+            "total_requests": self.requests,
+            "requests_per_endpoint": requests_per_endpoint,
+            "status_codes": dict(self.status_codes),
+            "latency": {
+                "p50": round(latency.quantile(0.50) or 0, 2),
+                "p95": round(latency.quantile(0.95) or 0, 2),
+                "p99": round(latency.quantile(0.99) or 0, 2),
+                "avg": round(latency.sum / latency.count, 2) if latency.count else 0,
+            },
+            "error_rate": round(self.errors / self.requests, 3) if self.requests > 0 else 0,
+        }
+        custom = {
+            name: {
+                "count": count,
+                "min": low,
+                "max": high,
+                "avg": round(total / count, 2),
+                "total": total,
+            }
+            for name, (count, total, low, high) in self.custom.items()
+        }
+        return {"http": http, "custom": custom}
+
+
+class LiveSnapshot:
+    """Sliding-window aggregates of HTTP requests and custom metrics.
+
+    Events are counted into one-minute buckets as they are recorded. Once a
+    clock hour is over its minutes are merged into a sealed hour bucket, and
+    minute buckets are only kept for the current and previous hour. A window
+    query therefore merges at most ~120 minute buckets plus one bucket per
+    older hour, whatever the traffic volume.
+
+    Windows reaching further back than the retained minutes are resolved to
+    the hour at their oldest edge: an hour bucket is included when at least
+    half of it lies inside the window.
+    """
+
+    def __init__(self, window_hours: int = 24) -> None:
+        self.window_hours = window_hours
+        self._minutes: Dict[float, SnapshotBucket] = {}
+        self._hours: Dict[float, SnapshotBucket] = {}
+        now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+        # Hours before this boundary have been sealed into hour buckets
+        self._sealed_until = now - now % HOUR
+
+    def add_http(
+        self,
+        timestamp: datetime.datetime,
+        endpoint: str,
+        method: str,
+        status_code: int,
+        latency_ms: float,
+    ) -> None:
+        """Count one HTTP request."""
+        for bucket in self._buckets(timestamp.timestamp()):
+            bucket.add_http(endpoint, method, status_code, latency_ms)
+
+    def add_custom(self, timestamp: datetime.datetime, name: str, value: float) -> None:
+        """Count one custom metric value."""
+        for bucket in self._buckets(timestamp.timestamp()):
+            bucket.add_custom(name, value)
+
+    def _buckets(self, ts: float) -> List[SnapshotBucket]:
+        """Buckets an event at ``ts`` is counted in."""
+        if ts >= self._sealed_until + HOUR:
+            self._roll(ts)
+
+        buckets = []
+        minute = ts - ts % MINUTE
+        if minute >= self._sealed_until - HOUR:
+            bucket = self._minutes.get(minute)
+            if bucket is None:
+                bucket = self._minutes[minute] = SnapshotBucket()
+            buckets.append(bucket)
+        if minute < self._sealed_until:
+            # Late event for an hour that is already sealed
+            hour = ts - ts % HOUR
+            if hour >= self._sealed_until - self.window_hours * HOUR:
+                bucket = self._hours.get(hour)
+                if bucket is None:
+                    bucket = self._hours[hour] = SnapshotBucket()
+                buckets.append(bucket)
+        return buckets
+
+    def _roll(self, now: float) -> None:
+        """Seal finished hours and drop buckets that left the window."""
+        current_hour = now - now % HOUR
+        if current_hour <= self._sealed_until:
+            return
+
+        for minute, bucket in self._minutes.items():
+            if self._sealed_until <= minute < current_hour:
+                hour = minute - minute % HOUR
+                sealed = self._hours.get(hour)
+                if sealed is None:
+                    sealed = self._hours[hour] = SnapshotBucket()
+                sealed.merge(bucket)
+        self._sealed_until = current_hour
+
+        oldest_minute = current_hour - HOUR
+        self._minutes = {k: v for k, v in self._minutes.items() if k >= oldest_minute}
+        oldest_hour = current_hour - self.window_hours * HOUR
+        self._hours = {k: v for k, v in self._hours.items() if k >= oldest_hour}
+
+    def window(
+        self, from_time: datetime.datetime, to_time: Optional[datetime.datetime] = None
+    ) -> SnapshotBucket:
+        """Merged aggregates of the buckets starting within ``[from_time, to_time]``."""
+        to_ts = (to_time or datetime.datetime.now(datetime.timezone.utc)).timestamp()
+        from_ts = from_time.timestamp()
+        self._roll(to_ts)
+
+        merged = SnapshotBucket()
+        minutes_start = self._sealed_until - HOUR
+        for hour, bucket in self._hours.items():
+            if hour < minutes_start and hour + HOUR / 2 >= from_ts:
+                merged.merge(bucket)
+        for minute, bucket in self._minutes.items():
+            if minute >= from_ts and minute <= to_ts:
+                merged.merge(bucket)
+        return merged
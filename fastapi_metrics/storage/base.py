@@ -1,9 +1,85 @@
 """Abstract base class for metrics storage backends."""
 
+import base64
+import binascii
+import json
+import math
+import re
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 
+# Seconds per unit of a "<n><unit>" group_by bucket, and named buckets
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+BUCKET_ALIASES = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+def bucket_seconds(group_by: str) -> int:
+    """Width in seconds of a ``group_by`` time bucket.
+
+    Accepts ``"<n><unit>"`` with unit ``s``, ``m``, ``h`` or ``d`` (``"10s"``,
+    ``"5m"``, ``"1d"``) and the names ``"minute"``, ``"hour"`` and ``"day"``.
+    Buckets are aligned to the Unix epoch, so days start at UTC midnight.
+    """
+    if group_by in BUCKET_ALIASES:
+        return BUCKET_ALIASES[group_by]
+    match = re.fullmatch(r"(\d+)([smhd])", group_by)
+    if not match or int(match.group(1)) < 1:
+        raise ValueError(
+            f"Invalid group_by {group_by!r}: use a bucket width such as '10s', '5m', '1h' or '1d'"
+        )
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+
+def bucket_starts(
+    from_ts: float, to_ts: float, width: int, limit: Optional[int] = None, offset: int = 0
+) -> List[int]:
+    """Starts of the ``width``-second buckets overlapping ``[from_ts, to_ts]``.
+
+    Used to fill gaps in a bucketed series. ``limit`` and ``offset`` select
+    one page of buckets, so a page can be queried without reading the rest
+    of the range.
+    """
+    first = math.floor(from_ts / width) * width + offset * width
+    last = math.floor(to_ts / width) * width
+    if limit is not None:
+        last = min(last, first + (limit - 1) * width)
+    return list(range(first, last + 1, width))
+
+
+class Page(list):
+    """One page of query results.
+
+    ``next_cursor`` continues after the last row, or is None on the last
+    page.
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]] = (), next_cursor: Optional[str] = None):
+        super().__init__(rows)
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(timestamp: Any, key: Any) -> str:
+    """Opaque cursor for the row at ``(timestamp, key)``.
+
+    ``timestamp`` is the row's sort key as the backend stores it and ``key``
+    breaks ties between rows with the same timestamp.
+    """
+    raw = json.dumps([timestamp, key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """``(timestamp, key)`` of a cursor made by ``encode_cursor``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, key = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+    if not isinstance(timestamp, (int, float)):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return timestamp, key
+
 
 class StorageBackend(ABC):
     """Abstract base class for metrics storage backends."""
@@ -18,6 +94,13 @@ class StorageBackend(ABC):
         """Close storage connections and cleanup."""
         return 1
 
+    async def flush(self) -> None:
+        """Make buffered writes durable.
+
+        Called on shutdown before ``close()``. Backends that write through
+        have nothing to flush.
+        """
+
     @abstractmethod
     async def store_http_metric(
         self,
@@ -27,8 +110,13 @@ class StorageBackend(ABC):
         status_code: int,
         latency_ms: float,
         labels: Optional[Dict[str, Any]] = None,
+        weight: float = 1.0,
     ) -> None:
-        """Store HTTP request metric."""
+        """Store HTTP request metric.
+
+        ``weight`` is the number of requests the row stands for when HTTP
+        metrics are sampled (1 / sample rate).
+        """
         return 1
 
     @abstractmethod
@@ -42,8 +130,14 @@ class StorageBackend(ABC):
         error_hash: str,
         stack_trace: str,
         user_agent: Optional[str] = None,
+        count: int = 1,
     ) -> None:
-        """Store error details."""
+        """Store error details, deduplicated by ``error_hash``.
+
+        ``count`` is the number of occurrences the call stands for when
+        repeated errors were coalesced before reaching storage. Backends
+        record it in a single atomic operation.
+        """
         return 1
 
     @abstractmethod
@@ -57,6 +151,45 @@ class StorageBackend(ABC):
         """Store custom business metric."""
         return 1
 
+    async def store_http_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many HTTP request metrics in one operation.
+
+        Each item holds the keyword arguments of ``store_http_metric``.
+        Backends override this with a native bulk write; the default
+        falls back to one ``store_http_metric`` call per item.
+        """
+        for metric in metrics:
+            await self.store_http_metric(**metric)
+
+    async def store_custom_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many custom metrics in one operation.
+
+        Each item holds the keyword arguments of ``store_custom_metric``.
+        """
+        for metric in metrics:
+            await self.store_custom_metric(**metric)
+
+    async def store_rollups(self, rollups: List[Dict[str, Any]]) -> None:
+        """Append pre-aggregated HTTP rollup rows.
+
+        Each row has ``resolution`` (seconds), ``bucket`` (UTC datetime of
+        the bucket start), ``endpoint``, ``method``, ``status_class``,
+        ``count``, ``sum``, ``min``, ``max`` and a serialisable ``sketch``.
+        Rows are append-only; rows sharing a key are merged when read.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support rollups")
+
+    async def query_rollups(
+        self,
+        resolution: int,
+        from_time: datetime,
+        to_time: datetime,
+        endpoint: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Query rollup rows of one resolution whose bucket starts within range."""
+        raise NotImplementedError(f"{type(self).__name__} does not support rollups")
+
     @abstractmethod
     async def query_http_metrics(
         self,
@@ -67,8 +200,21 @@ class StorageBackend(ABC):
         group_by: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query HTTP metrics within time range."""
+        """Query HTTP metrics within time range.
+
+        ``group_by`` aggregates rows into time buckets of the width parsed
+        by ``bucket_seconds``. With ``fill_gaps``, buckets without rows are
+        returned with a zero count, and ``limit``/``offset`` page through
+        buckets.
+
+        Ungrouped rows are returned as a ``Page``. Passing its
+        ``next_cursor`` as ``cursor`` continues after its last row by
+        seeking on (timestamp, row key), so every page costs the same
+        however deep it is; ``offset`` is then ignored.
+        """
         return 1
 
     @abstractmethod
@@ -87,8 +233,14 @@ class StorageBackend(ABC):
         group_by: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query custom metrics within time range."""
+        """Query custom metrics within time range.
+
+        ``group_by``, ``fill_gaps`` and ``cursor`` work as in
+        ``query_http_metrics``; buckets are per metric name.
+        """
         return 1
 
     @abstractmethod
@@ -2,7 +2,9 @@
 
 import time
 import json
-from collections import defaultdict
+import uuid
+import asyncio
+import datetime
 
 try:
     import aioboto3
@@ -14,7 +16,16 @@ try:
 except ImportError:
     asyncpg = None
 
-from .base import StorageBackend
+from .base import (
+    Page,
+    StorageBackend,
+    bucket_seconds,
+    bucket_starts,
+    decode_cursor,
+    encode_cursor,
+)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 
 class PostgreSQLStorage(StorageBackend):
@@ -42,10 +53,16 @@ class PostgreSQLStorage(StorageBackend):
                     method TEXT NOT NULL,
                     status_code INTEGER NOT NULL,
                     latency_ms REAL NOT NULL,
-                    labels JSONB
+                    labels JSONB,
+                    weight REAL NOT NULL DEFAULT 1.0
                 )
             """
             )
+            await conn.execute(
+                """
+                ALTER TABLE http_metrics ADD COLUMN IF NOT EXISTS weight REAL NOT NULL DEFAULT 1.0
+            """
+            )
             await conn.execute(
                 """
                 CREATE INDEX IF NOT EXISTS idx_http_timestamp ON http_metrics(timestamp)
@@ -56,6 +73,12 @@ class PostgreSQLStorage(StorageBackend):
                 CREATE INDEX IF NOT EXISTS idx_http_endpoint ON http_metrics(endpoint, method)
             """
             )
+            # Keyset pagination seeks on (timestamp, id)
+            await conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_http_timestamp_id ON http_metrics(timestamp, id)
+            """
+            )
 
             # Errors table
             await conn.execute(
@@ -105,19 +128,48 @@ class PostgreSQLStorage(StorageBackend):
                 CREATE INDEX IF NOT EXISTS idx_custom_name ON custom_metrics(name)
             """
             )
+            await conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_custom_timestamp_id ON custom_metrics(timestamp, id)
+            """
+            )
+
+            # Pre-aggregated HTTP rollups (append-only, merged on read)
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS http_rollups (
+                    resolution INTEGER NOT NULL,
+                    bucket TIMESTAMPTZ NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    status_class SMALLINT NOT NULL,
+                    count BIGINT NOT NULL,
+                    sum DOUBLE PRECISION NOT NULL,
+                    min DOUBLE PRECISION NOT NULL,
+                    max DOUBLE PRECISION NOT NULL,
+                    sketch JSONB NOT NULL
+                )
+            """
+            )
+            await conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_rollup_bucket ON http_rollups(resolution, bucket)
+            """
+            )
 
     async def close(self):
         if self.pool:
             await self.pool.close()
 
     async def store_http_metric(
-        self, timestamp, endpoint, method, status_code, latency_ms, labels=None
+        self, timestamp, endpoint, method, status_code, latency_ms, labels=None, weight=1.0
     ):
         async with self.pool.acquire() as conn:
             await conn.execute(
                 """
-                INSERT INTO http_metrics (timestamp, endpoint, method, status_code, latency_ms, labels)
-                VALUES ($1, $2, $3, $4, $5, $6)
+                INSERT INTO http_metrics
+                (timestamp, endpoint, method, status_code, latency_ms, labels, weight)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
             """,
                 timestamp,
                 endpoint,
@@ -125,6 +177,7 @@ class PostgreSQLStorage(StorageBackend):
                 status_code,
                 latency_ms,
                 json.dumps(labels) if labels else None,
+                weight,
             )
 
     async def store_error(
@@ -137,17 +190,18 @@ class PostgreSQLStorage(StorageBackend):
         error_hash,
         stack_trace,
         user_agent=None,
+        count=1,
     ):
         async with self.pool.acquire() as conn:
             await conn.execute(
                 """
                 INSERT INTO errors (
                     timestamp, endpoint, method, error_type, error_message,
-                    error_hash, stack_trace, user_agent, first_seen, last_seen
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                    error_hash, stack_trace, user_agent, first_seen, last_seen, count
+                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
                 ON CONFLICT (error_hash) DO UPDATE SET
-                    count = errors.count + 1,
-                    last_seen = $10
+                    count = errors.count + EXCLUDED.count,
+                    last_seen = GREATEST(errors.last_seen, EXCLUDED.last_seen)
             """,
                 timestamp,
                 endpoint,
@@ -159,6 +213,7 @@ class PostgreSQLStorage(StorageBackend):
                 user_agent,
                 timestamp,
                 timestamp,
+                count,
             )
 
     async def store_custom_metric(self, timestamp, name, value, labels=None):
@@ -174,11 +229,91 @@ class PostgreSQLStorage(StorageBackend):
                 json.dumps(labels) if labels else None,
             )
 
-    async def query_http_metrics(
-        self, from_time, to_time, endpoint=None, method=None, group_by=None
-    ):
-        query = "SELECT * FROM http_metrics WHERE timestamp BETWEEN $1 AND $2"
-        params = [from_time, to_time]
+    async def store_http_metrics_batch(self, metrics):
+        if not metrics:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                "http_metrics",
+                records=[
+                    (
+                        m["timestamp"],
+                        m["endpoint"],
+                        m["method"],
+                        m["status_code"],
+                        m["latency_ms"],
+                        json.dumps(m["labels"]) if m.get("labels") else None,
+                        m.get("weight", 1.0),
+                    )
+                    for m in metrics
+                ],
+                columns=[
+                    "timestamp",
+                    "endpoint",
+                    "method",
+                    "status_code",
+                    "latency_ms",
+                    "labels",
+                    "weight",
+                ],
+            )
+
+    async def store_custom_metrics_batch(self, metrics):
+        if not metrics:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                "custom_metrics",
+                records=[
+                    (
+                        m["timestamp"],
+                        m["name"],
+                        m["value"],
+                        json.dumps(m["labels"]) if m.get("labels") else None,
+                    )
+                    for m in metrics
+                ],
+                columns=["timestamp", "name", "value", "labels"],
+            )
+
+    async def store_rollups(self, rollups):
+        if not rollups:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                "http_rollups",
+                records=[
+                    (
+                        r["resolution"],
+                        r["bucket"],
+                        r["endpoint"],
+                        r["method"],
+                        r["status_class"],
+                        r["count"],
+                        r["sum"],
+                        r["min"],
+                        r["max"],
+                        json.dumps(r["sketch"]),
+                    )
+                    for r in rollups
+                ],
+                columns=[
+                    "resolution",
+                    "bucket",
+                    "endpoint",
+                    "method",
+                    "status_class",
+                    "count",
+                    "sum",
+                    "min",
+                    "max",
+                    "sketch",
+                ],
+            )
+
+    async def query_rollups(self, resolution, from_time, to_time, endpoint=None, method=None):
+        query = "SELECT * FROM http_rollups WHERE resolution = $1 AND bucket BETWEEN $2 AND $3"
+        params = [resolution, from_time, to_time]
 
         if endpoint:
             query += f" AND endpoint = ${len(params) + 1}"
@@ -189,27 +324,93 @@ class PostgreSQLStorage(StorageBackend):
 
         async with self.pool.acquire() as conn:
             rows = await conn.fetch(query, *params)
+            return [{**dict(row), "sketch": json.loads(row["sketch"])} for row in rows]
+
+    async def _page(self, table, conditions, params, limit, offset, cursor):
+        """Newest-first page of ``table``, seeking on (timestamp, id) after ``cursor``."""
+        if cursor:
+            after_us, after_id = decode_cursor(cursor)
+            after = EPOCH + datetime.timedelta(microseconds=after_us)
+            conditions += f" AND (timestamp, id) < (${len(params) + 1}, ${len(params) + 2})"
+            params = [*params, after, after_id]
+            offset = 0
+
+        # One extra row tells whether there is a next page
+        params = [*params, limit + 1, offset]
+        query = f"""
+            SELECT * FROM {table}
+            WHERE {conditions}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ${len(params) - 1} OFFSET ${len(params)}
+        """
+        async with self.pool.acquire() as conn:
+            rows = [dict(row) for row in await conn.fetch(query, *params)]
 
-            metrics = [dict(row) for row in rows]
+        if len(rows) <= limit:
+            return Page(rows)
+        last = rows[limit - 1]
+        after_us = (last["timestamp"] - EPOCH) // datetime.timedelta(microseconds=1)
+        return Page(rows[:limit], encode_cursor(after_us, last["id"]))
 
-            if group_by == "hour":
-                grouped = defaultdict(list)
-                for m in metrics:
-                    hour_key = m["timestamp"].replace(minute=0, second=0, microsecond=0)
-                    grouped[hour_key].append(m)
+    async def query_http_metrics(
+        self,
+        from_time,
+        to_time,
+        endpoint=None,
+        method=None,
+        group_by=None,
+        limit=100,
+        offset=0,
+        fill_gaps=False,
+        cursor=None,
+    ):
+        conditions = "timestamp BETWEEN $1 AND $2"
+        params = [from_time, to_time]
 
-                return [
-                    {
-                        "timestamp": str(k),
-                        "count": len(v),
-                        "avg_latency_ms": sum(x["latency_ms"] for x in v) / len(v),
-                        "min_latency_ms": min(x["latency_ms"] for x in v),
-                        "max_latency_ms": max(x["latency_ms"] for x in v),
-                    }
-                    for k, v in sorted(grouped.items())
-                ]
+        if endpoint:
+            conditions += f" AND endpoint = ${len(params) + 1}"
+            params.append(endpoint)
+        if method:
+            conditions += f" AND method = ${len(params) + 1}"
+            params.append(method)
 
-            return metrics
+        if not group_by:
+            return await self._page("http_metrics", conditions, params, limit, offset, cursor)
+
+        # Bucket with epoch arithmetic so any width aggregates in the database
+        width = bucket_seconds(group_by)
+        params.append(width)
+        query = f"""
+            SELECT
+                floor(extract(epoch FROM timestamp))::bigint / ${len(params)} * ${len(params)}
+                    AS bucket,
+                ROUND(SUM(weight)) AS count,
+                SUM(latency_ms * weight) / SUM(weight) AS avg_latency_ms,
+                MIN(latency_ms) AS min_latency_ms,
+                MAX(latency_ms) AS max_latency_ms
+            FROM http_metrics
+            WHERE {conditions}
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        async with self.pool.acquire() as conn:
+            rows = {row["bucket"]: row for row in await conn.fetch(query, *params)}
+
+        if fill_gaps:
+            starts = bucket_starts(from_time.timestamp(), to_time.timestamp(), width)
+            rows = {k: rows.get(k) for k in starts}
+
+        results = [
+            {
+                "timestamp": str(datetime.datetime.fromtimestamp(k, tz=datetime.timezone.utc)),
+                "count": int(row["count"]) if row else 0,
+                "avg_latency_ms": row["avg_latency_ms"] if row else None,
+                "min_latency_ms": row["min_latency_ms"] if row else None,
+                "max_latency_ms": row["max_latency_ms"] if row else None,
+            }
+            for k, row in rows.items()
+        ]
+        return results[offset : offset + limit]
 
     async def query_errors(self, from_time, to_time, endpoint=None):
         query = "SELECT * FROM errors WHERE timestamp BETWEEN $1 AND $2"
@@ -223,36 +424,61 @@ class PostgreSQLStorage(StorageBackend):
             rows = await conn.fetch(query, *params)
             return [dict(row) for row in rows]
 
-    async def query_custom_metrics(self, from_time, to_time, name=None, group_by=None):
-        query = "SELECT * FROM custom_metrics WHERE timestamp BETWEEN $1 AND $2"
+    async def query_custom_metrics(
+        self,
+        from_time,
+        to_time,
+        name=None,
+        group_by=None,
+        limit=100,
+        offset=0,
+        fill_gaps=False,
+        cursor=None,
+    ):
+        conditions = "timestamp BETWEEN $1 AND $2"
         params = [from_time, to_time]
 
         if name:
-            query += f" AND name = ${len(params) + 1}"
+            conditions += f" AND name = ${len(params) + 1}"
             params.append(name)
 
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch(query, *params)
-            metrics = [dict(row) for row in rows]
-
-            if group_by == "hour":
-                grouped = defaultdict(list)
-                for m in metrics:
-                    hour_key = m["timestamp"].replace(minute=0, second=0, microsecond=0)
-                    grouped[hour_key].append(m)
-
-                return [
-                    {
-                        "timestamp": str(k),
-                        "name": v[0]["name"],
-                        "count": len(v),
-                        "sum": sum(x["value"] for x in v),
-                        "avg": sum(x["value"] for x in v) / len(v),
-                    }
-                    for k, v in sorted(grouped.items())
-                ]
+        if not group_by:
+            return await self._page("custom_metrics", conditions, params, limit, offset, cursor)
 
-            return metrics
+        width = bucket_seconds(group_by)
+        params.append(width)
+        query = f"""
+            SELECT
+                floor(extract(epoch FROM timestamp))::bigint / ${len(params)} * ${len(params)}
+                    AS bucket,
+                name,
+                COUNT(*) AS count,
+                SUM(value) AS sum,
+                AVG(value) AS avg
+            FROM custom_metrics
+            WHERE {conditions}
+            GROUP BY bucket, name
+            ORDER BY bucket, name
+        """
+        async with self.pool.acquire() as conn:
+            rows = {(row["bucket"], row["name"]): row for row in await conn.fetch(query, *params)}
+
+        if fill_gaps:
+            starts = bucket_starts(from_time.timestamp(), to_time.timestamp(), width)
+            names = sorted({n for _, n in rows} or ([name] if name else []))
+            rows = {(k, n): rows.get((k, n)) for k in starts for n in names}
+
+        results = [
+            {
+                "timestamp": str(datetime.datetime.fromtimestamp(k, tz=datetime.timezone.utc)),
+                "name": n,
+                "count": row["count"] if row else 0,
+                "sum": row["sum"] if row else 0.0,
+                "avg": row["avg"] if row else None,
+            }
+            for (k, n), row in rows.items()
+        ]
+        return results[offset : offset + limit]
 
     async def get_endpoint_stats(self):
         async with self.pool.acquire() as conn:
@@ -261,11 +487,12 @@ class PostgreSQLStorage(StorageBackend):
                 SELECT 
                     endpoint,
                     method,
-                    COUNT(*) as count,
-                    AVG(latency_ms) as avg_latency_ms,
+                    ROUND(SUM(weight))::BIGINT as count,
+                    SUM(latency_ms * weight) / SUM(weight) as avg_latency_ms,
                     MIN(latency_ms) as min_latency_ms,
                     MAX(latency_ms) as max_latency_ms,
-                    SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END)::FLOAT / COUNT(*) as error_rate
+                    SUM(CASE WHEN status_code >= 400 THEN weight ELSE 0 END)
+                        / SUM(weight) as error_rate
                 FROM http_metrics
                 GROUP BY endpoint, method
             """
@@ -283,12 +510,19 @@ class PostgreSQLStorage(StorageBackend):
             result = await conn.execute("DELETE FROM errors WHERE timestamp < $1", before)
             deleted += int(result.split()[-1])
 
+            await conn.execute("DELETE FROM http_rollups WHERE bucket < $1", before)
+
             return deleted
 
 
 class DynamoDBStorage(StorageBackend):
     """DynamoDB storage backend."""
 
+    # DynamoDB caps BatchWriteItem at 25 put requests per call
+    BATCH_WRITE_LIMIT = 25
+    # Calls per chunk before giving up on items DynamoDB keeps throttling
+    BATCH_WRITE_ATTEMPTS = 8
+
     def __init__(self, table_name: str, region: str = "us-east-1"):
         if aioboto3 is None:
             raise ImportError(
@@ -307,8 +541,8 @@ class DynamoDBStorage(StorageBackend):
         if self.client:
             await self.client.__aexit__(None, None, None)
 
-    async def store_http_metric(
-        self, timestamp, endpoint, method, status_code, latency_ms, labels=None
+    def _http_item(
+        self, timestamp, endpoint, method, status_code, latency_ms, labels=None, weight=1.0
     ):
         ts = int(timestamp.timestamp() * 1000)
         item = {
@@ -322,9 +556,60 @@ class DynamoDBStorage(StorageBackend):
         }
         if labels:
             item["labels"] = {"S": json.dumps(labels)}
+        if weight != 1.0:
+            item["weight"] = {"N": str(weight)}
+        return item
+
+    def _custom_item(self, timestamp, name, value, labels=None):
+        ts = int(timestamp.timestamp() * 1000)
+        item = {
+            "PK": {"S": f"CUSTOM#{name}"},
+            "SK": {"N": str(ts)},
+            "name": {"S": name},
+            "value": {"N": str(value)},
+            "ttl": {"N": str(int(time.time()) + 86400 * 7)},
+        }
+        if labels:
+            item["labels"] = {"S": json.dumps(labels)}
+        return item
+
+    async def _batch_put(self, items):
+        """Write items with BatchWriteItem, retrying unprocessed ones a bounded number of times."""
+        # A batch may not contain the same key twice; keep the last write
+        # per key, matching what consecutive put_item calls would leave behind
+        items = list({(i["PK"]["S"], i["SK"]["N"]): i for i in items}.values())
+        for start in range(0, len(items), self.BATCH_WRITE_LIMIT):
+            requests = [
+                {"PutRequest": {"Item": item}}
+                for item in items[start : start + self.BATCH_WRITE_LIMIT]
+            ]
+            for attempt in range(1, self.BATCH_WRITE_ATTEMPTS + 1):
+                response = await self.client.batch_write_item(
+                    RequestItems={self.table_name: requests}
+                )
+                requests = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                if not requests:
+                    break
+                if attempt < self.BATCH_WRITE_ATTEMPTS:
+                    # Back off before retrying throttled writes
+                    await asyncio.sleep(min(0.05 * 2**attempt, 1.0))
+            else:
+                raise RuntimeError(
+                    f"{len(requests)} items left unprocessed after "
+                    f"{self.BATCH_WRITE_ATTEMPTS} BatchWriteItem attempts"
+                )
 
+    async def store_http_metric(
+        self, timestamp, endpoint, method, status_code, latency_ms, labels=None, weight=1.0
+    ):
+        item = self._http_item(
+            timestamp, endpoint, method, status_code, latency_ms, labels, weight
+        )
         await self.client.put_item(TableName=self.table_name, Item=item)
 
+    async def store_http_metrics_batch(self, metrics):
+        await self._batch_put([self._http_item(**m) for m in metrics])
+
     async def store_error(
         self,
         timestamp,
@@ -335,6 +620,7 @@ class DynamoDBStorage(StorageBackend):
         error_hash,
         stack_trace,
         user_agent=None,
+        count=1,
     ):
         ts = int(timestamp.timestamp() * 1000)
         item = {
@@ -345,7 +631,7 @@ class DynamoDBStorage(StorageBackend):
             "error_type": {"S": error_type},
             "error_message": {"S": error_message},
             "stack_trace": {"S": stack_trace},
-            "count": {"N": "1"},
+            "count": {"N": str(count)},
             "ttl": {"N": str(int(time.time()) + 86400 * 7)},
         }
         if user_agent:
@@ -354,31 +640,104 @@ class DynamoDBStorage(StorageBackend):
         await self.client.put_item(TableName=self.table_name, Item=item)
 
     async def store_custom_metric(self, timestamp, name, value, labels=None):
-        ts = int(timestamp.timestamp() * 1000)
-        item = {
-            "PK": {"S": f"CUSTOM#{name}"},
-            "SK": {"N": str(ts)},
-            "name": {"S": name},
-            "value": {"N": str(value)},
-            "ttl": {"N": str(int(time.time()) + 86400 * 7)},
-        }
-        if labels:
-            item["labels"] = {"S": json.dumps(labels)}
-
+        item = self._custom_item(timestamp, name, value, labels)
         await self.client.put_item(TableName=self.table_name, Item=item)
 
+    async def store_custom_metrics_batch(self, metrics):
+        await self._batch_put([self._custom_item(**m) for m in metrics])
+
+    async def store_rollups(self, rollups):
+        items = []
+        for r in rollups:
+            bucket_ms = int(r["bucket"].timestamp() * 1000)
+            items.append(
+                {
+                    "PK": {"S": f"ROLLUP#{r['resolution']}"},
+                    # Random fraction keeps rows from several instances distinct
+                    "SK": {"N": f"{bucket_ms}.{uuid.uuid4().int % 10**12:012d}"},
+                    "endpoint": {"S": r["endpoint"]},
+                    "method": {"S": r["method"]},
+                    "status_class": {"N": str(r["status_class"])},
+                    "count": {"N": str(r["count"])},
+                    "sum": {"N": str(r["sum"])},
+                    "min": {"N": str(r["min"])},
+                    "max": {"N": str(r["max"])},
+                    "sketch": {"S": json.dumps(r["sketch"])},
+                    "ttl": {"N": str(int(time.time()) + 86400 * 7)},
+                }
+            )
+        await self._batch_put(items)
+
+    async def query_rollups(self, resolution, from_time, to_time, endpoint=None, method=None):
+        rows = []
+        kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "PK = :pk AND SK BETWEEN :from_ms AND :to_ms",
+            "ExpressionAttributeValues": {
+                ":pk": {"S": f"ROLLUP#{resolution}"},
+                ":from_ms": {"N": str(int(from_time.timestamp() * 1000))},
+                ":to_ms": {"N": str(int(to_time.timestamp() * 1000) + 1)},
+            },
+        }
+        while True:
+            response = await self.client.query(**kwargs)
+            for item in response.get("Items", []):
+                if endpoint and item["endpoint"]["S"] != endpoint:
+                    continue
+                if method and item["method"]["S"] != method:
+                    continue
+                bucket_ms = int(float(item["SK"]["N"]))
+                rows.append(
+                    {
+                        "resolution": resolution,
+                        "bucket": datetime.datetime.fromtimestamp(
+                            bucket_ms / 1000, tz=datetime.timezone.utc
+                        ),
+                        "endpoint": item["endpoint"]["S"],
+                        "method": item["method"]["S"],
+                        "status_class": int(item["status_class"]["N"]),
+                        "count": int(item["count"]["N"]),
+                        "sum": float(item["sum"]["N"]),
+                        "min": float(item["min"]["N"]),
+                        "max": float(item["max"]["N"]),
+                        "sketch": json.loads(item["sketch"]["S"]),
+                    }
+                )
+            if "LastEvaluatedKey" not in response:
+                return rows
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
     async def query_http_metrics(
-        self, from_time, to_time, endpoint=None, method=None, group_by=None
+        self,
+        from_time,
+        to_time,
+        endpoint=None,
+        method=None,
+        group_by=None,
+        limit=100,
+        offset=0,
+        fill_gaps=False,
+        cursor=None,
     ):
         # DynamoDB query implementation - simplified
         # In production, use proper GSI and query patterns
-        return []
+        return Page()
 
     async def query_errors(self, from_time, to_time, endpoint=None):
         return []
 
-    async def query_custom_metrics(self, from_time, to_time, name=None, group_by=None):
-        return []
+    async def query_custom_metrics(
+        self,
+        from_time,
+        to_time,
+        name=None,
+        group_by=None,
+        limit=100,
+        offset=0,
+        fill_gaps=False,
+        cursor=None,
+    ):
+        return Page()
 
     async def get_endpoint_stats(self):
         return []
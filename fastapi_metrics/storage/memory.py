@@ -1,20 +1,295 @@
 """In-memory storage backend for FastAPI Metrics."""
 
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, tzinfo
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from collections import defaultdict
 import statistics
 
-from .base import StorageBackend
+from .base import (
+    Page,
+    StorageBackend,
+    bucket_seconds,
+    bucket_starts,
+    decode_cursor,
+    encode_cursor,
+)
+from ..sketch import DDSketch
+
+
+class HttpColumns:
+    """Column-oriented store of HTTP request metrics, ordered by time.
+
+    Each field lives in a typed ``array`` (timestamps and latencies as
+    doubles, status codes as unsigned shorts, sample weights as floats) and
+    endpoints/methods are interned to small integer ids, so a row costs a
+    few dozen bytes instead of a dict per request. Rows are kept sorted by
+    timestamp, which lets time-range queries bisect instead of scanning.
+
+    Live rows start at ``head``: dropping old rows only moves that pointer.
+    Without ``capacity`` the arrays grow and the dead prefix is compacted
+    once it outweighs the live rows. With ``capacity`` the arrays never grow
+    past it and act as a ring buffer: once full, each new row overwrites the
+    oldest one in O(1) and is counted in ``evicted``.
+
+    Methods that take or yield a row index use physical positions in the
+    arrays; ``range()`` works on logical positions (0 is the oldest row).
+    """
+
+    # Bytes per row across the typed columns plus the labels slot
+    ROW_BYTES = 8 + 8 + 2 + 4 + 1 + 4 + 8
+    # Method ids are single bytes; methods past the limit share one id
+    MAX_METHODS = 256
+    OTHER_METHOD = "OTHER"
+
+    def __init__(self, capacity: Optional[int] = None) -> None:
+        if capacity is not None and capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+        self.capacity = capacity
+        self.timestamps = array("d")
+        self.latencies = array("d")
+        self.status_codes = array("H")
+        self.endpoint_ids = array("I")
+        self.method_ids = array("B")
+        self.weights = array("f")
+        # Labels are rare (request IDs); most entries are None
+        self.labels: List[Optional[Dict[str, Any]]] = []
+        self.endpoints: List[str] = []
+        self.methods: List[str] = []
+        self._endpoint_ids: Dict[str, int] = {}
+        self._method_ids: Dict[str, int] = {}
+        # Timezone of stored timestamps, restored on read
+        self.tz: Optional[tzinfo] = None
+        self.head = 0
+        self.size = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _columns(self) -> Tuple[Any, ...]:
+        return (
+            self.timestamps,
+            self.latencies,
+            self.status_codes,
+            self.endpoint_ids,
+            self.method_ids,
+            self.weights,
+            self.labels,
+        )
+
+    def _method_id(self, method: str) -> int:
+        """Intern a new method, folding it into ``OTHER`` once ids run out."""
+        if len(self.methods) >= self.MAX_METHODS - 1 and method != self.OTHER_METHOD:
+            method = self.OTHER_METHOD
+            method_id = self._method_ids.get(method)
+            if method_id is not None:
+                return method_id
+        method_id = self._method_ids[method] = len(self.methods)
+        self.methods.append(method)
+        return method_id
+
+    def _phys(self, i: int) -> int:
+        """Physical array position of logical row ``i``."""
+        i += self.head
+        length = len(self.timestamps)
+        return i - length if i >= length else i
+
+    def append(
+        self,
+        timestamp: datetime,
+        endpoint: str,
+        method: str,
+        status_code: int,
+        latency_ms: float,
+        labels: Optional[Dict[str, Any]] = None,
+        weight: float = 1.0,
+    ) -> None:
+        """Add one row, keeping rows ordered by timestamp."""
+        if not self.size:
+            self.tz = timestamp.tzinfo
+        ts = timestamp.timestamp()
+        endpoint_id = self._endpoint_ids.get(endpoint)
+        if endpoint_id is None:
+            endpoint_id = self._endpoint_ids[endpoint] = len(self.endpoints)
+            self.endpoints.append(endpoint)
+        method_id = self._method_ids.get(method)
+        if method_id is None:
+            method_id = self._method_id(method)
+        row = (ts, latency_ms, status_code, endpoint_id, method_id, weight, labels or None)
+
+        length = len(self.timestamps)
+        if self.head + self.size == length and (self.capacity is None or length < self.capacity):
+            for column, value in zip(self._columns(), row):
+                column.append(value)
+        else:
+            if self.size == length:
+                # Full ring: the slot of the oldest row is reused
+                self.head = self._phys(1)
+                self.size -= 1
+                self.evicted += 1
+            pos = self._phys(self.size)
+            for column, value in zip(self._columns(), row):
+                column[pos] = value
+        self.size += 1
+
+        # Slightly out-of-order writes (concurrent requests) are moved into
+        # place; they land near the end so only a few rows are swapped
+        i = self.size - 1
+        while i and self.timestamps[self._phys(i - 1)] > ts:
+            a, b = self._phys(i - 1), self._phys(i)
+            for column in self._columns():
+                column[a], column[b] = column[b], column[a]
+            i -= 1
+
+    def _bisect(self, ts: float, right: bool) -> int:
+        """Logical position where ``ts`` would be inserted."""
+        length = len(self.timestamps)
+        if self.head + self.size <= length:
+            # Live rows are contiguous: bisect the arrays directly
+            find = bisect_right if right else bisect_left
+            return find(self.timestamps, ts, self.head, self.head + self.size) - self.head
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.timestamps[self._phys(mid)]
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(
+        self, from_time: Optional[datetime] = None, to_time: Optional[datetime] = None
+    ) -> Tuple[int, int]:
+        """Logical row range ``[lo, hi)`` of a time window."""
+        lo = self._bisect(from_time.timestamp(), right=False) if from_time else 0
+        hi = self._bisect(to_time.timestamp(), right=True) if to_time else self.size
+        return lo, hi
+
+    def rows(
+        self,
+        lo: int = 0,
+        hi: Optional[int] = None,
+        endpoint: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> Iterator[int]:
+        """Physical indices of rows in logical range ``[lo, hi)`` matching the filters."""
+        endpoint_id = method_id = None
+        if endpoint is not None:
+            endpoint_id = self._endpoint_ids.get(endpoint)
+            if endpoint_id is None:
+                return
+        if method is not None:
+            method_id = self._method_ids.get(method)
+            if method_id is None:
+                return
+        for i in range(lo, self.size if hi is None else hi):
+            p = self._phys(i)
+            if endpoint_id is not None and self.endpoint_ids[p] != endpoint_id:
+                continue
+            if method_id is not None and self.method_ids[p] != method_id:
+                continue
+            yield p
+
+    def timestamp(self, p: int) -> datetime:
+        """Timestamp of a row as a datetime."""
+        return datetime.fromtimestamp(self.timestamps[p], tz=self.tz)
+
+    def row(self, p: int) -> Dict[str, Any]:
+        """Materialise one row as a dict."""
+        return {
+            "timestamp": self.timestamp(p),
+            "endpoint": self.endpoints[self.endpoint_ids[p]],
+            "method": self.methods[self.method_ids[p]],
+            "status_code": self.status_codes[p],
+            "latency_ms": self.latencies[p],
+            "labels": self.labels[p] or {},
+            "weight": self.weights[p],
+        }
+
+    def truncate(self, before: datetime) -> int:
+        """Drop rows older than ``before``; returns how many were removed."""
+        count = self._bisect(before.timestamp(), right=False)
+        if not count:
+            return 0
+        if self.capacity is not None:
+            self.head = self._phys(count)
+            self.size -= count
+            return count
+
+        self.head += count
+        self.size -= count
+        if self.head > self.size:
+            # Unbounded mode: reclaim the dead prefix once it dominates
+            for column in self._columns():
+                del column[: self.head]
+            self.head = 0
+        return count
+
+    def clear(self) -> None:
+        """Remove all rows."""
+        for column in self._columns():
+            del column[:]
+        self.head = self.size = 0
+
+
+def _keyset_page(
+    rows: Iterable[Tuple[float, Any]],
+    materialise: Callable[[Any], Dict[str, Any]],
+    limit: int,
+    offset: int,
+    after: Optional[Tuple[float, int]],
+) -> Page:
+    """One page of ``(timestamp, row)`` pairs given in timestamp order.
+
+    Cursors hold the timestamp of the last row served and how many rows
+    with that timestamp were served, so the next page starts by skipping
+    only those ties.
+    """
+    skip_ts, skip = after or (None, 0)
+    page = Page()
+    last_ts, ties = None, 0
+    for ts, row in rows:
+        if len(page) >= limit:
+            page.next_cursor = encode_cursor(last_ts, ties)
+            break
+        ties = ties + 1 if ts == last_ts else 1
+        last_ts = ts
+        if skip and ts == skip_ts:
+            skip -= 1
+            continue
+        skip = 0
+        if offset:
+            offset -= 1
+            continue
+        page.append(materialise(row))
+    return page
 
 
 class MemoryStorage(StorageBackend):
-    """In-memory storage backend for development/testing."""
+    """In-memory storage backend for development/testing.
+
+    By default HTTP metrics are kept until ``cleanup_old_data`` drops them.
+    Set ``max_events`` (or ``max_bytes``, converted using
+    ``HttpColumns.ROW_BYTES``; label contents are not counted) to keep them
+    in a fixed-size ring buffer that overwrites the oldest events instead,
+    so memory use stays flat under traffic spikes.
 
-    def __init__(self):
-        self.http_metrics: List[Dict[str, Any]] = []
+    Custom metrics are kept sorted by timestamp like HTTP rows, so both are
+    range-queried and cursor-paginated by bisecting.
+    """
+
+    def __init__(self, max_events: Optional[int] = None, max_bytes: Optional[int] = None):
+        if max_bytes is not None:
+            by_bytes = max_bytes // HttpColumns.ROW_BYTES
+            max_events = min(max_events, by_bytes) if max_events else by_bytes
+        self.http = HttpColumns(capacity=max_events)
         self.custom_metrics: List[Dict[str, Any]] = []
-        self.errors: List[Dict[str, Any]] = []
+        # Keyed by error hash
+        self.errors: Dict[str, Dict[str, Any]] = {}
+        self.rollups: List[Dict[str, Any]] = []
         self._initialized = False
 
     async def initialize(self) -> None:
@@ -23,11 +298,17 @@ class MemoryStorage(StorageBackend):
 
     async def close(self) -> None:
         """Clear all data."""
-        self.http_metrics.clear()
+        self.http.clear()
         self.custom_metrics.clear()
         self.errors.clear()
+        self.rollups.clear()
         self._initialized = False
 
+    @property
+    def http_metrics(self) -> List[Dict[str, Any]]:
+        """All HTTP metric rows as dicts (materialised on every access)."""
+        return [self.http.row(p) for p in self.http.rows()]
+
     async def store_http_metric(
         self,
         timestamp: datetime,
@@ -36,18 +317,10 @@ class MemoryStorage(StorageBackend):
         status_code: int,
         latency_ms: float,
         labels: Optional[Dict[str, Any]] = None,
+        weight: float = 1.0,
     ) -> None:
         """Store HTTP metric in memory."""
-        self.http_metrics.append(
-            {
-                "timestamp": timestamp,
-                "endpoint": endpoint,
-                "method": method,
-                "status_code": status_code,
-                "latency_ms": latency_ms,
-                "labels": labels or {},
-            }
-        )
+        self.http.append(timestamp, endpoint, method, status_code, latency_ms, labels, weight)
 
     async def store_custom_metric(
         self,
@@ -57,7 +330,7 @@ class MemoryStorage(StorageBackend):
         labels: Optional[Dict[str, Any]] = None,
     ) -> None:
         """Store custom metric in memory."""
-        self.custom_metrics.append(
+        self._insert_custom(
             {
                 "timestamp": timestamp,
                 "name": name,
@@ -66,6 +339,67 @@ class MemoryStorage(StorageBackend):
             }
         )
 
+    def _custom_position(self, ts: float, right: bool = False) -> int:
+        """Index where a custom metric at ``ts`` would be inserted."""
+        rows = self.custom_metrics
+        lo, hi = 0, len(rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = rows[mid]["timestamp"].timestamp()
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _insert_custom(self, metric: Dict[str, Any]) -> None:
+        """Add a custom metric, keeping the list ordered by timestamp."""
+        rows = self.custom_metrics
+        ts = metric["timestamp"].timestamp()
+        if not rows or rows[-1]["timestamp"].timestamp() <= ts:
+            rows.append(metric)
+        else:
+            rows.insert(self._custom_position(ts, right=True), metric)
+
+    async def store_http_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many HTTP metrics in memory."""
+        for m in metrics:
+            self.http.append(**m)
+
+    async def store_custom_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many custom metrics in memory."""
+        for m in metrics:
+            self._insert_custom(
+                {
+                    "timestamp": m["timestamp"],
+                    "name": m["name"],
+                    "value": m["value"],
+                    "labels": m.get("labels") or {},
+                }
+            )
+
+    async def store_rollups(self, rollups: List[Dict[str, Any]]) -> None:
+        """Store rollup rows in memory."""
+        self.rollups.extend(dict(r) for r in rollups)
+
+    async def query_rollups(
+        self,
+        resolution: int,
+        from_time: datetime,
+        to_time: datetime,
+        endpoint: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Query rollup rows from memory."""
+        return [
+            dict(r)
+            for r in self.rollups
+            if r["resolution"] == resolution
+            and from_time <= r["bucket"] <= to_time
+            and (endpoint is None or r["endpoint"] == endpoint)
+            and (method is None or r["method"] == method)
+        ]
+
     async def query_http_metrics(
         self,
         from_time: datetime,
@@ -75,37 +409,48 @@ class MemoryStorage(StorageBackend):
         group_by: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query HTTP metrics from memory."""
-        filtered = [
-            m
-            for m in self.http_metrics
-            if from_time <= m["timestamp"] <= to_time
-            and (endpoint is None or m["endpoint"] == endpoint)
-            and (method is None or m["method"] == method)
-        ]
+        """Query HTTP metrics from memory, oldest first."""
+        http = self.http
+        lo, hi = http.range(from_time, to_time)
+        after = None
+        if cursor and not group_by:
+            after = decode_cursor(cursor)
+            lo = max(lo, http._bisect(after[0], right=False))
+            offset = 0
+        rows = http.rows(lo, hi, endpoint=endpoint, method=method)
 
-        if not group_by:
-            return filtered[offset : offset + limit]
+        if group_by:
+            width = bucket_seconds(group_by)
+            grouped: Dict[float, List[float]] = {}
+            for p in rows:
+                ts = http.timestamps[p]
+                key = ts - ts % width
+                if key not in grouped:
+                    grouped[key] = [0.0, 0.0]
+                grouped[key][0] += http.weights[p]
+                grouped[key][1] += http.latencies[p] * http.weights[p]
 
-        # Simple grouping by hour
-        if group_by == "hour":
-            grouped = defaultdict(list)
-            for m in filtered:
-                key = m["timestamp"].replace(minute=0, second=0, microsecond=0)
-                grouped[key].append(m)
+            if fill_gaps:
+                starts = bucket_starts(
+                    from_time.timestamp(), to_time.timestamp(), width, limit, offset
+                )
+                grouped = {k: grouped.get(k, [0.0, 0.0]) for k in starts}
+                offset = 0
 
             results = [
                 {
-                    "timestamp": k,
-                    "count": len(v),
-                    "avg_latency_ms": statistics.mean([x["latency_ms"] for x in v]),
+                    "timestamp": datetime.fromtimestamp(k, tz=http.tz or from_time.tzinfo),
+                    "count": round(count),
+                    "avg_latency_ms": total / count if count else None,
                 }
-                for k, v in sorted(grouped.items())
+                for k, (count, total) in sorted(grouped.items())
             ]
             return results[offset : offset + limit]
 
-        return filtered[offset : offset + limit]
+        return _keyset_page(((http.timestamps[p], p) for p in rows), http.row, limit, offset, after)
 
     async def query_custom_metrics(
         self,
@@ -115,36 +460,56 @@ class MemoryStorage(StorageBackend):
         group_by: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query custom metrics from memory."""
-        filtered = [
-            m
-            for m in self.custom_metrics
-            if from_time <= m["timestamp"] <= to_time and (name is None or m["name"] == name)
-        ]
+        """Query custom metrics from memory, oldest first."""
+        lo = self._custom_position(from_time.timestamp())
+        hi = self._custom_position(to_time.timestamp(), right=True)
 
         if not group_by:
-            return filtered[offset : offset + limit]
+            after = None
+            if cursor:
+                after = decode_cursor(cursor)
+                lo = max(lo, self._custom_position(after[0]))
+            rows = (self.custom_metrics[i] for i in range(lo, hi))
+            return _keyset_page(
+                (
+                    (m["timestamp"].timestamp(), m)
+                    for m in rows
+                    if name is None or m["name"] == name
+                ),
+                dict,
+                limit,
+                0 if after else offset,
+                after,
+            )
 
-        # Simple grouping by hour
-        if group_by == "hour":
-            grouped = defaultdict(list)
-            for m in filtered:
-                key = m["timestamp"].replace(minute=0, second=0, microsecond=0)
-                grouped[key].append(m)
+        filtered = [m for m in self.custom_metrics[lo:hi] if name is None or m["name"] == name]
 
-            results = [
-                {
-                    "timestamp": k,
-                    "count": len(v),
-                    "sum": sum(x["value"] for x in v),
-                    "avg": statistics.mean([x["value"] for x in v]),
-                }
-                for k, v in sorted(grouped.items())
-            ]
-            return results[offset : offset + limit]
+        width = bucket_seconds(group_by)
+        grouped = defaultdict(list)
+        for m in filtered:
+            ts = m["timestamp"].timestamp()
+            grouped[(ts - ts % width, m["name"])].append(m["value"])
 
-        return filtered[offset : offset + limit]
+        if fill_gaps:
+            starts = bucket_starts(from_time.timestamp(), to_time.timestamp(), width, limit, offset)
+            names = sorted({m["name"] for m in filtered} or ([name] if name else []))
+            grouped = {(k, n): grouped.get((k, n), []) for k in starts for n in names}
+            limit, offset = len(grouped), 0
+
+        results = [
+            {
+                "timestamp": datetime.fromtimestamp(k, tz=from_time.tzinfo),
+                "name": n,
+                "count": len(v),
+                "sum": sum(v),
+                "avg": statistics.mean(v) if v else None,
+            }
+            for (k, n), v in sorted(grouped.items())
+        ]
+        return results[offset : offset + limit]
 
     async def get_endpoint_stats(
         self,
@@ -152,43 +517,43 @@ class MemoryStorage(StorageBackend):
         to_time: Optional[datetime] = None,
     ) -> List[Dict[str, Any]]:
         """Get aggregated stats per endpoint within an optional time range."""
-        by_endpoint = defaultdict(list)
-        for m in self.http_metrics:
-            if from_time and m["timestamp"] < from_time:
-                continue
-            if to_time and m["timestamp"] > to_time:
-                continue
-            key = (m["endpoint"], m["method"])
-            by_endpoint[key].append(m)
+        http = self.http
+        sketches: Dict[Tuple[int, int], DDSketch] = {}
+        errors: Dict[Tuple[int, int], float] = defaultdict(float)
+        for p in http.rows(*http.range(from_time, to_time)):
+            key = (http.endpoint_ids[p], http.method_ids[p])
+            latencies = sketches.get(key)
+            if latencies is None:
+                latencies = sketches[key] = DDSketch()
+            latencies.add(http.latencies[p], http.weights[p])
+            if http.status_codes[p] >= 400:
+                errors[key] += http.weights[p]
 
         stats = []
-        for (endpoint, method), metrics in by_endpoint.items():
-            latencies = [m["latency_ms"] for m in metrics]
-            status_codes = [m["status_code"] for m in metrics]
-
+        for key, latencies in sketches.items():
             stats.append(
                 {
-                    "endpoint": endpoint,
-                    "method": method,
-                    "count": len(metrics),
-                    "avg_latency_ms": statistics.mean(latencies),
-                    "p50_latency_ms": statistics.median(latencies),
-                    "p95_latency_ms": (
-                        statistics.quantiles(latencies, n=20)[18]
-                        if len(latencies) > 1
-                        else latencies[0]
-                    ),
-                    "p99_latency_ms": (
-                        statistics.quantiles(latencies, n=100)[98]
-                        if len(latencies) > 1
-                        else latencies[0]
-                    ),
-                    "error_rate": len([s for s in status_codes if s >= 400]) / len(status_codes),
+                    "endpoint": http.endpoints[key[0]],
+                    "method": http.methods[key[1]],
+                    "count": round(latencies.count),
+                    "avg_latency_ms": latencies.sum / latencies.count,
+                    "p50_latency_ms": latencies.quantile(0.50),
+                    "p95_latency_ms": latencies.quantile(0.95),
+                    "p99_latency_ms": latencies.quantile(0.99),
+                    "error_rate": errors[key] / latencies.count,
                 }
             )
 
         return stats
 
+    def stats(self) -> Dict[str, Any]:
+        """Size and eviction counters of the HTTP metric store."""
+        return {
+            "http_events": len(self.http),
+            "capacity": self.http.capacity,
+            "evicted": self.http.evicted,
+        }
+
     async def store_error(
         self,
         timestamp: datetime,
@@ -199,28 +564,27 @@ class MemoryStorage(StorageBackend):
         error_hash: str,
         stack_trace: str,
         user_agent: Optional[str] = None,
+        count: int = 1,
     ) -> None:
         """Store error details in memory, deduplicating by hash."""
-        for error in self.errors:
-            if error["error_hash"] == error_hash:
-                error["count"] += 1
-                error["last_seen"] = timestamp
-                return
-        self.errors.append(
-            {
-                "timestamp": timestamp,
-                "endpoint": endpoint,
-                "method": method,
-                "error_type": error_type,
-                "error_message": error_message,
-                "error_hash": error_hash,
-                "stack_trace": stack_trace,
-                "user_agent": user_agent,
-                "count": 1,
-                "first_seen": timestamp,
-                "last_seen": timestamp,
-            }
-        )
+        error = self.errors.get(error_hash)
+        if error is not None:
+            error["count"] += count
+            error["last_seen"] = timestamp
+            return
+        self.errors[error_hash] = {
+            "timestamp": timestamp,
+            "endpoint": endpoint,
+            "method": method,
+            "error_type": error_type,
+            "error_message": error_message,
+            "error_hash": error_hash,
+            "stack_trace": stack_trace,
+            "user_agent": user_agent,
+            "count": count,
+            "first_seen": timestamp,
+            "last_seen": timestamp,
+        }
 
     async def query_errors(
         self,
@@ -231,23 +595,23 @@ class MemoryStorage(StorageBackend):
         """Query errors from memory."""
         return [
             e
-            for e in self.errors
+            for e in self.errors.values()
             if from_time <= e["timestamp"] <= to_time
             and (endpoint is None or e["endpoint"] == endpoint)
         ]
 
     async def cleanup_old_data(self, before: datetime) -> int:
         """Remove data older than specified datetime."""
-        http_before = len(self.http_metrics)
         custom_before = len(self.custom_metrics)
         errors_before = len(self.errors)
+        self.rollups = [r for r in self.rollups if r["bucket"] >= before]
 
-        self.http_metrics = [m for m in self.http_metrics if m["timestamp"] >= before]
+        http_deleted = self.http.truncate(before)
         self.custom_metrics = [m for m in self.custom_metrics if m["timestamp"] >= before]
-        self.errors = [e for e in self.errors if e["timestamp"] >= before]
+        self.errors = {h: e for h, e in self.errors.items() if e["timestamp"] >= before}
 
         return (
-            (http_before - len(self.http_metrics))
+            http_deleted
             + (custom_before - len(self.custom_metrics))
             + (errors_before - len(self.errors))
         )
@@ -1,55 +1,328 @@
 """ "Redis storage backend for FastAPI Metrics."""
 
 from collections import defaultdict
+import asyncio
 import json
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from urllib.parse import urlparse
 
 try:
     import redis.asyncio as redis
+    from redis.utils import HIREDIS_AVAILABLE
 except ImportError:
     redis = None
+    HIREDIS_AVAILABLE = False
 
-from .base import StorageBackend
+from .base import (
+    Page,
+    StorageBackend,
+    bucket_seconds,
+    bucket_starts,
+    decode_cursor,
+    encode_cursor,
+)
+from ..aggregation import RESOLUTIONS
+from ..sketch import DDSketch
 
+# Seconds individual metric hashes are kept
+METRIC_TTL = 604800
 
-class RedisStorage(StorageBackend):
-    """Redis storage backend for distributed/multi-instance deployments."""
+# Set of the endpoint and metric name index keys, swept by retention
+INDEX_REGISTRY = "metric_indexes"
+# Timestamp suffix of per-event metric keys such as custom:{name}:{ts}
+_EVENT_KEY = re.compile(r":\d+(\.\d+)?$")
+
+# Seconds per endpoint stats counter bucket (``stats:m:{minute}``)
+STATS_BUCKET = 60
+# Maps latencies to the bins of the stats counters
+_STATS_SKETCH = DDSketch()
+
+
+def _labels_json(labels: Any) -> str:
+    """Labels as JSON, or "" when empty; ``_write`` may have encoded them already."""
+    if isinstance(labels, str):
+        return labels
+    return json.dumps(labels) if labels else ""
+
+
+# Retention sweep step: index, max score, keys of a member, what to count
+SweepStep = Tuple[str, Any, Optional[Callable[[str], Tuple[str, ...]]], Optional[str]]
 
-    def __init__(self, redis_url: str = "redis://localhost:6379/0"):
+
+class RedisStorage(StorageBackend):
+    """Redis storage backend for distributed/multi-instance deployments.
+
+    Every write is sent as one pipeline, so storing a metric costs a single
+    round trip. With ``batch_size`` set, writes from concurrent requests
+    are also coalesced: they are queued and sent in one pipeline once
+    ``batch_size`` metrics are pending or ``batch_interval_ms`` has passed
+    since the first of them. Each caller still waits until its own metric
+    has been written, and sees the error if the pipeline fails.
+
+    Each HTTP write also updates the per-minute counters of its endpoint
+    (``stats:m:{minute}``) in the same pipeline, so ``get_endpoint_stats``
+    reads one counter hash per minute instead of every stored request.
+    ``initialize`` records in ``stats:since`` the first minute counted;
+    requests stored before it, by a version without counters, are
+    aggregated from the stored records instead.
+
+    Requires Redis 4.0 or newer (``UNLINK``).
+
+    Connections come from one pool shared by the storage and the health
+    check. ``max_connections`` bounds it; when it is set, callers wait for
+    a free connection instead of failing. ``rediss://`` URLs connect over
+    TLS, ``unix_socket_path`` connects through a local Unix socket
+    instead of TCP, and ``protocol=3`` speaks RESP3. Replies are parsed by
+    hiredis when it is installed (``parser`` tells which parser is used).
+
+    Retention runs as a sweep over the sorted-set indexes that removes
+    ``sweep_chunk_size`` members per round trip and pauses
+    ``sweep_pause_ms`` between chunks; ``stats()`` reports its backlog.
+    Writes register their endpoint and metric name indexes in the
+    ``metric_indexes`` set, so the sweep never scans the keyspace.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379/0",
+        batch_size: Optional[int] = None,
+        batch_interval_ms: float = 2.0,
+        max_connections: Optional[int] = None,
+        socket_keepalive: bool = True,
+        unix_socket_path: Optional[str] = None,
+        protocol: Optional[int] = None,
+        sweep_chunk_size: int = 1000,
+        sweep_pause_ms: float = 10.0,
+    ):
         if redis is None:
             raise ImportError(
                 "Redis support requires 'redis' package. Install with: pip install redis"
             )
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
 
         self.redis_url = redis_url
         self.client: Optional[Any] | None = None
+        self.pool: Optional[Any] = None
+        self.max_connections = max_connections
+        self.socket_keepalive = socket_keepalive
+        self.unix_socket_path = unix_socket_path
+        self.protocol = protocol
+        self.parser = "hiredis" if HIREDIS_AVAILABLE else "python"
+        # Retention sweep settings and progress
+        self.sweep_chunk_size = sweep_chunk_size
+        self.sweep_pause_ms = sweep_pause_ms
+        self.sweep_backlog = 0
+        self.swept = 0
+        self.batch_size = batch_size
+        self.batch_interval_ms = batch_interval_ms
+        # Micro-batch: queued writes and the future their callers wait on
+        self._batch: List[Tuple[Callable[[Any, Dict[str, Any]], None], Dict[str, Any]]] = []
+        self._batch_done: Optional[asyncio.Future] = None
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: set = set()
 
         # Parse URL for connection
         parsed = urlparse(redis_url)
         self.host = parsed.hostname or "localhost"
         self.port = parsed.port or 6379
         self.db = int(parsed.path.strip("/") or 0)
+        self.username = parsed.username
         self.password = parsed.password
+        self.ssl = parsed.scheme == "rediss"
+
+    def _connection_pool(self) -> Any:
+        """Connection pool built from the URL and the pool options."""
+        options: Dict[str, Any] = {
+            "db": self.db,
+            "username": self.username,
+            "password": self.password,
+            "decode_responses": True,
+        }
+        if self.protocol is not None:
+            options["protocol"] = self.protocol
+        if self.unix_socket_path:
+            options.update(
+                connection_class=redis.UnixDomainSocketConnection, path=self.unix_socket_path
+            )
+        else:
+            options.update(
+                connection_class=redis.SSLConnection if self.ssl else redis.Connection,
+                host=self.host,
+                port=self.port,
+                socket_keepalive=self.socket_keepalive,
+            )
+        if self.max_connections:
+            return redis.BlockingConnectionPool(max_connections=self.max_connections, **options)
+        return redis.ConnectionPool(**options)
 
     async def initialize(self) -> None:
-        """Initialize Redis connection."""
-        self.client = redis.Redis(
-            host=self.host,
-            port=self.port,
-            db=self.db,
-            password=self.password,
-            decode_responses=True,
-        )
+        """Initialize the connection pool and client."""
+        self.pool = self._connection_pool()
+        self.client = redis.Redis(connection_pool=self.pool)
 
         # Test connection
         await self.client.ping()
+        # Counters are complete from the next minute on
+        since = int(datetime.now(timezone.utc).timestamp()) // STATS_BUCKET + 1
+        await self.client.set("stats:since", since * STATS_BUCKET, nx=True)
 
     async def close(self) -> None:
         """Close Redis connection."""
         if self.client:
+            await self.flush()
             await self.client.close()
+        if self.pool:
+            await self.pool.disconnect()
+
+    @classmethod
+    def _queue_http(cls, pipeline: Any, m: Dict[str, Any]) -> None:
+        """Queue storing one HTTP metric and counting it in the endpoint stats."""
+        cls._queue_http_record(pipeline, m)
+        cls._queue_stats(pipeline, m)
+
+    @staticmethod
+    def _queue_http_record(pipeline: Any, m: Dict[str, Any]) -> None:
+        """Queue the commands storing one HTTP metric on ``pipeline``."""
+        ts = m["timestamp"].timestamp()
+        metric_id = f"http:{ts}"
+        labels = m.get("labels")
+        # Store metric data as hash
+        pipeline.hset(
+            metric_id,
+            mapping={
+                "timestamp": ts,
+                "endpoint": m["endpoint"],
+                "method": m["method"],
+                "status_code": m["status_code"],
+                "latency_ms": m["latency_ms"],
+                "labels": _labels_json(labels) or "{}",
+                "weight": m.get("weight", 1.0),
+            },
+        )
+        # Time index, and endpoint-specific index registered for retention
+        index = f"http:endpoint:{m['endpoint']}:{m['method']}"
+        pipeline.zadd("http_metrics", {metric_id: ts})
+        pipeline.zadd(index, {metric_id: ts})
+        pipeline.sadd(INDEX_REGISTRY, index)
+        pipeline.expire(metric_id, METRIC_TTL)
+
+    @staticmethod
+    def _queue_stats(pipeline: Any, m: Dict[str, Any]) -> None:
+        """Queue counting one HTTP request in the stats of its minute.
+
+        The minute has a hash of weighted counters per endpoint and method
+        (requests, errors, latency sum and DDSketch bins) updated with
+        HINCRBYFLOAT. Every command is atomic on its own, so concurrent
+        writers never lose an update.
+        """
+        ts = m["timestamp"].timestamp()
+        weight = float(m.get("weight", 1.0))
+        latency = float(m["latency_ms"])
+        index = _STATS_SKETCH.index(latency)
+        prefix = f"{m['method']}\t{m['endpoint']}\t"
+        start = int(ts // STATS_BUCKET * STATS_BUCKET)
+        key = f"stats:m:{start}"
+        pipeline.hincrbyfloat(key, f"{prefix}n", weight)
+        pipeline.hincrbyfloat(key, f"{prefix}s", latency * weight)
+        pipeline.hincrbyfloat(key, f"{prefix}{'z' if index is None else f'b{index}'}", weight)
+        if m["status_code"] >= 400:
+            pipeline.hincrbyfloat(key, f"{prefix}e", weight)
+        pipeline.expireat(key, start + STATS_BUCKET + METRIC_TTL)
+        pipeline.zadd("stats:m", {start: start})
+
+    @staticmethod
+    def _queue_custom(pipeline: Any, m: Dict[str, Any]) -> None:
+        """Queue the commands storing one custom metric on ``pipeline``."""
+        ts = m["timestamp"].timestamp()
+        metric_id = f"custom:{m['name']}:{ts}"
+        labels = m.get("labels")
+        pipeline.hset(
+            metric_id,
+            mapping={
+                "timestamp": ts,
+                "name": m["name"],
+                "value": m["value"],
+                "labels": _labels_json(labels) or "{}",
+            },
+        )
+        index = f"custom:{m['name']}"
+        pipeline.zadd("custom_metrics", {metric_id: ts})
+        pipeline.zadd(index, {metric_id: ts})
+        pipeline.sadd(INDEX_REGISTRY, index)
+        pipeline.expire(metric_id, METRIC_TTL)
+
+    async def _write(self, queue: Callable[[Any, Dict[str, Any]], None], m: Dict[str, Any]) -> None:
+        """Write one metric in a pipeline of its own or in the current micro-batch."""
+        if not self.batch_size:
+            pipeline = self.client.pipeline(transaction=False)
+            queue(pipeline, m)
+            await pipeline.execute()
+            return
+
+        # Encode labels before joining the shared batch, so a label that
+        # cannot be serialised fails this write alone
+        m["labels"] = _labels_json(m.get("labels"))
+        self._batch.append((queue, m))
+        if self._batch_done is None:
+            loop = asyncio.get_running_loop()
+            self._batch_done = loop.create_future()
+            self._batch_timer = loop.call_later(
+                self.batch_interval_ms / 1000, self._flush_in_background
+            )
+        done = self._batch_done
+        if len(self._batch) >= self.batch_size and self._batch_timer is not None:
+            # Not flushed in this writer: its cancellation must not decide
+            # the outcome of the other writers' pipeline
+            self._batch_timer.cancel()
+            self._flush_in_background()
+        # Shielded: cancelling one writer must not cancel the whole batch
+        await asyncio.shield(done)
+
+    def _flush_in_background(self) -> None:
+        """Flush the micro-batch in a background task, once full or on its timer."""
+        self._batch_timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        """Forget a background flush.
+
+        Its failure is not logged here: the writers waiting on the batch
+        receive the exception.
+        """
+        self._batch_tasks.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    async def flush(self) -> None:
+        """Send the pending micro-batch in one pipeline."""
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        done, self._batch_done = self._batch_done, None
+        if not batch:
+            return
+
+        # Whatever happens, including cancellation, the waiting writers
+        # are released
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for queue, m in batch:
+                queue(pipeline, m)
+            await pipeline.execute()
+        except asyncio.CancelledError:
+            done.cancel()
+            raise
+        except BaseException as e:
+            done.set_exception(e)
+            raise
+        done.set_result(None)
 
     async def store_http_metric(
         self,
@@ -59,33 +332,22 @@ class RedisStorage(StorageBackend):
         status_code: int,
         latency_ms: float,
         labels: Optional[Dict[str, Any]] = None,
+        weight: float = 1.0,
     ) -> None:
         """Store HTTP metric in Redis using sorted sets and hashes."""
-        metric_id = f"http:{timestamp.timestamp()}"
-
-        # Store metric data as hash
-        await self.client.hset(
-            metric_id,
-            mapping={
-                "timestamp": timestamp.timestamp(),
+        await self._write(
+            self._queue_http,
+            {
+                "timestamp": timestamp,
                 "endpoint": endpoint,
                 "method": method,
                 "status_code": status_code,
                 "latency_ms": latency_ms,
-                "labels": json.dumps(labels) if labels else "{}",
+                "labels": labels,
+                "weight": weight,
             },
         )
 
-        # Add to sorted set for time-based queries
-        await self.client.zadd("http_metrics", {metric_id: timestamp.timestamp()})
-
-        # Add to endpoint-specific sorted set
-        endpoint_key = f"http:endpoint:{endpoint}:{method}"
-        await self.client.zadd(endpoint_key, {metric_id: timestamp.timestamp()})
-
-        # Expire individual metrics after 7 days
-        await self.client.expire(metric_id, 604800)
-
     async def store_error(
         self,
         timestamp: datetime,
@@ -96,38 +358,33 @@ class RedisStorage(StorageBackend):
         error_hash: str,
         stack_trace: str,
         user_agent: Optional[str] = None,
+        count: int = 1,
     ):
-        """Store error in Redis sorted sets and hashes."""
-        ts = int(timestamp.timestamp())
+        """Store error in Redis sorted sets and hashes.
 
-        # Store in sorted set by timestamp
+        Runs as one MULTI/EXEC transaction: descriptive fields are only set
+        when the error is new (HSETNX), the count is incremented in place.
+        """
+        ts = int(timestamp.timestamp())
         error_key = f"error:{error_hash}"
-        await self.client.zadd("errors:timeline", {error_key: ts})
-
-        # Store error details in hash (with deduplication)
-        error_data = {
-            "endpoint": endpoint,
-            "method": method,
-            "error_type": error_type,
-            "error_message": error_message,
-            "stack_trace": stack_trace,
-            "first_seen": ts,
-            "last_seen": ts,
-            "count": 1,
-        }
-
-        # Check if error exists
-        exists = await self.client.exists(error_key)
-        if exists:
-            # Increment count and update last_seen
-            await self.client.hincrby(error_key, "count", 1)
-            await self.client.hset(error_key, "last_seen", ts)
-        else:
-            # New error
-            await self.client.hset(error_key, mapping=error_data)
 
+        pipeline = self.client.pipeline(transaction=True)
+        # Store in sorted set by timestamp
+        pipeline.zadd("errors:timeline", {error_key: ts})
+        for field, value in (
+            ("endpoint", endpoint),
+            ("method", method),
+            ("error_type", error_type),
+            ("error_message", error_message),
+            ("stack_trace", stack_trace),
+            ("first_seen", ts),
+        ):
+            pipeline.hsetnx(error_key, field, value)
+        pipeline.hincrby(error_key, "count", count)
+        pipeline.hset(error_key, "last_seen", ts)
         # Set expiry based on retention
-        await self.client.expire(error_key, 86400 * 7)  # 7 days
+        pipeline.expire(error_key, 86400 * 7)  # 7 days
+        await pipeline.execute()
 
     async def store_custom_metric(
         self,
@@ -137,48 +394,128 @@ class RedisStorage(StorageBackend):
         labels: Optional[Dict[str, Any]] = None,
     ) -> None:
         """Store custom metric in Redis."""
-        metric_id = f"custom:{name}:{timestamp.timestamp()}"
-
-        # Store metric data
-        await self.client.hset(
-            metric_id,
-            mapping={
-                "timestamp": timestamp.timestamp(),
-                "name": name,
-                "value": value,
-                "labels": json.dumps(labels) if labels else "{}",
-            },
+        await self._write(
+            self._queue_custom,
+            {"timestamp": timestamp, "name": name, "value": value, "labels": labels},
         )
 
-        # Add to sorted set for queries
-        await self.client.zadd("custom_metrics", {metric_id: timestamp.timestamp()})
-        await self.client.zadd(f"custom:{name}", {metric_id: timestamp.timestamp()})
-
-        # Expire after 7 days
-        await self.client.expire(metric_id, 604800)
+    async def store_http_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many HTTP metrics in a single pipeline round-trip."""
+        if not metrics:
+            return
+
+        pipeline = self.client.pipeline(transaction=False)
+        for m in metrics:
+            self._queue_http(pipeline, m)
+        await pipeline.execute()
+
+    async def store_custom_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many custom metrics in a single pipeline round-trip."""
+        if not metrics:
+            return
+
+        pipeline = self.client.pipeline(transaction=False)
+        for m in metrics:
+            self._queue_custom(pipeline, m)
+        await pipeline.execute()
+
+    async def store_rollups(self, rollups: List[Dict[str, Any]]) -> None:
+        """Append rollup rows to one sorted set per resolution, scored by bucket."""
+        if not rollups:
+            return
+
+        pipeline = self.client.pipeline(transaction=False)
+        for r in rollups:
+            bucket = r["bucket"].timestamp()
+            member = json.dumps(
+                {
+                    # Unique id so identical rows from two instances both survive
+                    "id": uuid.uuid4().hex,
+                    "bucket": bucket,
+                    "endpoint": r["endpoint"],
+                    "method": r["method"],
+                    "status_class": r["status_class"],
+                    "count": r["count"],
+                    "sum": r["sum"],
+                    "min": r["min"],
+                    "max": r["max"],
+                    "sketch": r["sketch"],
+                }
+            )
+            pipeline.zadd(f"rollups:{r['resolution']}", {member: bucket})
+        await pipeline.execute()
 
-    async def query_http_metrics(
+    async def query_rollups(
         self,
+        resolution: int,
         from_time: datetime,
         to_time: datetime,
         endpoint: Optional[str] = None,
         method: Optional[str] = None,
-        group_by: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query HTTP metrics from Redis."""
-        # Determine which sorted set to query
+        """Query rollup rows from Redis with a single ZRANGEBYSCORE."""
+        members = await self.client.zrangebyscore(
+            f"rollups:{resolution}", from_time.timestamp(), to_time.timestamp()
+        )
+
+        rows = []
+        for member in members:
+            data = json.loads(member)
+            if endpoint and data["endpoint"] != endpoint:
+                continue
+            if method and data["method"] != method:
+                continue
+            del data["id"]
+            data["resolution"] = resolution
+            data["bucket"] = datetime.fromtimestamp(data["bucket"], tz=timezone.utc)
+            rows.append(data)
+        return rows
+
+    @staticmethod
+    def _http_key(endpoint: Optional[str], method: Optional[str]) -> str:
+        """Key read by HTTP metric queries with these filters."""
+        # Endpoint-specific sorted set when both filters are given
         if endpoint and method:
-            key = f"http:endpoint:{endpoint}:{method}"
-        else:
-            key = "http_metrics"
+            return f"http:endpoint:{endpoint}:{method}"
+        return "http_metrics"
+
+    @staticmethod
+    def _custom_key(name: Optional[str]) -> str:
+        """Key read by custom metric queries with this name filter."""
+        return f"custom:{name}" if name else "custom_metrics"
+
+    @staticmethod
+    def _parse_http(data: Dict[str, str]) -> Dict[str, Any]:
+        """HTTP metric row from its hash."""
+        return {
+            "timestamp": datetime.fromtimestamp(float(data["timestamp"])),
+            "endpoint": data["endpoint"],
+            "method": data["method"],
+            "status_code": int(data["status_code"]),
+            "latency_ms": float(data["latency_ms"]),
+            "labels": json.loads(data.get("labels", "{}")),
+            "weight": float(data.get("weight", 1.0)),
+        }
 
-        # Get metric IDs in time range
+    @staticmethod
+    def _parse_custom(data: Dict[str, str]) -> Dict[str, Any]:
+        """Custom metric row from its hash."""
+        return {
+            "timestamp": datetime.fromtimestamp(float(data["timestamp"])),
+            "name": data["name"],
+            "value": float(data["value"]),
+            "labels": json.loads(data.get("labels", "{}")),
+        }
+
+    async def _fetch(
+        self, key: str, from_time: datetime, to_time: datetime
+    ) -> List[Dict[str, str]]:
+        """Hashes of every member of ``key`` scored within the time range."""
         metric_ids = await self.client.zrangebyscore(
             key,
             from_time.timestamp(),
             to_time.timestamp(),
         )
-
         if not metric_ids:
             return []
 
@@ -186,52 +523,120 @@ class RedisStorage(StorageBackend):
         pipeline = self.client.pipeline()
         for metric_id in metric_ids:
             pipeline.hgetall(metric_id)
+        return [data for data in await pipeline.execute() if data]
 
-        results = await pipeline.execute()
+    async def _page(
+        self,
+        key: str,
+        from_time: datetime,
+        to_time: datetime,
+        parse: Callable[[Dict[str, str]], Optional[Dict[str, Any]]],
+        limit: int,
+        offset: int,
+        cursor: Optional[str],
+    ) -> Page:
+        """One page of the members of ``key``, oldest first.
+
+        Members are read in ``ZRANGEBYSCORE`` chunks of ``limit + 1``.
+        Cursors hold the score and id of the last member served. A page
+        continues from that score and skips the members at that score that
+        sort up to the id. ``parse`` returns None for rows that are
+        filtered out.
+        """
+        min_score, max_score = from_time.timestamp(), to_time.timestamp()
+        position = 0
+        if cursor:
+            after, after_id = decode_cursor(cursor)
+            offset = 0
+            if after >= min_score:
+                min_score = after
+                ties = await self.client.zrangebyscore(key, after, after)
+                position = sum(1 for member in ties if member <= after_id)
+
+        page = Page()
+        last = None
+        while True:
+            members = await self.client.zrangebyscore(
+                key, min_score, max_score, start=position, num=limit + 1, withscores=True
+            )
+            if not members:
+                return page
+            position += len(members)
 
-        # Parse results
-        metrics = []
-        for data in results:
-            if not data:
-                continue
+            pipeline = self.client.pipeline()
+            for member, _ in members:
+                pipeline.hgetall(member)
+            for (member, score), data in zip(members, await pipeline.execute()):
+                row = parse(data) if data else None
+                if row is None:
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                if len(page) >= limit:
+                    page.next_cursor = encode_cursor(last[1], last[0])
+                    return page
+                page.append(row)
+                last = (member, score)
 
-            metric = {
-                "timestamp": datetime.fromtimestamp(float(data["timestamp"])),
-                "endpoint": data["endpoint"],
-                "method": data["method"],
-                "status_code": int(data["status_code"]),
-                "latency_ms": float(data["latency_ms"]),
-                "labels": json.loads(data.get("labels", "{}")),
-            }
+            if len(members) <= limit:
+                return page
+
+    async def query_http_metrics(
+        self,
+        from_time: datetime,
+        to_time: datetime,
+        endpoint: Optional[str] = None,
+        method: Optional[str] = None,
+        group_by: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Query HTTP metrics from Redis, oldest first."""
+        key = self._http_key(endpoint, method)
 
+        def parse(data: Dict[str, str]) -> Optional[Dict[str, Any]]:
             # Apply filters
-            if endpoint and metric["endpoint"] != endpoint:
-                continue
-            if method and metric["method"] != method:
-                continue
+            if endpoint and data["endpoint"] != endpoint:
+                return None
+            if method and data["method"] != method:
+                return None
+            return self._parse_http(data)
 
-            metrics.append(metric)
+        if not group_by:
+            return await self._page(key, from_time, to_time, parse, limit, offset, cursor)
 
-        # Group by hour if requested
-        if group_by == "hour":
-            grouped = defaultdict(list)
+        metrics = [m for m in map(parse, await self._fetch(key, from_time, to_time)) if m]
 
-            for m in metrics:
-                hour_key = m["timestamp"].replace(minute=0, second=0, microsecond=0)
-                grouped[hour_key].append(m)
+        # Group into time buckets
+        width = bucket_seconds(group_by)
+        grouped = defaultdict(list)
 
-            return [
+        for m in metrics:
+            ts = m["timestamp"].timestamp()
+            grouped[ts - ts % width].append(m)
+
+        if fill_gaps:
+            starts = bucket_starts(from_time.timestamp(), to_time.timestamp(), width)
+            grouped = {k: grouped.get(k, []) for k in starts}
+
+        results = []
+        for k, v in sorted(grouped.items()):
+            count = sum(x["weight"] for x in v)
+            results.append(
                 {
-                    "timestamp": str(k),
-                    "count": len(v),
-                    "avg_latency_ms": sum(x["latency_ms"] for x in v) / len(v),
-                    "min_latency_ms": min(x["latency_ms"] for x in v),
-                    "max_latency_ms": max(x["latency_ms"] for x in v),
+                    "timestamp": str(datetime.fromtimestamp(k)),
+                    "count": round(count),
+                    "avg_latency_ms": (
+                        sum(x["latency_ms"] * x["weight"] for x in v) / count if v else None
+                    ),
+                    "min_latency_ms": min((x["latency_ms"] for x in v), default=None),
+                    "max_latency_ms": max((x["latency_ms"] for x in v), default=None),
                 }
-                for k, v in sorted(grouped.items())
-            ]
-
-        return metrics
+            )
+        return results[offset : offset + limit]
 
     async def query_errors(
         self, from_time: datetime, to_time: datetime, endpoint: Optional[str] = None
@@ -261,160 +666,469 @@ class RedisStorage(StorageBackend):
         to_time: datetime,
         name: Optional[str] = None,
         group_by: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query custom metrics from Redis."""
-        # Use name-specific key if provided
-        key = f"custom:{name}" if name else "custom_metrics"
-
-        # Get metric IDs
-        metric_ids = await self.client.zrangebyscore(
-            key,
-            from_time.timestamp(),
-            to_time.timestamp(),
-        )
-
-        if not metric_ids:
-            return []
-
-        # Fetch metrics
-        pipeline = self.client.pipeline()
-        for metric_id in metric_ids:
-            pipeline.hgetall(metric_id)
-
-        results = await pipeline.execute()
-
-        # Parse results
-        metrics = []
-        for data in results:
-            if not data:
-                continue
-
-            metric = {
-                "timestamp": datetime.fromtimestamp(float(data["timestamp"])),
-                "name": data["name"],
-                "value": float(data["value"]),
-                "labels": json.loads(data.get("labels", "{}")),
+        """Query custom metrics from Redis, oldest first."""
+        key = self._custom_key(name)
+
+        def parse(data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+            if name and data["name"] != name:
+                return None
+            return self._parse_custom(data)
+
+        if not group_by:
+            return await self._page(key, from_time, to_time, parse, limit, offset, cursor)
+
+        metrics = [m for m in map(parse, await self._fetch(key, from_time, to_time)) if m]
+
+        # Group into time buckets per metric name
+        width = bucket_seconds(group_by)
+        grouped = defaultdict(list)
+
+        for m in metrics:
+            ts = m["timestamp"].timestamp()
+            grouped[(ts - ts % width, m["name"])].append(m["value"])
+
+        if fill_gaps:
+            starts = bucket_starts(from_time.timestamp(), to_time.timestamp(), width)
+            names = sorted({m["name"] for m in metrics} or ([name] if name else []))
+            grouped = {(k, n): grouped.get((k, n), []) for k in starts for n in names}
+
+        results = [
+            {
+                "timestamp": str(datetime.fromtimestamp(k)),
+                "name": n,
+                "count": len(v),
+                "sum": sum(v),
+                "avg": sum(v) / len(v) if v else None,
             }
+            for (k, n), v in sorted(grouped.items())
+        ]
+        return results[offset : offset + limit]
 
-            if name and metric["name"] != name:
-                continue
-
-            metrics.append(metric)
-
-        # Group by hour
-        if group_by == "hour":
-            grouped = defaultdict(list)
-
-            for m in metrics:
-                hour_key = m["timestamp"].replace(minute=0, second=0, microsecond=0)
-                grouped[hour_key].append(m)
-
-            return [
-                {
-                    "timestamp": str(k),
-                    "name": v[0]["name"],
-                    "count": len(v),
-                    "sum": sum(x["value"] for x in v),
-                    "avg": sum(x["value"] for x in v) / len(v),
-                }
-                for k, v in sorted(grouped.items())
-            ]
-
-        return metrics
-
-    async def get_endpoint_stats(self) -> List[Dict[str, Any]]:
-        """Get aggregated statistics per endpoint."""
-        # Get all endpoint keys
-        endpoint_keys = []
-        cursor = "0"
-        max_iterations = 100  # Safety limit
-        iterations = 0
-
-        while iterations < max_iterations:
-            iterations += 1
-            cursor, keys = await self.client.scan(cursor, match="http:endpoint:*", count=100)
-            endpoint_keys.extend(keys)
-            if cursor in ("0", 0):
-                break
-
-        stats = []
-
-        for key in endpoint_keys:
-            # Parse endpoint and method from key
-            parts = key.split(":")
-            if len(parts) < 4:
-                continue
-
-            endpoint = parts[2]
-            method = parts[3]
-
-            # Get all metrics for this endpoint
-            metric_ids = await self.client.zrange(key, 0, -1)
-
-            if not metric_ids:
-                continue
-
-            # Fetch metrics
-            pipeline = self.client.pipeline()
-            for metric_id in metric_ids:
-                pipeline.hgetall(metric_id)
+    async def get_endpoint_stats(
+        self,
+        from_time: Optional[datetime] = None,
+        to_time: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """Get aggregated statistics per endpoint from the stats counters.
+
+        The minute holding ``from_time`` counts whole. Only the minutes
+        that were counted are read, one ``HGETALL`` each in a single round
+        trip. Their minimum and maximum latencies are those of the lowest
+        and highest sketch bins, within the sketch's relative accuracy.
+        The part of the range before ``stats:since`` is aggregated from the
+        stored records.
+        """
+        first = from_time.timestamp() // STATS_BUCKET * STATS_BUCKET if from_time else 0
+        last = to_time.timestamp() if to_time else float("inf")
+        since = await self.client.get("stats:since")
+        since = int(since) if since else 0
+        minutes = await self.client.zrangebyscore("stats:m", max(first, since), last)
+
+        pipeline = self.client.pipeline(transaction=False)
+        for minute in minutes:
+            pipeline.hgetall(f"stats:m:{minute}")
+
+        sketches: Dict[Tuple[str, str], DDSketch] = defaultdict(DDSketch)
+        errors: Dict[Tuple[str, str], float] = defaultdict(float)
+        for counters in await pipeline.execute():
+            for field, value in counters.items():
+                method, rest = field.split("\t", 1)
+                endpoint, stat = rest.rsplit("\t", 1)
+                sketch, value = sketches[(endpoint, method)], float(value)
+                if stat == "n":
+                    sketch.count += value
+                elif stat == "s":
+                    sketch.sum += value
+                elif stat == "e":
+                    errors[(endpoint, method)] += value
+                elif stat == "z":
+                    sketch.zero_count += value
+                else:
+                    index = int(stat[1:])
+                    sketch.bins[index] = sketch.bins.get(index, 0.0) + value
+        for sketch in sketches.values():
+            sketch.min = 0.0 if sketch.zero_count else sketch.value(min(sketch.bins, default=0))
+            sketch.max = sketch.value(max(sketch.bins)) if sketch.bins else 0.0
+
+        if first < since:
+            records = await self._fetch(
+                self._http_key(None, None),
+                datetime.fromtimestamp(first, tz=timezone.utc),
+                datetime.fromtimestamp(min(last, since - 0.001), tz=timezone.utc),
+            )
+            for data in records:
+                key = (data["endpoint"], data["method"])
+                weight = float(data.get("weight", 1.0))
+                sketches[key].add(float(data["latency_ms"]), weight)
+                if int(data["status_code"]) >= 400:
+                    errors[key] += weight
+
+        return [
+            self._endpoint_stat(endpoint, method, sketch, errors[(endpoint, method)])
+            for (endpoint, method), sketch in sketches.items()
+            if sketch.count
+        ]
+
+    @staticmethod
+    def _endpoint_stat(
+        endpoint: str, method: str, latencies: DDSketch, error_count: float
+    ) -> Dict[str, Any]:
+        """Statistics row of one endpoint from its latency sketch and error weight."""
+        count = latencies.count
+        return {
+            "endpoint": endpoint,
+            "method": method,
+            "count": round(count),
+            "avg_latency_ms": latencies.sum / count,
+            "min_latency_ms": latencies.min,
+            "max_latency_ms": latencies.max,
+            "p50_latency_ms": latencies.quantile(0.50),
+            "p95_latency_ms": latencies.quantile(0.95),
+            "p99_latency_ms": latencies.quantile(0.99),
+            "error_rate": error_count / count if count > 0 else 0,
+        }
 
-            results = await pipeline.execute()
+    async def cleanup_old_data(self, before: datetime) -> int:
+        """Remove data older than specified datetime.
 
-            latencies = []
-            error_count = 0
+        Metric hashes, their time, endpoint and name indexes, errors last
+        seen before ``before``, rollups and ended stats buckets are removed
+        by an incremental sweep (see ``_sweep``). Returns the number of
+        metrics and errors deleted.
+        """
+        timestamp = before.timestamp()
+        plan = [
+            ("http_metrics", timestamp, self._member_key, "members"),
+            ("custom_metrics", timestamp, self._member_key, "members"),
+        ]
+        # Endpoint and name indexes only reference hashes deleted above
+        indexes = sorted(await self._indexes())
+        for key in indexes:
+            plan.append((key, timestamp, None, None))
+        deleted = await self._sweep(plan + self._aggregate_plan(timestamp))
+
+        # Forget the indexes the sweep emptied; a later write to one of
+        # them registers it again
+        if indexes:
+            pipeline = self.client.pipeline(transaction=False)
+            for key in indexes:
+                pipeline.zcard(key)
+            empty = [key for key, size in zip(indexes, await pipeline.execute()) if not size]
+            if empty:
+                await self.client.srem(INDEX_REGISTRY, *empty)
+        return deleted
 
-            for data in results:
-                if not data:
+    async def _indexes(self) -> Set[str]:
+        """Endpoint and metric name index keys, from ``INDEX_REGISTRY``.
+
+        A database written before the registry existed has its indexes
+        found by one scan, after which ``metric_indexes:scanned`` is set:
+        each page of keys has its types checked in one round trip, and
+        per-event custom hashes (``custom:{name}:{ts}``) are skipped.
+        """
+        if await self.client.exists(f"{INDEX_REGISTRY}:scanned"):
+            return await self.client.smembers(INDEX_REGISTRY)
+
+        for pattern in ("http:endpoint:*", "custom:*"):
+            cursor = None
+            while cursor != 0:
+                cursor, keys = await self.client.scan(cursor or 0, match=pattern, count=1000)
+                keys = [key for key in keys if not _EVENT_KEY.search(key)]
+                if not keys:
                     continue
+                pipeline = self.client.pipeline(transaction=False)
+                for key in keys:
+                    pipeline.type(key)
+                indexes = [k for k, kind in zip(keys, await pipeline.execute()) if kind == "zset"]
+                if indexes:
+                    await self.client.sadd(INDEX_REGISTRY, *indexes)
+        await self.client.set(f"{INDEX_REGISTRY}:scanned", 1)
+        return await self.client.smembers(INDEX_REGISTRY)
+
+    @staticmethod
+    def _member_key(member: str) -> Tuple[str, ...]:
+        """Keys to delete with an index member that is itself a key."""
+        return (member,)
+
+    def _aggregate_plan(self, timestamp: float) -> List[SweepStep]:
+        """Sweep steps for errors, rollups and stats buckets older than ``timestamp``.
+
+        Errors are indexed by their last occurrence. Rollups go when their
+        bucket starts before ``timestamp``, stats buckets once they have
+        ended. Rollups and stats are derived data and not counted as
+        deleted records.
+        """
+        plan: List[SweepStep] = [("errors:timeline", timestamp, self._member_key, "members")]
+        plan += [(f"rollups:{r}", f"({timestamp}", None, None) for r in RESOLUTIONS]
+        plan.append(
+            ("stats:m", timestamp - STATS_BUCKET, lambda start: (f"stats:m:{start}",), None)
+        )
+        return plan
+
+    async def _sweep(self, plan: List[SweepStep]) -> int:
+        """Remove old index members and their keys in bounded chunks.
+
+        Each step is ``(index, max_score, keys_of, count)``: members of the
+        sorted set ``index`` scored up to ``max_score`` are removed
+        ``sweep_chunk_size`` at a time, with the keys ``keys_of`` maps them
+        to unlinked in the same pipeline, and the sweep pauses
+        ``sweep_pause_ms`` between full chunks so Redis never serves one
+        large deletion. Progress is the indexes themselves: an interrupted
+        sweep resumes where it stopped on the next run.
+
+        ``count`` is ``"members"`` to count removed members as deleted
+        records, ``"lists"`` to count the elements of the unlinked lists,
+        or None. ``sweep_backlog`` holds the members still to remove.
+        """
+        pipeline = self.client.pipeline(transaction=False)
+        for index, max_score, _, _ in plan:
+            pipeline.zcount(index, "-inf", max_score)
+        self.sweep_backlog = sum(await pipeline.execute())
 
-                latencies.append(float(data["latency_ms"]))
-                if int(data["status_code"]) >= 400:
-                    error_count += 1
-
-            if not latencies:
-                continue
-
-            latencies.sort()
-            count = len(latencies)
+        deleted = 0
+        for index, max_score, keys_of, count in plan:
+            while True:
+                members = await self.client.zrangebyscore(
+                    index, "-inf", max_score, start=0, num=self.sweep_chunk_size
+                )
+                if not members:
+                    break
+
+                keys = [key for member in members for key in keys_of(member)] if keys_of else []
+                pipeline = self.client.pipeline(transaction=False)
+                if count == "lists":
+                    for key in keys:
+                        pipeline.llen(key)
+                if keys:
+                    pipeline.unlink(*keys)
+                pipeline.zrem(index, *members)
+                results = await pipeline.execute()
+
+                if count == "lists":
+                    deleted += sum(results[: len(keys)])
+                elif count == "members":
+                    deleted += len(members)
+                self.swept += len(members)
+                self.sweep_backlog = max(self.sweep_backlog - len(members), 0)
+                if len(members) < self.sweep_chunk_size:
+                    break
+                await asyncio.sleep(self.sweep_pause_ms / 1000)
+        return deleted
 
-            stats.append(
-                {
-                    "endpoint": endpoint,
-                    "method": method,
-                    "count": count,
-                    "avg_latency_ms": sum(latencies) / count,
-                    "min_latency_ms": min(latencies),
-                    "max_latency_ms": max(latencies),
-                    "error_rate": error_count / count if count > 0 else 0,
-                }
+    def stats(self) -> Dict[str, Any]:
+        """Progress counters of the retention sweep."""
+        return {"sweep_backlog": self.sweep_backlog, "swept": self.swept}
+
+
+class PackedRedisStorage(RedisStorage):
+    """Redis storage keeping HTTP and custom metrics in per-minute lists.
+
+    ``RedisStorage`` writes one hash per event plus members in two sorted
+    sets, several hundred bytes per request, and events with the same
+    timestamp overwrite each other. Here each event is one tab-separated
+    record appended to the list of its minute (``packed:http:{minute}``),
+    which Redis stores as a compact listpack; the list expires as a whole
+    and is registered once in a bucket index (``packed:http:buckets``).
+
+    Reads fetch the non-empty minutes of a range from the index and then
+    each minute's list with one ``LRANGE``, so a query costs commands per
+    bucket rather than per event. Pages read a growing window of minutes,
+    starting with one, and stop once the page is full. Endpoint, method and
+    name filters are applied to the decoded records. Retention drops whole minutes. Endpoint
+    stats come from the same counters as in ``RedisStorage``.
+    """
+
+    HTTP = "packed:http"
+    CUSTOM = "packed:custom"
+    BUCKET_SECONDS = 60
+    # Most minute lists read per pipeline round trip
+    READ_BUCKETS = 60
+
+    @classmethod
+    def _http_key(cls, endpoint: Optional[str], method: Optional[str]) -> str:
+        """All HTTP records share one bucket family; filters apply on read."""
+        return cls.HTTP
+
+    @classmethod
+    def _custom_key(cls, name: Optional[str]) -> str:
+        """All custom metrics share one bucket family; filters apply on read."""
+        return cls.CUSTOM
+
+    @classmethod
+    def _append(cls, pipeline: Any, key: str, ts_ms: int, record: str) -> None:
+        """Queue appending ``record`` to its minute list and indexing the minute."""
+        minute = ts_ms // 1000 // cls.BUCKET_SECONDS * cls.BUCKET_SECONDS
+        bucket = f"{key}:{minute}"
+        pipeline.rpush(bucket, record)
+        pipeline.expireat(bucket, minute + cls.BUCKET_SECONDS + METRIC_TTL)
+        pipeline.zadd(f"{key}:buckets", {minute: minute})
+
+    @classmethod
+    def _queue_http_record(cls, pipeline: Any, m: Dict[str, Any]) -> None:
+        """Queue appending one HTTP metric record.
+
+        Fields are timestamp_ms, method, status, latency, weight, labels and
+        endpoint; the endpoint goes last so it may contain any character.
+        """
+        ts_ms = int(m["timestamp"].timestamp() * 1000)
+        labels = m.get("labels")
+        record = "\t".join(
+            (
+                str(ts_ms),
+                m["method"],
+                str(m["status_code"]),
+                repr(float(m["latency_ms"])),
+                repr(float(m.get("weight", 1.0))),
+                _labels_json(labels),
+                m["endpoint"],
             )
-
-        return stats
+        )
+        cls._append(pipeline, cls.HTTP, ts_ms, record)
+
+    @classmethod
+    def _queue_custom(cls, pipeline: Any, m: Dict[str, Any]) -> None:
+        """Queue appending one custom metric record (timestamp_ms, value, labels, name)."""
+        ts_ms = int(m["timestamp"].timestamp() * 1000)
+        labels = m.get("labels")
+        record = "\t".join(
+            (
+                str(ts_ms),
+                repr(float(m["value"])),
+                _labels_json(labels),
+                m["name"],
+            )
+        )
+        cls._append(pipeline, cls.CUSTOM, ts_ms, record)
+
+    @classmethod
+    def _unpack(cls, key: str, record: str) -> Tuple[int, Dict[str, Any]]:
+        """Timestamp in milliseconds and hash-like fields of a packed record."""
+        if key == cls.HTTP:
+            ts_ms, method, status, latency, weight, labels, endpoint = record.split("\t", 6)
+            data = {
+                "endpoint": endpoint,
+                "method": method,
+                "status_code": status,
+                "latency_ms": latency,
+                "weight": weight,
+            }
+        else:
+            ts_ms, value, labels, name = record.split("\t", 3)
+            data = {"name": name, "value": value}
+        data["timestamp"] = int(ts_ms) / 1000
+        data["labels"] = labels or "{}"
+        return int(ts_ms), data
+
+    async def _buckets(self, key: str, from_ms: float, to_ms: float) -> List[int]:
+        """Indexed minutes overlapping ``[from_ms, to_ms]``, oldest first."""
+        first = from_ms // 1000 // self.BUCKET_SECONDS * self.BUCKET_SECONDS
+        members = await self.client.zrangebyscore(f"{key}:buckets", first, to_ms / 1000)
+        return [int(m) for m in members]
+
+    async def _records(self, key: str, buckets: List[int]) -> List[Tuple[int, int, Dict[str, Any]]]:
+        """``(timestamp_ms, position, fields)`` of every record in ``buckets``.
+
+        Records are sorted by timestamp; the position in the minute list
+        breaks ties.
+        """
+        pipeline = self.client.pipeline(transaction=False)
+        for minute in buckets:
+            pipeline.lrange(f"{key}:{minute}", 0, -1)
+        records = []
+        for entries in await pipeline.execute():
+            for position, record in enumerate(entries):
+                ts_ms, data = self._unpack(key, record)
+                records.append((ts_ms, position, data))
+        records.sort(key=lambda r: (r[0], r[1]))
+        return records
+
+    async def _fetch(
+        self, key: str, from_time: datetime, to_time: datetime
+    ) -> List[Dict[str, Any]]:
+        """Fields of every record of ``key`` within the time range."""
+        from_ms, to_ms = from_time.timestamp() * 1000, to_time.timestamp() * 1000
+        buckets = await self._buckets(key, from_ms, to_ms)
+        rows = []
+        for i in range(0, len(buckets), self.READ_BUCKETS):
+            for ts_ms, _, data in await self._records(key, buckets[i : i + self.READ_BUCKETS]):
+                if from_ms <= ts_ms <= to_ms:
+                    rows.append(data)
+        return rows
+
+    async def _page(
+        self,
+        key: str,
+        from_time: datetime,
+        to_time: datetime,
+        parse: Callable[[Dict[str, str]], Optional[Dict[str, Any]]],
+        limit: int,
+        offset: int,
+        cursor: Optional[str],
+    ) -> Page:
+        """One page of records, oldest first.
+
+        Minutes are taken from the index one window at a time, doubling
+        the window up to ``READ_BUCKETS``, so a small page reads only the
+        minutes it needs. Cursors hold the timestamp of the last record
+        served and its position in its minute list.
+        """
+        from_ms, to_ms = from_time.timestamp() * 1000, to_time.timestamp() * 1000
+        after = None
+        if cursor:
+            after = decode_cursor(cursor)
+            from_ms = max(from_ms, after[0])
+            offset = 0
+
+        page = Page()
+        last = None
+        first = from_ms // 1000 // self.BUCKET_SECONDS * self.BUCKET_SECONDS
+        start, window = 0, 1
+        while True:
+            members = await self.client.zrangebyscore(
+                f"{key}:buckets", first, to_ms / 1000, start=start, num=window
+            )
+            if not members:
+                return page
+            start += len(members)
+            buckets = [int(m) for m in members]
+            for ts_ms, position, data in await self._records(key, buckets):
+                if not from_ms <= ts_ms <= to_ms or (after and (ts_ms, position) <= after):
+                    continue
+                row = parse(data)
+                if row is None:
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                if len(page) >= limit:
+                    page.next_cursor = encode_cursor(*last)
+                    return page
+                page.append(row)
+                last = (ts_ms, position)
+            if len(members) < window:
+                return page
+            window = min(window * 2, self.READ_BUCKETS)
 
     async def cleanup_old_data(self, before: datetime) -> int:
-        """Remove data older than specified datetime."""
-        timestamp = before.timestamp()
-        deleted = 0
-
-        # Clean HTTP metrics
-        http_ids = await self.client.zrangebyscore("http_metrics", "-inf", timestamp)
-        if http_ids:
-            pipeline = self.client.pipeline()
-            for metric_id in http_ids:
-                pipeline.delete(metric_id)
-            pipeline.zremrangebyscore("http_metrics", "-inf", timestamp)
-            await pipeline.execute()
-            deleted += len(http_ids)
-
-        # Clean custom metrics
-        custom_ids = await self.client.zrangebyscore("custom_metrics", "-inf", timestamp)
-        if custom_ids:
-            pipeline = self.client.pipeline()
-            for metric_id in custom_ids:
-                pipeline.delete(metric_id)
-            pipeline.zremrangebyscore("custom_metrics", "-inf", timestamp)
-            await pipeline.execute()
-            deleted += len(custom_ids)
+        """Drop the minute lists that end before ``before``.
 
-        return deleted
+        The minute containing ``before`` is kept whole until a later run.
+        Lists, errors and derived data are removed by the same
+        incremental sweep as in ``RedisStorage``.
+        """
+        timestamp = before.timestamp()
+        plan: List[SweepStep] = [
+            (
+                f"{key}:buckets",
+                timestamp - self.BUCKET_SECONDS,
+                lambda minute, key=key: (f"{key}:{minute}",),
+                "lists",
+            )
+            for key in (self.HTTP, self.CUSTOM)
+        ]
+        return await self._sweep(plan + self._aggregate_plan(timestamp))
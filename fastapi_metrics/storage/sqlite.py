@@ -1,26 +1,512 @@
 """SQLite storage backend for FastAPI Metrics."""
 
+import asyncio
 import datetime
 import json
-from typing import Any, Dict, List, Optional
+import logging
+import re
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from pathlib import Path
 import aiosqlite
 
-from .base import StorageBackend
+from ..sketch import DDSketch
+from .base import (
+    Page,
+    StorageBackend,
+    bucket_seconds,
+    bucket_starts,
+    decode_cursor,
+    encode_cursor,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _LatencySketch:
+    """SQL aggregate ``latency_sketch(value, weight)``.
+
+    Folds the values of a group into a DDSketch and returns it as JSON, so
+    percentiles are computed inside SQLite and only one small sketch per
+    group leaves the database.
+    """
+
+    def __init__(self) -> None:
+        self.sketch = DDSketch()
+
+    def step(self, value: Optional[float], weight: Optional[float]) -> None:
+        """Add one row of the group."""
+        if value is not None:
+            self.sketch.add(value, 1.0 if weight is None else weight)
+
+    def finalize(self) -> str:
+        """Serialised sketch of the group."""
+        return json.dumps(self.sketch.to_dict())
+
+
+def _bucket_label(start: float) -> str:
+    """UTC label of a time bucket starting at ``start`` seconds."""
+    return datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+
+
+def _sketch_sql(latency: str, weight: str, aggregate: bool) -> str:
+    """SQL collecting a group's latencies: a sketch, or ``latency:weight`` pairs."""
+    if aggregate:
+        return f"latency_sketch({latency}, {weight})"
+    return f"GROUP_CONCAT({latency} || ':' || {weight}, ',')"
+
+
+def _percentiles(sketch_json: Optional[str]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99 fields of a ``latency_sketch`` or ``_sketch_sql`` result."""
+    if sketch_json and not sketch_json.startswith("{"):
+        sketch = DDSketch()
+        for pair in sketch_json.split(","):
+            latency, weight = pair.split(":")
+            sketch.add(float(latency), float(weight))
+    else:
+        sketch = DDSketch.from_dict(json.loads(sketch_json)) if sketch_json else DDSketch()
+    return {
+        "p50_latency_ms": sketch.quantile(0.50),
+        "p95_latency_ms": sketch.quantile(0.95),
+        "p99_latency_ms": sketch.quantile(0.99),
+    }
 
 
 class SQLiteStorage(StorageBackend):
-    """SQLite storage backend for persistent metrics."""
+    """SQLite storage backend for persistent metrics.
+
+    ``conn`` is the single writer connection used for inserts, deletes and
+    schema changes. Queries go through a pool of ``read_pool_size``
+    read-only connections; in WAL mode readers and the writer do not block
+    each other, so dashboard reads run concurrently with ingest. An
+    in-memory database (``":memory:"``) cannot be shared and reads use the
+    writer connection.
+
+    Aggregations (endpoint stats, bucketed series) and scans of more than
+    ``ANALYTICS_LIMIT`` rows go to a separate pool of
+    ``analytics_pool_size`` connections, so a long report cannot take every
+    reader away from short dashboard queries. Each connection runs on its
+    own aiosqlite thread and SQLite releases the GIL while it executes, so
+    the pools and the writer make progress in parallel. With
+    ``analytics_pool_size=0`` analytical queries share the read pool.
+
+    With ``commit_batch_size`` set, single-event writes are group-committed:
+    HTTP and custom metric rows are buffered and written with one
+    ``executemany`` and one commit once ``commit_batch_size`` rows are
+    pending or ``commit_interval_ms`` has passed since the first of them,
+    whichever comes first. Errors are written immediately but committed
+    with the same transaction. Pending rows are not visible to queries
+    until then; ``flush()`` writes them out explicitly and ``close()``
+    flushes before closing.
+
+    With ``partition_by`` set to ``"hour"`` or ``"day"``, HTTP and custom
+    metric rows are written to one table per time partition (e.g.
+    ``http_requests_20240131``). Queries union only the partitions that
+    overlap their time range, and retention drops whole partitions instead
+    of deleting rows; freed pages are returned to the file system by an
+    incremental vacuum. Existing partitions are always read, so a database
+    written with partitioning can be queried by any instance.
+
+    HTTP rows are stored compactly: timestamps as integer milliseconds and
+    endpoint and method as integer ids into the ``endpoints`` and
+    ``http_methods`` dimension tables. Ids are cached in-process by the
+    writer; queries join the names back in. Labels mostly carry per-request
+    values such as request ids, so they are stored inline rather than
+    interned. Cleanup removes endpoints no longer referenced by any row.
+    """
+
+    # Performance profile applied to every connection; journal_mode and
+    # auto_vacuum are properties of the database file and are only set by
+    # the writer (auto_vacuum only takes effect on a new database)
+    PRAGMAS: Dict[str, Any] = {
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # negative = KiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    }
+
+    _WRITER_PRAGMAS = ("auto_vacuum", "journal_mode")
+
+    # Partition interval -> (seconds, table name suffix format)
+    PARTITION_INTERVALS: Dict[str, Tuple[int, str]] = {
+        "hour": (3600, "%Y%m%d%H"),
+        "day": (86400, "%Y%m%d"),
+    }
+
+    # Row columns of the tables that can be partitioned
+    _COLUMNS = {
+        "http_requests": (
+            "timestamp_ms, endpoint_id, method_id, status_code, latency_ms, weight, labels"
+        ),
+        "custom_metrics": "timestamp, name, value, labels",
+    }
+    # Timestamp column and its units per second
+    _TIME_COLUMNS = {"http_requests": ("timestamp_ms", 1000), "custom_metrics": ("timestamp", 1)}
+    _PARTITION_SCHEMAS = {
+        "http_requests": """
+            CREATE TABLE IF NOT EXISTS {name} (
+                timestamp_ms INTEGER NOT NULL,
+                endpoint_id INTEGER NOT NULL,
+                method_id INTEGER NOT NULL,
+                status_code INTEGER NOT NULL,
+                latency_ms REAL NOT NULL,
+                weight REAL NOT NULL DEFAULT 1.0,
+                labels TEXT
+            )
+        """,
+        "custom_metrics": """
+            CREATE TABLE IF NOT EXISTS {name} (
+                timestamp REAL NOT NULL,
+                name TEXT NOT NULL,
+                value REAL NOT NULL,
+                labels TEXT
+            )
+        """,
+    }
+    # Index suffix -> columns, matching the indexes of the base tables
+    _PARTITION_INDEXES = {
+        "http_requests": {
+            "ts_covering": "timestamp_ms, endpoint_id, method_id, status_code, latency_ms, weight",
+            "endpoint_method_ts": "endpoint_id, method_id, timestamp_ms",
+        },
+        "custom_metrics": {"timestamp": "timestamp", "name_ts": "name, timestamp"},
+    }
+
+    # Dimension tables of the compact HTTP schema -> value column
+    _DIMENSIONS = {"endpoints": "endpoint", "http_methods": "method"}
+
+    # Schema migrations, applied in order on startup. The database's
+    # PRAGMA user_version records how many of them have run. Statements
+    # using {http_requests} run for the base table and each of its
+    # partitions.
+    _MIGRATIONS: Tuple[Tuple[str, ...], ...] = (
+        # 1: time range index covering the columns endpoint stats and hourly
+        # series aggregate, composite indexes for filtered queries, one row
+        # per error fingerprint
+        (
+            "DROP INDEX IF EXISTS idx_http_timestamp",
+            """
+            CREATE INDEX IF NOT EXISTS idx_http_ts_covering
+            ON http_requests(timestamp, endpoint, method, status_code, latency_ms, weight)
+            """,
+            "DROP INDEX IF EXISTS idx_http_endpoint",
+            """
+            CREATE INDEX IF NOT EXISTS idx_http_endpoint_method_ts
+            ON http_requests(endpoint, method, timestamp)
+            """,
+            "DROP INDEX IF EXISTS idx_custom_name",
+            "CREATE INDEX IF NOT EXISTS idx_custom_name_ts ON custom_metrics(name, timestamp)",
+            """
+            UPDATE errors SET
+                count = (SELECT SUM(e.count) FROM errors e WHERE e.error_hash = errors.error_hash),
+                first_seen = (
+                    SELECT MIN(e.first_seen) FROM errors e WHERE e.error_hash = errors.error_hash
+                ),
+                last_seen = (
+                    SELECT MAX(e.last_seen) FROM errors e WHERE e.error_hash = errors.error_hash
+                )
+            WHERE id IN (SELECT MIN(id) FROM errors GROUP BY error_hash HAVING COUNT(*) > 1)
+            """,
+            "DELETE FROM errors WHERE id NOT IN (SELECT MIN(id) FROM errors GROUP BY error_hash)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_errors_hash ON errors(error_hash)",
+            "CREATE INDEX IF NOT EXISTS idx_errors_timestamp ON errors(timestamp)",
+        ),
+        # 2: compact HTTP rows: integer millisecond timestamps, endpoint
+        # and method moved to dimension tables. Labels mostly carry
+        # per-request ids, so they stay inline
+        (
+            "CREATE TABLE endpoints (id INTEGER PRIMARY KEY, endpoint TEXT NOT NULL UNIQUE)",
+            "CREATE TABLE http_methods (id INTEGER PRIMARY KEY, method TEXT NOT NULL UNIQUE)",
+            """
+            INSERT INTO http_methods (id, method) VALUES
+                (1, 'GET'), (2, 'POST'), (3, 'PUT'), (4, 'PATCH'), (5, 'DELETE'),
+                (6, 'HEAD'), (7, 'OPTIONS'), (8, 'TRACE'), (9, 'CONNECT')
+            """,
+            """
+            INSERT OR IGNORE INTO endpoints (endpoint)
+            SELECT DISTINCT endpoint FROM {http_requests}
+            """,
+            """
+            INSERT OR IGNORE INTO http_methods (method)
+            SELECT DISTINCT method FROM {http_requests}
+            """,
+            """
+            CREATE TABLE {http_requests}_compact (
+                timestamp_ms INTEGER NOT NULL,
+                endpoint_id INTEGER NOT NULL,
+                method_id INTEGER NOT NULL,
+                status_code INTEGER NOT NULL,
+                latency_ms REAL NOT NULL,
+                weight REAL NOT NULL DEFAULT 1.0,
+                labels TEXT
+            )
+            """,
+            """
+            INSERT INTO {http_requests}_compact
+            SELECT CAST(r.timestamp * 1000 AS INTEGER), e.id, m.id, r.status_code,
+                r.latency_ms, r.weight, r.labels
+            FROM {http_requests} r
+            JOIN endpoints e ON e.endpoint = r.endpoint
+            JOIN http_methods m ON m.method = r.method
+            ORDER BY r.timestamp
+            """,
+            "DROP TABLE {http_requests}",
+            "ALTER TABLE {http_requests}_compact RENAME TO {http_requests}",
+            """
+            CREATE INDEX idx_{http_requests}_ts_covering ON {http_requests}(
+                timestamp_ms, endpoint_id, method_id, status_code, latency_ms, weight
+            )
+            """,
+            """
+            CREATE INDEX idx_{http_requests}_endpoint_method_ts
+            ON {http_requests}(endpoint_id, method_id, timestamp_ms)
+            """,
+        ),
+    )
+
+    # Raw row queries asking for more rows than this count as analytical
+    ANALYTICS_LIMIT = 10_000
+
+    def __init__(
+        self,
+        db_path: str = "metrics.db",
+        read_pool_size: int = 2,
+        analytics_pool_size: int = 1,
+        pragmas: Optional[Dict[str, Any]] = None,
+        commit_batch_size: Optional[int] = None,
+        commit_interval_ms: float = 100.0,
+        partition_by: Optional[str] = None,
+    ):
+        if commit_batch_size is not None and commit_batch_size < 1:
+            raise ValueError("Commit batch size must be at least 1")
+        if partition_by is not None and partition_by not in self.PARTITION_INTERVALS:
+            raise ValueError(f"Unknown partition interval: {partition_by}")
 
-    def __init__(self, db_path: str = "metrics.db"):
         self.db_path = db_path
+        self.read_pool_size = read_pool_size
+        self.analytics_pool_size = analytics_pool_size
+        self.pragmas = {**self.PRAGMAS, **(pragmas or {})}
+        self.commit_batch_size = commit_batch_size
+        self.commit_interval_ms = commit_interval_ms
+        self.partition_by = partition_by
         self.conn: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._read_pool: Optional[asyncio.Queue] = None
+        self._analytics_pool: Optional[asyncio.Queue] = None
+        # Group commit state: buffered rows, uncommitted error writes and
+        # the timer that flushes them
+        self._pending_http: List[tuple] = []
+        self._pending_custom: List[tuple] = []
+        self._pending_errors = 0
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set = set()
+        # table -> partition table name -> (start, end) timestamps
+        self._partitions: Dict[str, Dict[str, Tuple[float, float]]] = {
+            table: {} for table in self._COLUMNS
+        }
+        # Whether every connection has the latency_sketch aggregate
+        self._sketch_aggregate = True
+        # dimension table -> value -> id
+        self._dimension_ids: Dict[str, Dict[str, int]] = {table: {} for table in self._DIMENSIONS}
+        # Held while ids are encoded and inserted, and while cleanup prunes
+        # unreferenced dimension rows, so no row is written with a pruned id
+        self._dimension_lock: Optional[asyncio.Lock] = None
+
+    async def _apply_pragmas(self, conn: aiosqlite.Connection, writer: bool) -> None:
+        """Apply the performance profile to a connection."""
+        for name, value in self.pragmas.items():
+            if name in self._WRITER_PRAGMAS and not writer:
+                continue
+            await conn.execute(f"PRAGMA {name}={value}")
+
+    @staticmethod
+    async def _register_functions(conn: aiosqlite.Connection) -> bool:
+        """Register the SQL functions used by the queries.
+
+        Returns False when the ``latency_sketch`` aggregate could not be
+        registered; queries then fold latencies into sketches in Python.
+        """
+        # aiosqlite has no create_aggregate wrapper; run it on the
+        # connection's thread like its create_function does. This relies on
+        # aiosqlite internals, so a release that changes them only costs
+        # the in-database aggregation.
+        try:
+            run = conn._execute
+            create_aggregate = conn._conn.create_aggregate
+            await run(create_aggregate, "latency_sketch", 2, _LatencySketch)
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning("Cannot register latency_sketch, using the Python fallback: %s", e)
+            return False
+        return True
+
+    async def _open_pool(self, size: int) -> Optional[asyncio.Queue]:
+        """Open ``size`` read-only connections into a pool."""
+        if size < 1 or self.db_path in ("", ":memory:"):
+            return None
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        pool: asyncio.Queue = asyncio.Queue()
+        for _ in range(size):
+            reader = await aiosqlite.connect(uri, uri=True)
+            await self._apply_pragmas(reader, writer=False)
+            self._sketch_aggregate &= await self._register_functions(reader)
+            self._readers.append(reader)
+            pool.put_nowait(reader)
+        return pool
+
+    async def _open_readers(self) -> None:
+        """Open the read-only and analytics connection pools."""
+        self._read_pool = await self._open_pool(self.read_pool_size)
+        self._analytics_pool = await self._open_pool(self.analytics_pool_size)
+
+    @asynccontextmanager
+    async def _reader(self, analytics: bool = False) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read-only connection (the writer if there is no pool).
+
+        ``analytics`` queries use the analytics pool when there is one.
+        """
+        if self.conn is None:
+            await self.initialize()
+        pool = (analytics and self._analytics_pool) or self._read_pool
+        if pool is None:
+            yield self.conn
+            return
+        reader = await pool.get()
+        try:
+            yield reader
+        finally:
+            pool.put_nowait(reader)
+
+    async def _migrate(self) -> None:
+        """Apply the schema migrations the database has not seen yet."""
+        cursor = await self.conn.execute("PRAGMA user_version")
+        (version,) = await cursor.fetchone()
+        for target, statements in enumerate(self._MIGRATIONS[version:], start=version + 1):
+            await self.conn.execute("BEGIN")
+            for statement in statements:
+                if "{http_requests}" not in statement:
+                    await self.conn.execute(statement)
+                    continue
+                for table in ["http_requests", *self._partitions["http_requests"]]:
+                    await self.conn.execute(statement.format(http_requests=table))
+            await self.conn.execute(f"PRAGMA user_version = {target}")
+            await self.conn.commit()
+
+    async def _load_partitions(self) -> None:
+        """Discover the partition tables present in the database."""
+        cursor = await self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        for (name,) in await cursor.fetchall():
+            for table, partitions in self._partitions.items():
+                match = re.fullmatch(rf"{table}_(\d{{8}}|\d{{10}})", name)
+                if not match:
+                    continue
+                span, fmt = self.PARTITION_INTERVALS["hour" if len(match[1]) == 10 else "day"]
+                start = (
+                    datetime.datetime.strptime(match[1], fmt)
+                    .replace(tzinfo=datetime.timezone.utc)
+                    .timestamp()
+                )
+                partitions[name] = (start, start + span)
+
+    async def _load_dimensions(self) -> None:
+        """Cache the ids of the dimension tables."""
+        for table, column in self._DIMENSIONS.items():
+            cursor = await self.conn.execute(f"SELECT id, {column} FROM {table}")
+            self._dimension_ids[table] = {value: ident for ident, value in await cursor.fetchall()}
+
+    async def _dimension_id(self, table: str, value: str) -> int:
+        """Id of ``value`` in a dimension table, adding it when new."""
+        ids = self._dimension_ids[table]
+        ident = ids.get(value)
+        if ident is None:
+            column = self._DIMENSIONS[table]
+            await self.conn.execute(
+                f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,)
+            )
+            cursor = await self.conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,))
+            ident = ids[value] = (await cursor.fetchone())[0]
+        return ident
+
+    async def _encode_http(self, rows: List[tuple]) -> List[tuple]:
+        """Convert HTTP rows to the compact column layout."""
+        return [
+            (
+                int(ts * 1000),
+                await self._dimension_id("endpoints", endpoint),
+                await self._dimension_id("http_methods", method),
+                status_code,
+                latency_ms,
+                weight,
+                labels,
+            )
+            for ts, endpoint, method, status_code, latency_ms, labels, weight in rows
+        ]
+
+    async def _insert(self, table: str, rows: List[tuple]) -> None:
+        """Insert rows into ``table``, or into their time partitions."""
+        if table == "http_requests":
+            async with self._dimension_lock:
+                await self._write_rows(table, await self._encode_http(rows))
+            return
+        await self._write_rows(table, rows)
+
+    async def _write_rows(self, table: str, rows: List[tuple]) -> None:
+        """Insert rows already in the stored layout of ``table``."""
+        columns = self._COLUMNS[table]
+        values = ", ".join("?" * len(rows[0]))
+        if self.partition_by is None:
+            await self.conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({values})", rows)
+            return
+
+        span, fmt = self.PARTITION_INTERVALS[self.partition_by]
+        scale = self._TIME_COLUMNS[table][1]
+        grouped: Dict[float, List[tuple]] = {}
+        for row in rows:
+            ts = row[0] / scale
+            grouped.setdefault(ts - ts % span, []).append(row)
+        for start, partition_rows in grouped.items():
+            suffix = datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc).strftime(fmt)
+            name = f"{table}_{suffix}"
+            if name not in self._partitions[table]:
+                await self.conn.execute(self._PARTITION_SCHEMAS[table].format(name=name))
+                for suffix, indexed in self._PARTITION_INDEXES[table].items():
+                    await self.conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{name}_{suffix} ON {name}({indexed})"
+                    )
+                self._partitions[table][name] = (start, start + span)
+            await self.conn.executemany(
+                f"INSERT INTO {name} ({columns}) VALUES ({values})", partition_rows
+            )
+
+    def _source(
+        self, table: str, from_ts: Optional[float] = None, to_ts: Optional[float] = None
+    ) -> str:
+        """FROM clause covering ``table`` and its partitions overlapping the range."""
+        names = [
+            name
+            for name, (start, end) in sorted(self._partitions[table].items())
+            if (from_ts is None or end > from_ts) and (to_ts is None or start <= to_ts)
+        ]
+        if not names:
+            return table
+        columns = self._COLUMNS[table]
+        union = " UNION ALL ".join(
+            f"SELECT rowid, {columns} FROM {name}" for name in [table, *names]
+        )
+        return f"({union})"
 
     async def initialize(self) -> None:
         """Initialize SQLite database and create tables."""
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
         self.conn = await aiosqlite.connect(self.db_path)
+        await self._apply_pragmas(self.conn, writer=True)
+        self._sketch_aggregate = await self._register_functions(self.conn)
 
+        # Version 0 of the schema; later changes are applied by _migrate()
         await self.conn.execute(
             """
             CREATE TABLE IF NOT EXISTS http_requests (
@@ -30,10 +516,17 @@ class SQLiteStorage(StorageBackend):
                 method TEXT NOT NULL,
                 status_code INTEGER NOT NULL,
                 latency_ms REAL NOT NULL,
-                labels TEXT
+                labels TEXT,
+                weight REAL NOT NULL DEFAULT 1.0
             )
         """
         )
+        # Databases created before sampling lack the weight column
+        cursor = await self.conn.execute("PRAGMA table_info(http_requests)")
+        if "weight" not in [row[1] for row in await cursor.fetchall()]:
+            await self.conn.execute(
+                "ALTER TABLE http_requests ADD COLUMN weight REAL NOT NULL DEFAULT 1.0"
+            )
 
         await self.conn.execute(
             """
@@ -48,18 +541,9 @@ class SQLiteStorage(StorageBackend):
         )
 
         # Indexes for query performance
-        await self.conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_http_timestamp ON http_requests(timestamp)"
-        )
-        await self.conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_http_endpoint ON http_requests(endpoint)"
-        )
         await self.conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_custom_timestamp ON custom_metrics(timestamp)"
         )
-        await self.conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_custom_name ON custom_metrics(name)"
-        )
 
         await self.conn.execute(
             """
@@ -80,10 +564,84 @@ class SQLiteStorage(StorageBackend):
         """
         )
 
+        # Pre-aggregated HTTP rollups (append-only, merged on read)
+        await self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS http_rollups (
+                resolution INTEGER NOT NULL,
+                bucket REAL NOT NULL,
+                endpoint TEXT NOT NULL,
+                method TEXT NOT NULL,
+                status_class INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                sketch TEXT NOT NULL
+            )
+        """
+        )
+        await self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rollup_bucket ON http_rollups(resolution, bucket)"
+        )
+
+        await self.conn.commit()
+        await self._load_partitions()
+        await self._migrate()
+        self._dimension_lock = asyncio.Lock()
+        await self._load_dimensions()
+        await self._open_readers()
+
+    def _pending(self) -> int:
+        """Number of group-committed writes not yet durable."""
+        return len(self._pending_http) + len(self._pending_custom) + self._pending_errors
+
+    async def _enqueue_commit(self) -> None:
+        """Flush when the batch is full, otherwise make sure a flush is scheduled."""
+        if self._pending() >= self.commit_batch_size:
+            await self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self.commit_interval_ms / 1000, self._flush_on_timer
+            )
+
+    def _flush_on_timer(self) -> None:
+        """Timer callback: flush in a background task."""
+        self._flush_timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        """Log failures of timer-triggered flushes."""
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to flush group commit: %s", task.exception())
+
+    async def flush(self) -> None:
+        """Write buffered rows and commit the pending transaction."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self.conn is None or not self._pending():
+            return
+
+        http, self._pending_http = self._pending_http, []
+        custom, self._pending_custom = self._pending_custom, []
+        self._pending_errors = 0
+        if http:
+            await self._insert("http_requests", http)
+        if custom:
+            await self._insert("custom_metrics", custom)
         await self.conn.commit()
 
     async def close(self) -> None:
-        """Close database connection."""
+        """Close the reader pool and the writer connection."""
+        await self.flush()
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        self._read_pool = self._analytics_pool = None
         if self.conn:
             await self.conn.close()
 
@@ -95,26 +653,27 @@ class SQLiteStorage(StorageBackend):
         status_code: int,
         latency_ms: float,
         labels: Optional[Dict[str, Any]] = None,
+        weight: float = 1.0,
     ) -> None:
         """Store HTTP metric in SQLite."""
         if self.conn is None:
             await self.initialize()
 
-        await self.conn.execute(
-            """
-            INSERT INTO http_requests 
-            (timestamp, endpoint, method, status_code, latency_ms, labels)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                timestamp.timestamp(),
-                endpoint,
-                method,
-                status_code,
-                latency_ms,
-                json.dumps(labels) if labels else None,
-            ),
+        row = (
+            timestamp.timestamp(),
+            endpoint,
+            method,
+            status_code,
+            latency_ms,
+            json.dumps(labels, sort_keys=True) if labels else None,
+            weight,
         )
+        if self.commit_batch_size:
+            self._pending_http.append(row)
+            await self._enqueue_commit()
+            return
+
+        await self._insert("http_requests", [row])
         await self.conn.commit()
 
     async def store_custom_metric(
@@ -128,21 +687,144 @@ class SQLiteStorage(StorageBackend):
         if self.conn is None:
             await self.initialize()
 
-        await self.conn.execute(
+        row = (
+            timestamp.timestamp(),
+            name,
+            value,
+            json.dumps(labels) if labels else None,
+        )
+        if self.commit_batch_size:
+            self._pending_custom.append(row)
+            await self._enqueue_commit()
+            return
+
+        await self._insert("custom_metrics", [row])
+        await self.conn.commit()
+
+    async def store_http_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many HTTP metrics with a single executemany and commit."""
+        if not metrics:
+            return
+        if self.conn is None:
+            await self.initialize()
+
+        await self._insert(
+            "http_requests",
+            [
+                (
+                    m["timestamp"].timestamp(),
+                    m["endpoint"],
+                    m["method"],
+                    m["status_code"],
+                    m["latency_ms"],
+                    json.dumps(m["labels"], sort_keys=True) if m.get("labels") else None,
+                    m.get("weight", 1.0),
+                )
+                for m in metrics
+            ],
+        )
+        await self.conn.commit()
+
+    async def store_custom_metrics_batch(self, metrics: List[Dict[str, Any]]) -> None:
+        """Store many custom metrics with a single executemany and commit."""
+        if not metrics:
+            return
+        if self.conn is None:
+            await self.initialize()
+
+        await self._insert(
+            "custom_metrics",
+            [
+                (
+                    m["timestamp"].timestamp(),
+                    m["name"],
+                    m["value"],
+                    json.dumps(m["labels"]) if m.get("labels") else None,
+                )
+                for m in metrics
+            ],
+        )
+        await self.conn.commit()
+
+    async def store_rollups(self, rollups: List[Dict[str, Any]]) -> None:
+        """Append rollup rows to SQLite."""
+        if not rollups:
+            return
+        if self.conn is None:
+            await self.initialize()
+
+        await self.conn.executemany(
             """
-            INSERT INTO custom_metrics 
-            (timestamp, name, value, labels)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO http_rollups
+            (resolution, bucket, endpoint, method, status_class, count, sum, min, max, sketch)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (
-                timestamp.timestamp(),
-                name,
-                value,
-                json.dumps(labels) if labels else None,
-            ),
+            [
+                (
+                    r["resolution"],
+                    r["bucket"].timestamp(),
+                    r["endpoint"],
+                    r["method"],
+                    r["status_class"],
+                    r["count"],
+                    r["sum"],
+                    r["min"],
+                    r["max"],
+                    json.dumps(r["sketch"]),
+                )
+                for r in rollups
+            ],
         )
         await self.conn.commit()
 
+    async def query_rollups(
+        self,
+        resolution: int,
+        from_time: datetime,
+        to_time: datetime,
+        endpoint: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Query rollup rows from SQLite."""
+        conditions = ["resolution = ?", "bucket BETWEEN ? AND ?"]
+        params = [resolution, from_time.timestamp(), to_time.timestamp()]
+
+        if endpoint:
+            conditions.append("endpoint = ?")
+            params.append(endpoint)
+
+        if method:
+            conditions.append("method = ?")
+            params.append(method)
+
+        async with self._reader() as conn:
+            cursor = await conn.execute(
+                f"""
+                SELECT resolution, bucket, endpoint, method, status_class,
+                    count, sum, min, max, sketch
+                FROM http_rollups
+                WHERE {" AND ".join(conditions)}
+                """,
+                params,
+            )
+            rows = await cursor.fetchall()
+
+        return [
+            {
+                "resolution": row[0],
+                "bucket": datetime.datetime.fromtimestamp(row[1], tz=datetime.timezone.utc),
+                "endpoint": row[2],
+                "method": row[3],
+                "status_class": row[4],
+                "count": row[5],
+                "sum": row[6],
+                "min": row[7],
+                "max": row[8],
+                "sketch": json.loads(row[9]),
+            }
+            for row in rows
+        ]
+
     async def query_http_metrics(
         self,
         from_time: datetime,
@@ -152,74 +834,118 @@ class SQLiteStorage(StorageBackend):
         group_by: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query HTTP metrics from SQLite."""
+        """Query HTTP metrics from SQLite.
+
+        Rows come newest first; cursors seek on (timestamp_ms, rowid).
+        """
         if self.conn is None:
             await self.initialize()
 
-        conditions = ["timestamp BETWEEN ? AND ?"]
-        params = [from_time.timestamp(), to_time.timestamp()]
+        from_ms, to_ms = int(from_time.timestamp() * 1000), int(to_time.timestamp() * 1000)
+        width = bucket_seconds(group_by) if group_by else None
+        starts = None
+        if width and fill_gaps:
+            # Only read the buckets of the requested page
+            starts = bucket_starts(from_ms / 1000, to_ms / 1000, width, limit, offset)
+            if not starts:
+                return []
+            from_ms = max(from_ms, starts[0] * 1000)
+            to_ms = min(to_ms, (starts[-1] + width) * 1000 - 1)
+            offset = 0
+
+        after = None
+        if cursor and not width:
+            after = decode_cursor(cursor)
+            to_ms = min(to_ms, after[0])
+            offset = 0
+
+        conditions = ["r.timestamp_ms BETWEEN ? AND ?"]
+        params = [from_ms, to_ms]
+        if after:
+            conditions.append("(r.timestamp_ms < ? OR r.rowid < ?)")
+            params.extend(after)
 
         if endpoint:
-            conditions.append("endpoint = ?")
+            conditions.append("r.endpoint_id = (SELECT id FROM endpoints WHERE endpoint = ?)")
             params.append(endpoint)
 
         if method:
-            conditions.append("method = ?")
+            conditions.append("r.method_id = (SELECT id FROM http_methods WHERE method = ?)")
             params.append(method)
 
         where_clause = " AND ".join(conditions)
+        source = self._source("http_requests", from_ms / 1000, to_ms / 1000)
 
-        if group_by == "hour":
-            # Group by hour using SQLite's datetime functions
+        if width:
+            # Integer division keeps the bucket on the indexed column
             query = f"""
                 SELECT
-                    strftime('%Y-%m-%d %H:00:00', datetime(timestamp, 'unixepoch')) as hour,
-                    COUNT(*) as count,
-                    AVG(latency_ms) as avg_latency_ms,
-                    MIN(latency_ms) as min_latency_ms,
-                    MAX(latency_ms) as max_latency_ms
-                FROM http_requests
+                    r.timestamp_ms / ? * ? as bucket,
+                    ROUND(SUM(r.weight)) as count,
+                    SUM(r.latency_ms * r.weight) / SUM(r.weight) as avg_latency_ms,
+                    MIN(r.latency_ms) as min_latency_ms,
+                    MAX(r.latency_ms) as max_latency_ms,
+                    {_sketch_sql("r.latency_ms", "r.weight", self._sketch_aggregate)} as sketch
+                FROM {source} AS r
                 WHERE {where_clause}
-                GROUP BY hour
-                ORDER BY hour
+                GROUP BY bucket
+                ORDER BY bucket
                 LIMIT ? OFFSET ?
             """
+            params = [width * 1000, width * 1000] + params
         else:
             query = f"""
-                SELECT timestamp, endpoint, method, status_code, latency_ms, labels
-                FROM http_requests
+                SELECT r.timestamp_ms, e.endpoint, m.method, r.status_code, r.latency_ms,
+                    r.labels, r.weight, r.rowid
+                FROM {source} AS r
+                JOIN endpoints e ON e.id = r.endpoint_id
+                JOIN http_methods m ON m.id = r.method_id
                 WHERE {where_clause}
-                ORDER BY timestamp DESC
+                ORDER BY r.timestamp_ms DESC, r.rowid DESC
                 LIMIT ? OFFSET ?
             """
+            # One extra row tells whether there is a next page
+            limit += 1
 
-        cursor = await self.conn.execute(query, params + [limit, offset])
-        rows = await cursor.fetchall()
+        analytics = bool(width) or limit > self.ANALYTICS_LIMIT
+        async with self._reader(analytics) as conn:
+            result = await conn.execute(query, params + [limit, offset])
+            rows = await result.fetchall()
 
-        if group_by == "hour":
+        if width:
+            buckets = {row[0] // 1000: row for row in rows}
+            if starts:
+                buckets = {start: buckets.get(start) for start in starts}
             return [
                 {
-                    "timestamp": row[0],
-                    "count": row[1],
-                    "avg_latency_ms": row[2],
-                    "min_latency_ms": row[3],
-                    "max_latency_ms": row[4],
+                    "timestamp": _bucket_label(start),
+                    "count": int(row[1]) if row else 0,
+                    "avg_latency_ms": row[2] if row else None,
+                    "min_latency_ms": row[3] if row else None,
+                    "max_latency_ms": row[4] if row else None,
+                    **_percentiles(row[5] if row else None),
                 }
-                for row in rows
+                for start, row in buckets.items()
             ]
 
-        return [
-            {
-                "timestamp": datetime.datetime.fromtimestamp(row[0]),
-                "endpoint": row[1],
-                "method": row[2],
-                "status_code": row[3],
-                "latency_ms": row[4],
-                "labels": json.loads(row[5]) if row[5] else {},
-            }
-            for row in rows
-        ]
+        return Page(
+            (
+                {
+                    "timestamp": datetime.datetime.fromtimestamp(row[0] / 1000),
+                    "endpoint": row[1],
+                    "method": row[2],
+                    "status_code": row[3],
+                    "latency_ms": row[4],
+                    "labels": json.loads(row[5]) if row[5] else {},
+                    "weight": row[6],
+                }
+                for row in rows[: limit - 1]
+            ),
+            encode_cursor(rows[-2][0], rows[-2][7]) if len(rows) == limit else None,
+        )
 
     async def query_custom_metrics(
         self,
@@ -229,50 +955,92 @@ class SQLiteStorage(StorageBackend):
         group_by: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
+        fill_gaps: bool = False,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Query custom metrics from SQLite."""
+        """Query custom metrics from SQLite.
+
+        Rows come newest first; cursors seek on (timestamp, rowid).
+        """
         if self.conn is None:
             await self.initialize()
 
+        from_ts, to_ts = from_time.timestamp(), to_time.timestamp()
+        width = bucket_seconds(group_by) if group_by else None
+        starts = None
+        if width and fill_gaps:
+            starts = bucket_starts(from_ts, to_ts, width, limit, offset)
+            if not starts:
+                return []
+            from_ts = max(from_ts, starts[0])
+            to_ts = min(to_ts, starts[-1] + width)
+            limit, offset = -1, 0
+
+        after = None
+        if cursor and not width:
+            after = decode_cursor(cursor)
+            to_ts = min(to_ts, after[0])
+            offset = 0
+
         conditions = ["timestamp BETWEEN ? AND ?"]
-        params = [from_time.timestamp(), to_time.timestamp()]
+        params = [from_ts, to_ts]
+        if starts:
+            # The page ends where its last bucket does
+            conditions.append("timestamp < ?")
+            params.append(starts[-1] + width)
+        if after:
+            conditions.append("(timestamp < ? OR rowid < ?)")
+            params.extend(after)
 
         if name:
             conditions.append("name = ?")
             params.append(name)
 
         where_clause = " AND ".join(conditions)
+        source = self._source("custom_metrics", from_ts, to_ts)
 
-        if group_by == "hour":
+        if width:
             query = f"""
                 SELECT
-                    strftime('%Y-%m-%d %H:00:00', datetime(timestamp, 'unixepoch')) as hour,
+                    CAST(timestamp / ? AS INTEGER) * ? as bucket,
                     name,
                     COUNT(*) as count,
                     SUM(value) as sum,
                     AVG(value) as avg
-                FROM custom_metrics
+                FROM {source}
                 WHERE {where_clause}
-                GROUP BY hour, name
-                ORDER BY hour
+                GROUP BY bucket, name
+                ORDER BY bucket
                 LIMIT ? OFFSET ?
             """
+            params = [width, width] + params
         else:
             query = f"""
-                SELECT timestamp, name, value, labels
-                FROM custom_metrics
+                SELECT timestamp, name, value, labels, rowid
+                FROM {source}
                 WHERE {where_clause}
-                ORDER BY timestamp DESC
+                ORDER BY timestamp DESC, rowid DESC
                 LIMIT ? OFFSET ?
             """
+            limit += 1
 
-        cursor = await self.conn.execute(query, params + [limit, offset])
-        rows = await cursor.fetchall()
+        analytics = bool(width) or limit > self.ANALYTICS_LIMIT
+        async with self._reader(analytics) as conn:
+            result = await conn.execute(query, params + [limit, offset])
+            rows = await result.fetchall()
 
-        if group_by == "hour":
+        if width:
+            if starts:
+                buckets = {(row[0], row[1]): row for row in rows}
+                names = sorted({row[1] for row in rows} or ([name] if name else []))
+                rows = [
+                    buckets.get((start, series), (start, series, 0, 0.0, None))
+                    for start in starts
+                    for series in names
+                ]
             return [
                 {
-                    "timestamp": row[0],
+                    "timestamp": _bucket_label(row[0]),
                     "name": row[1],
                     "count": row[2],
                     "sum": row[3],
@@ -281,15 +1049,18 @@ class SQLiteStorage(StorageBackend):
                 for row in rows
             ]
 
-        return [
-            {
-                "timestamp": datetime.datetime.fromtimestamp(row[0]),
-                "name": row[1],
-                "value": row[2],
-                "labels": json.loads(row[3]) if row[3] else {},
-            }
-            for row in rows
-        ]
+        return Page(
+            (
+                {
+                    "timestamp": datetime.datetime.fromtimestamp(row[0]),
+                    "name": row[1],
+                    "value": row[2],
+                    "labels": json.loads(row[3]) if row[3] else {},
+                }
+                for row in rows[: limit - 1]
+            ),
+            encode_cursor(rows[-2][0], rows[-2][4]) if len(rows) == limit else None,
+        )
 
     async def get_endpoint_stats(
         self,
@@ -303,39 +1074,54 @@ class SQLiteStorage(StorageBackend):
         conditions = []
         params = []
         if from_time:
-            conditions.append("timestamp >= ?")
-            params.append(from_time.timestamp())
+            conditions.append("timestamp_ms >= ?")
+            params.append(int(from_time.timestamp() * 1000))
         if to_time:
-            conditions.append("timestamp <= ?")
-            params.append(to_time.timestamp())
+            conditions.append("timestamp_ms <= ?")
+            params.append(int(to_time.timestamp() * 1000))
 
         where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        source = self._source(
+            "http_requests",
+            from_time.timestamp() if from_time else None,
+            to_time.timestamp() if to_time else None,
+        )
         query = f"""
-            SELECT
-                endpoint,
-                method,
-                COUNT(*) as count,
-                AVG(latency_ms) as avg_latency_ms,
-                MIN(latency_ms) as min_latency_ms,
-                MAX(latency_ms) as max_latency_ms,
-                SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) * 1.0 / COUNT(*) as error_rate
-            FROM http_requests
-            {where_clause}
-            GROUP BY endpoint, method
-            ORDER BY count DESC
+            SELECT e.endpoint, m.method, s.count, s.avg_latency_ms, s.min_latency_ms,
+                s.max_latency_ms, s.error_rate, s.sketch
+            FROM (
+                SELECT
+                    endpoint_id,
+                    method_id,
+                    ROUND(SUM(weight)) as count,
+                    SUM(latency_ms * weight) / SUM(weight) as avg_latency_ms,
+                    MIN(latency_ms) as min_latency_ms,
+                    MAX(latency_ms) as max_latency_ms,
+                    SUM(CASE WHEN status_code >= 400 THEN weight ELSE 0 END) / SUM(weight)
+                        as error_rate,
+                    {_sketch_sql("latency_ms", "weight", self._sketch_aggregate)} as sketch
+                FROM {source}
+                {where_clause}
+                GROUP BY endpoint_id, method_id
+            ) s
+            JOIN endpoints e ON e.id = s.endpoint_id
+            JOIN http_methods m ON m.id = s.method_id
+            ORDER BY s.count DESC
         """
 
-        cursor = await self.conn.execute(query, params)
-        rows = await cursor.fetchall()
+        async with self._reader(analytics=True) as conn:
+            cursor = await conn.execute(query, params)
+            rows = await cursor.fetchall()
 
         return [
             {
                 "endpoint": row[0],
                 "method": row[1],
-                "count": row[2],
+                "count": int(row[2]),
                 "avg_latency_ms": row[3],
                 "min_latency_ms": row[4],
                 "max_latency_ms": row[5],
+                **_percentiles(row[7]),
                 "error_rate": row[6],
             }
             for row in rows
@@ -349,7 +1135,7 @@ class SQLiteStorage(StorageBackend):
         timestamp = before.timestamp()
 
         cursor = await self.conn.execute(
-            "DELETE FROM http_requests WHERE timestamp < ?", (timestamp,)
+            "DELETE FROM http_requests WHERE timestamp_ms < ?", (int(timestamp * 1000),)
         )
         http_deleted = cursor.rowcount
 
@@ -363,9 +1149,56 @@ class SQLiteStorage(StorageBackend):
         )
         errors_deleted = cursor.rowcount
 
+        await self.conn.execute("DELETE FROM http_rollups WHERE bucket < ?", (timestamp,))
+
+        # Partitions that ended before the cutoff are dropped whole; only
+        # the partition holding the cutoff has rows deleted
+        partitions_deleted = 0
+        dropped = False
+        for table, partitions in self._partitions.items():
+            column, scale = self._TIME_COLUMNS[table]
+            for name, (start, end) in list(partitions.items()):
+                if start >= timestamp:
+                    continue
+                if end <= timestamp:
+                    cursor = await self.conn.execute(f"SELECT COUNT(*) FROM {name}")
+                    partitions_deleted += (await cursor.fetchone())[0]
+                    await self.conn.execute(f"DROP TABLE {name}")
+                    del partitions[name]
+                    dropped = True
+                else:
+                    cursor = await self.conn.execute(
+                        f"DELETE FROM {name} WHERE {column} < ?", (int(timestamp * scale),)
+                    )
+                    partitions_deleted += cursor.rowcount
+
+        await self._prune_endpoints()
         await self.conn.commit()
 
-        return http_deleted + custom_deleted + errors_deleted
+        if dropped:
+            # Give the dropped pages back to the file system
+            cursor = await self.conn.execute("PRAGMA incremental_vacuum")
+            await cursor.fetchall()
+
+        return http_deleted + custom_deleted + errors_deleted + partitions_deleted
+
+    async def _prune_endpoints(self) -> None:
+        """Delete endpoints no HTTP row refers to and forget their cached ids."""
+        # One index seek per endpoint and table, not a scan of every row
+        unreferenced = " AND ".join(
+            f"NOT EXISTS (SELECT 1 FROM {name} WHERE endpoint_id = endpoints.id)"
+            for name in ["http_requests", *self._partitions["http_requests"]]
+        )
+        async with self._dimension_lock:
+            cursor = await self.conn.execute(
+                f"SELECT id, endpoint FROM endpoints WHERE {unreferenced}"
+            )
+            pruned = await cursor.fetchall()
+            await self.conn.executemany(
+                "DELETE FROM endpoints WHERE id = ?", [(ident,) for ident, _ in pruned]
+            )
+            for _, endpoint in pruned:
+                self._dimension_ids["endpoints"].pop(endpoint, None)
 
     async def store_error(
         self,
@@ -377,60 +1210,48 @@ class SQLiteStorage(StorageBackend):
         error_hash: str,
         stack_trace: str,
         user_agent: Optional[str] = None,
+        count: int = 1,
     ) -> None:
-        """Store error details in SQLite."""
+        """Store error details in SQLite with a single upsert."""
         if self.conn is None:
             await self.initialize()
 
-        # Check if error already exists
-        cursor = await self.conn.execute(
-            "SELECT id, count FROM errors WHERE error_hash = ?", (error_hash,)
-        )
-        existing = await cursor.fetchone()
-
         ts = timestamp.timestamp()
-        if existing:
-            # Update existing error
-            await self.conn.execute(
-                """
-                UPDATE errors
-                SET count = count + 1, last_seen = ?
-                WHERE error_hash = ?
-                """,
-                (ts, error_hash),
-            )
-        else:
-            # Insert new error
-            await self.conn.execute(
-                """
-                INSERT INTO errors
-                (timestamp, endpoint, method, error_type, error_message,
-                error_hash, stack_trace, user_agent, first_seen, last_seen)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    ts,
-                    endpoint,
-                    method,
-                    error_type,
-                    error_message,
-                    error_hash,
-                    stack_trace,
-                    user_agent,
-                    ts,
-                    ts,
-                ),
-            )
+        await self.conn.execute(
+            """
+            INSERT INTO errors
+            (timestamp, endpoint, method, error_type, error_message,
+            error_hash, stack_trace, user_agent, count, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (error_hash) DO UPDATE SET
+                count = count + excluded.count,
+                last_seen = MAX(last_seen, excluded.last_seen)
+            """,
+            (
+                ts,
+                endpoint,
+                method,
+                error_type,
+                error_message,
+                error_hash,
+                stack_trace,
+                user_agent,
+                count,
+                ts,
+                ts,
+            ),
+        )
 
+        if self.commit_batch_size:
+            self._pending_errors += 1
+            await self._enqueue_commit()
+            return
         await self.conn.commit()
 
     async def query_errors(
         self, from_time: datetime, to_time: datetime, endpoint: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Query errors from SQLite."""
-        if self.conn is None:
-            await self.initialize()
-
         conditions = ["timestamp BETWEEN ? AND ?"]
         params = [from_time.timestamp(), to_time.timestamp()]
 
@@ -447,8 +1268,9 @@ class SQLiteStorage(StorageBackend):
             ORDER BY last_seen DESC
         """
 
-        cursor = await self.conn.execute(query, params)
-        rows = await cursor.fetchall()
+        async with self._reader() as conn:
+            cursor = await conn.execute(query, params)
+            rows = await cursor.fetchall()
 
         return [
             {
@@ -0,0 +1,115 @@
+"""
+Tests for streaming pre-aggregation into rollup buckets.
+"""
+
+import datetime
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_metrics import Metrics
+from fastapi_metrics.aggregation import RollupAggregator, pick_resolution
+from fastapi_metrics.storage.base import StorageBackend
+from fastapi_metrics.storage.memory import MemoryStorage
+from fastapi_metrics.storage.sqlite import SQLiteStorage
+
+
+@pytest.fixture
+def memory_storage():
+    """Fixture for in-memory storage."""
+    return MemoryStorage()
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    """Fixture for SQLite storage."""
+    return SQLiteStorage(str(tmp_path / "rollups.db"))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage_fixture", ["memory_storage", "sqlite_storage"])
+async def test_flush_and_query_rollups(storage_fixture, request):
+    """Closed buckets are flushed and merged with open ones on read."""
+    storage = request.getfixturevalue(storage_fixture)
+    await storage.initialize()
+    aggregator = RollupAggregator(storage)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    old = now - datetime.timedelta(hours=2)
+    for latency in (10.0, 20.0, 30.0):
+        aggregator.add(old, "/api/test", "GET", 200, latency)
+    aggregator.add(old, "/api/test", "GET", 500, 100.0)
+    aggregator.add(now, "/api/test", "GET", 200, 40.0)
+
+    # Only the buckets from two hours ago are closed: two status classes
+    # at every resolution
+    assert await aggregator.flush() == 2 * len(aggregator.resolutions)
+    stored = await storage.query_rollups(
+        resolution=60, from_time=now - datetime.timedelta(hours=3), to_time=now
+    )
+    assert sum(r["count"] for r in stored) == 4
+
+    rows = await aggregator.query(60, now - datetime.timedelta(hours=3), now)
+    assert sum(r["count"] for r in rows) == 5
+    ok_rows = [r for r in rows if r["status_class"] == 2 and r["count"] == 3]
+    assert ok_rows[0]["min"] == 10.0
+    assert ok_rows[0]["max"] == 30.0
+    assert ok_rows[0]["sum"] == 60.0
+
+    stats = await aggregator.endpoint_stats(now - datetime.timedelta(hours=3), now)
+    assert stats[0]["count"] == 5
+    assert stats[0]["error_rate"] == pytest.approx(0.2)
+
+
+@pytest.mark.asyncio
+async def test_flush_everything_on_stop(memory_storage):
+    """Stopping the aggregator flushes open buckets too."""
+    await memory_storage.initialize()
+    aggregator = RollupAggregator(memory_storage, resolutions=(60,))
+    aggregator.add(datetime.datetime.now(datetime.timezone.utc), "/a", "GET", 200, 1.0)
+
+    await aggregator.stop()
+
+    assert len(memory_storage.rollups) == 1
+
+
+def test_pick_resolution():
+    """Long windows use coarse buckets, short windows fine ones."""
+    assert pick_resolution(300) == 10
+    assert pick_resolution(3600) == 60
+    assert pick_resolution(7 * 24 * 3600) == 3600
+
+
+def test_rollups_require_backend_support():
+    """Enabling rollups on a backend without them fails at construction."""
+
+    class NoRollupStorage(MemoryStorage):
+        store_rollups = StorageBackend.store_rollups
+        query_rollups = StorageBackend.query_rollups
+
+    with pytest.raises(ValueError, match="NoRollupStorage does not implement"):
+        Metrics(FastAPI(), storage=NoRollupStorage(), enable_rollups=True)
+
+
+def test_metrics_with_rollups():
+    """Endpoint stats and rollup listing are served from rollups."""
+    storage = MemoryStorage()
+    app = FastAPI()
+    Metrics(app, storage=storage, enable_rollups=True)
+
+    @app.get("/test")
+    async def test_endpoint():
+        return {"status": "ok"}
+
+    client = TestClient(app)
+    for _ in range(3):
+        client.get("/test")
+
+    data = client.get("/metrics/endpoints").json()
+    test_stats = [s for s in data["endpoints"] if s["endpoint"] == "/test"]
+    assert test_stats[0]["count"] == 3
+    assert "p95_latency_ms" in test_stats[0]
+
+    data = client.get("/metrics/rollups?resolution=10").json()
+    assert sum(r["count"] for r in data["rollups"] if r["endpoint"] == "/test") == 3
+
+    assert "error" in client.get("/metrics/rollups?resolution=7").json()
@@ -7,6 +7,7 @@ import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from fastapi_metrics import Metrics
+from fastapi_metrics.storage.memory import MemoryStorage
 
 
 @pytest.fixture
@@ -138,6 +139,21 @@ def test_grouped_query(client):
         assert "count" in data["results"][0]
 
 
+def test_bucketed_query_endpoint(client):
+    """group_by accepts bucket widths and can fill empty buckets."""
+    client.get("/test")
+
+    response = client.get(
+        "/metrics/query?metric_type=http&group_by=10m&fill_gaps=true&from_hours=1&limit=10"
+    )
+    data = response.json()
+    assert data["count"] == 7
+    assert sum(r["count"] for r in data["results"]) == 1
+
+    response = client.get("/metrics/query?metric_type=http&group_by=weekly")
+    assert "Invalid group_by" in response.json()["error"]
+
+
 def test_cleanup_endpoint(client):
     """Test manual cleanup endpoint."""
     # Make some requests first
@@ -324,6 +340,45 @@ def test_pagination(client):
     assert p1_ids != p2_ids
 
 
+def test_cursor_pagination(client):
+    """GET /metrics/query returns a next_cursor that continues the listing."""
+    for _ in range(5):
+        client.get("/test")
+
+    url = "/metrics/query?metric_type=http&endpoint=/test&from_hours=1&limit=2"
+    data = client.get(url).json()
+    rows = data["results"]
+    while data["next_cursor"]:
+        data = client.get(f"{url}&cursor={data['next_cursor']}").json()
+        rows.extend(data["results"])
+    assert len(rows) == 5
+
+    assert "Invalid cursor" in client.get(f"{url}&cursor=bogus").json()["error"]
+    response = client.get(f"{url}&group_by=hour&cursor=WzEsMV0")
+    assert "group_by" in response.json()["error"]
+
+
+def test_query_with_legacy_backend():
+    """Backends predating fill_gaps and cursor still serve /metrics/query."""
+
+    class LegacyStorage(MemoryStorage):
+        async def query_http_metrics(
+            self, from_time, to_time, endpoint=None, method=None, group_by=None, limit=100, offset=0
+        ):
+            return await super().query_http_metrics(
+                from_time, to_time, endpoint, method, group_by, limit, offset
+            )
+
+    app = FastAPI()
+    Metrics(app, storage=LegacyStorage())
+    client = TestClient(app)
+    client.get("/missing")
+
+    data = client.get("/metrics/query?metric_type=http&from_hours=1").json()
+    assert data["count"] == 1
+    assert data["next_cursor"] is None
+
+
 def test_request_id_passthrough(app):
     """X-Request-ID header is echoed back in response."""
     c = TestClient(app)
@@ -0,0 +1,176 @@
+"""
+Tests for the write-behind ingest queue.
+"""
+
+import asyncio
+import datetime
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_metrics import Metrics
+from fastapi_metrics.ingest import ErrorCoalescer, IngestQueue
+from fastapi_metrics.storage.memory import MemoryStorage
+
+
+class SlowStorage(MemoryStorage):
+    """Memory storage with an artificially slow write path."""
+
+    async def store_http_metric(self, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        await super().store_http_metric(*args, **kwargs)
+
+    async def close(self):
+        """Keep data around so tests can inspect it after shutdown."""
+
+
+def _record(endpoint="/api/test"):
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc),
+        "endpoint": endpoint,
+        "method": "GET",
+        "status_code": 200,
+        "latency_ms": 1.0,
+        "labels": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_queue_drains_on_stop():
+    """All enqueued events reach storage once the queue is stopped."""
+    storage = SlowStorage()
+    await storage.initialize()
+    queue = IngestQueue(storage, maxsize=100)
+    queue.start()
+
+    for _ in range(20):
+        assert await queue.put("http", _record())
+
+    await queue.stop()
+
+    assert len(storage.http_metrics) == 20
+    assert queue.stats()["written"] == 20
+    assert not queue.running
+
+
+@pytest.mark.asyncio
+async def test_queue_drop_policy():
+    """The drop policy discards events once the queue is full."""
+    storage = SlowStorage()
+    await storage.initialize()
+    queue = IngestQueue(storage, maxsize=2, policy="drop")
+    queue.start()
+
+    accepted = [await queue.put("http", _record()) for _ in range(10)]
+    await queue.stop()
+
+    assert not all(accepted)
+    assert queue.dropped == accepted.count(False)
+    assert len(storage.http_metrics) == accepted.count(True)
+
+
+@pytest.mark.asyncio
+async def test_queue_block_policy():
+    """The block policy never loses events."""
+    storage = SlowStorage()
+    await storage.initialize()
+    queue = IngestQueue(storage, maxsize=2, policy="block")
+    queue.start()
+
+    for _ in range(10):
+        await queue.put("http", _record())
+    await queue.stop()
+
+    assert queue.dropped == 0
+    assert len(storage.http_metrics) == 10
+
+
+def test_invalid_policy():
+    """Unknown policies are rejected."""
+    with pytest.raises(ValueError, match="Unknown ingest queue policy"):
+        IngestQueue(MemoryStorage(), policy="spill")
+
+
+def test_metrics_write_behind():
+    """Requests are written through the queue and flushed on shutdown."""
+    storage = SlowStorage()
+    app = FastAPI()
+    Metrics(app, storage=storage, ingest_queue_size=100)
+
+    @app.get("/test")
+    async def test_endpoint():
+        return {"status": "ok"}
+
+    with TestClient(app) as client:
+        for _ in range(5):
+            assert client.get("/test").status_code == 200
+        data = client.get("/metrics").json()
+        assert data["ingest"]["capacity"] == 100
+
+    assert len([m for m in storage.http_metrics if m["endpoint"] == "/test"]) == 5
+
+
+def _error(error_hash="abc"):
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc),
+        "endpoint": "/api/test",
+        "method": "GET",
+        "error_type": "ValueError",
+        "error_message": "boom",
+        "error_hash": error_hash,
+        "stack_trace": "Traceback",
+        "user_agent": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_error_coalescer():
+    """Repeated errors are written once, then as one counted update."""
+    storage = MemoryStorage()
+    writes = []
+
+    async def write(record):
+        writes.append(record.get("count", 1))
+        await storage.store_error(**record)
+
+    coalescer = ErrorCoalescer(write, window=60)
+    coalescer.start()
+    for _ in range(50):
+        await coalescer.add(_error())
+    await coalescer.add(_error("other"))
+
+    # First occurrences are visible immediately
+    assert writes == [1, 1]
+    assert storage.errors["abc"]["count"] == 1
+
+    await coalescer.stop()
+    assert writes == [1, 1, 49]
+    assert storage.errors["abc"]["count"] == 50
+    assert storage.errors["other"]["count"] == 1
+    assert coalescer.coalesced == 49
+
+
+def test_metrics_coalesces_errors():
+    """A burst of the same exception becomes two storage writes."""
+    storage = SlowStorage()
+    calls = []
+    store_error = storage.store_error
+
+    async def counting_store_error(**record):
+        calls.append(record.get("count", 1))
+        await store_error(**record)
+
+    storage.store_error = counting_store_error
+    app = FastAPI()
+    Metrics(app, storage=storage, error_coalesce_window=1.0)
+
+    @app.get("/boom")
+    async def boom():
+        raise ValueError("boom")
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        for _ in range(20):
+            assert client.get("/boom").status_code == 500
+
+    assert calls == [1, 19]
+    (error,) = storage.errors.values()
+    assert error["count"] == 20
@@ -0,0 +1,172 @@
+"""
+Tests for the pure ASGI metrics middleware.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from fastapi_metrics import Metrics
+
+
+@pytest.fixture
+def asgi_app():
+    """App using the pure ASGI middleware."""
+    in_app = FastAPI()
+    in_app.state.metrics = Metrics(
+        in_app,
+        storage="memory://",
+        middleware_mode="asgi",
+        enable_error_tracking=False,
+        exclude_paths=["/ping"],
+    )
+
+    @in_app.get("/test")
+    async def test_endpoint():
+        return {"status": "ok"}
+
+    @in_app.get("/ping")
+    async def ping():
+        return {}
+
+    @in_app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk-{i}\n"
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @in_app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    return in_app
+
+
+def _tracked(client):
+    data = client.get("/metrics/query?metric_type=http&from_hours=1&limit=1000").json()
+    return data["results"]
+
+
+def test_asgi_tracks_requests(asgi_app):
+    """Requests are recorded with status code and latency."""
+    client = TestClient(asgi_app)
+    client.get("/test")
+    client.get("/ping")
+
+    results = _tracked(client)
+    endpoints = [r["endpoint"] for r in results]
+    assert "/test" in endpoints
+    assert "/ping" not in endpoints
+    assert all(r["latency_ms"] >= 0 for r in results)
+    assert asgi_app.state.metrics._active_requests == 0  # pylint: disable=protected-access
+
+
+def test_asgi_request_id_echo(asgi_app):
+    """X-Request-ID is echoed and stored in labels."""
+    client = TestClient(asgi_app)
+    response = client.get("/test", headers={"x-request-id": "asgi-123"})
+    assert response.headers.get("x-request-id") == "asgi-123"
+
+    labels = [r.get("labels", {}) for r in _tracked(client)]
+    assert {"request_id": "asgi-123"} in labels
+
+
+def test_asgi_streaming_response(asgi_app):
+    """Streaming responses pass through untouched."""
+    client = TestClient(asgi_app)
+    response = client.get("/stream")
+    assert response.text == "chunk-0\nchunk-1\nchunk-2\n"
+
+    statuses = [r["status_code"] for r in _tracked(client) if r["endpoint"] == "/stream"]
+    assert statuses == [200]
+
+
+def test_asgi_error_capture(asgi_app):
+    """Unhandled errors are recorded as 500 and answered with JSON."""
+    client = TestClient(asgi_app)
+    response = client.get("/boom", headers={"x-request-id": "err-1"})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Internal Server Error"
+    assert response.headers.get("x-request-id") == "err-1"
+
+    statuses = [r["status_code"] for r in _tracked(client) if r["endpoint"] == "/boom"]
+    assert statuses == [500]
+
+
+def test_asgi_error_reporting_reraises():
+    """With error tracking enabled the error is stored and re-raised."""
+    in_app = FastAPI()
+    metrics = Metrics(in_app, storage="memory://", middleware_mode="asgi")
+
+    @in_app.get("/boom")
+    async def boom():
+        raise ValueError("bad value")
+
+    client = TestClient(in_app, raise_server_exceptions=False)
+    assert client.get("/boom").status_code == 500
+    (error,) = metrics.storage.errors.values()
+    assert error["error_type"] == "ValueError"
+
+
+def test_invalid_middleware_mode():
+    """Unknown middleware modes are rejected."""
+    with pytest.raises(ValueError, match="Unknown middleware mode"):
+        Metrics(FastAPI(), storage="memory://", middleware_mode="wsgi")
+
+
+@pytest.mark.parametrize("middleware_mode", ["base", "asgi"])
+def test_route_template_labels(middleware_mode):
+    """Path parameters are collapsed into the route template."""
+    in_app = FastAPI()
+    Metrics(in_app, storage="memory://", middleware_mode=middleware_mode)
+
+    @in_app.get("/users/{user_id}")
+    async def get_user(user_id: int):
+        return {"id": user_id}
+
+    sub_app = FastAPI()
+
+    @sub_app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    in_app.mount("/sub", sub_app)
+
+    client = TestClient(in_app)
+    for i in range(3):
+        client.get(f"/users/{i}")
+        client.get(f"/sub/items/{i}")
+
+    endpoints = {r["endpoint"] for r in _tracked(client)}
+    assert endpoints == {"/users/{user_id}", "/sub/items/{item_id}"}
+
+
+def test_unmatched_path_cardinality_cap():
+    """Paths without a route are capped and overflow into __other__."""
+    in_app = FastAPI()
+    Metrics(in_app, storage="memory://", max_endpoints=2)
+
+    client = TestClient(in_app)
+    for i in range(5):
+        assert client.get(f"/missing/{i}").status_code == 404
+
+    endpoints = [r["endpoint"] for r in _tracked(client)]
+    assert sorted(set(endpoints)) == ["/missing/0", "/missing/1", "__other__"]
+    assert endpoints.count("__other__") == 3
+
+
+def test_group_paths_disabled():
+    """With group_paths=False the raw path is recorded."""
+    in_app = FastAPI()
+    Metrics(in_app, storage="memory://", group_paths=False)
+
+    @in_app.get("/users/{user_id}")
+    async def get_user(user_id: int):
+        return {"id": user_id}
+
+    client = TestClient(in_app)
+    client.get("/users/7")
+
+    assert [r["endpoint"] for r in _tracked(client)] == ["/users/7"]
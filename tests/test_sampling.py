@@ -0,0 +1,104 @@
+"""
+Tests for HTTP metric sampling.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_metrics import Metrics
+from fastapi_metrics import sampling
+from fastapi_metrics.sampling import Sampler
+from fastapi_metrics.snapshot import LiveSnapshot
+from fastapi_metrics.storage.memory import MemoryStorage
+
+
+def test_fixed_rate_weights():
+    """Kept requests are weighted by the inverse sample rate."""
+    sampler = Sampler(rate=0.25, seed=1)
+    weights = [sampler.weight("/a", 200, 1.0) for _ in range(10_000)]
+    kept = [w for w in weights if w]
+
+    assert set(kept) == {4.0}
+    assert sum(kept) == pytest.approx(10_000, rel=0.05)
+    assert sampler.seen == 10_000
+    assert sampler.kept == len(kept)
+
+
+def test_errors_and_slow_requests_always_kept():
+    """Errors and slow requests bypass sampling with weight 1."""
+    sampler = Sampler(rate=0.01, slow_threshold_ms=500, seed=1)
+    assert all(sampler.weight("/a", 503, 1.0) == 1.0 for _ in range(100))
+    assert all(sampler.weight("/a", 200, 800.0) == 1.0 for _ in range(100))
+
+    sampler = Sampler(rate=0.01, keep_errors=False, seed=1)
+    assert sum(1 for _ in range(1000) if sampler.weight("/a", 500, 1.0)) < 50
+
+
+def test_endpoint_rates():
+    """Per-endpoint rates override the default rate."""
+    sampler = Sampler(rate=0.1, endpoint_rates={"/health": 0.5}, seed=1)
+    assert {sampler.weight("/health", 200, 1.0) for _ in range(100)} <= {0.0, 2.0}
+    assert {sampler.weight("/other", 200, 1.0) for _ in range(100)} <= {0.0, 10.0}
+
+
+def test_adaptive_target(monkeypatch):
+    """The adaptive scale brings the kept rate down to the target."""
+    now = [0.0]
+    monkeypatch.setattr(sampling.time, "monotonic", lambda: now[0])
+    sampler = Sampler(target_events_per_sec=100, seed=1)
+
+    # First second: 1000 requests, all kept while the scale is unknown
+    for _ in range(1000):
+        sampler.weight("/a", 200, 1.0)
+        now[0] += 0.001
+    # Second second: scaled down to ~100 kept events
+    kept_before = sampler.kept
+    weights = []
+    for _ in range(1000):
+        weights.append(sampler.weight("/a", 200, 1.0))
+        now[0] += 0.001
+
+    assert sampler.stats()["adaptive_scale"] == pytest.approx(0.1, rel=0.01)
+    assert sampler.kept - kept_before == pytest.approx(100, abs=35)
+    assert sum(weights) == pytest.approx(1000, rel=0.35)
+
+
+def test_invalid_rate():
+    """Rates outside (0, 1] are rejected."""
+    with pytest.raises(ValueError, match="Sample rate"):
+        Sampler(rate=0)
+    with pytest.raises(ValueError, match="Sample rate"):
+        Sampler(endpoint_rates={"/a": 1.5})
+
+
+def test_metrics_sampling_is_unbiased():
+    """Stored rows carry their weight and /metrics totals use it."""
+    storage = MemoryStorage()
+    app = FastAPI()
+    metrics = Metrics(app, storage=storage, sample_rate=0.5)
+
+    @app.get("/test")
+    async def test_endpoint():
+        return {"status": "ok"}
+
+    client = TestClient(app)
+    for _ in range(200):
+        client.get("/test")
+    for _ in range(5):
+        client.get("/missing")
+
+    rows = storage.http_metrics
+    sampled = [r for r in rows if r["endpoint"] == "/test"]
+    assert {r["weight"] for r in sampled} == {2.0}
+    # 404s count as errors and are all kept
+    assert [r["weight"] for r in rows if r["status_code"] == 404] == [1.0] * 5
+
+    data = client.get("/metrics").json()
+    assert data["http"]["total_requests"] == 2 * len(sampled) + 5
+    assert data["sampling"]["seen"] == 205
+
+    # Live aggregates see every request before sampling
+    metrics.live_snapshot = LiveSnapshot()
+    for _ in range(10):
+        client.get("/test")
+    assert client.get("/metrics").json()["http"]["total_requests"] == 10
@@ -0,0 +1,75 @@
+"""
+Tests for the mergeable quantile sketch.
+"""
+
+import json
+import random
+import pytest
+from fastapi_metrics.sketch import DDSketch
+
+
+def _exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.fixture
+def latencies():
+    """Long-tailed latency sample."""
+    rng = random.Random(42)
+    return [rng.lognormvariate(3, 1) for _ in range(20_000)]
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.95, 0.99])
+def test_relative_accuracy(latencies, q):
+    """Quantiles stay within the configured relative error."""
+    sketch = DDSketch.from_values(latencies, relative_accuracy=0.01)
+    exact = _exact(latencies, q)
+    assert sketch.quantile(q) == pytest.approx(exact, rel=0.011)
+
+
+def test_merge_matches_single_sketch(latencies):
+    """Merging partial sketches gives the same result as one sketch."""
+    whole = DDSketch.from_values(latencies)
+    merged = DDSketch()
+    for i in range(0, len(latencies), 1000):
+        merged.merge(DDSketch.from_values(latencies[i : i + 1000]))
+
+    assert merged.count == whole.count
+    assert merged.min == whole.min
+    assert merged.max == whole.max
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_serialisation_roundtrip(latencies):
+    """Sketches survive a JSON round trip."""
+    sketch = DDSketch.from_values(latencies)
+    restored = DDSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+    assert restored.count == sketch.count
+    assert restored.quantile(0.99) == sketch.quantile(0.99)
+
+
+def test_empty_and_zero_values():
+    """Empty sketches have no quantiles; zero latencies are counted."""
+    assert DDSketch().quantile(0.5) is None
+
+    sketch = DDSketch.from_values([0.0, 0.0, 10.0, 10.0])
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(0.99) == pytest.approx(10.0, rel=0.01)
+
+
+def test_bin_limit():
+    """The number of bins is bounded; high quantiles stay accurate."""
+    values = [1.01**i for i in range(5000)]
+    sketch = DDSketch.from_values(values, max_bins=256)
+
+    assert len(sketch.bins) == 256
+    assert sketch.quantile(0.99) == pytest.approx(_exact(values, 0.99), rel=0.011)
+
+
+def test_merge_rejects_different_accuracy():
+    """Sketches with different accuracy cannot be merged."""
+    with pytest.raises(ValueError):
+        DDSketch(relative_accuracy=0.01).merge(DDSketch(relative_accuracy=0.05))
@@ -0,0 +1,67 @@
+"""
+Tests for the running aggregates behind /metrics.
+"""
+
+import datetime
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_metrics import Metrics
+from fastapi_metrics.snapshot import LiveSnapshot
+
+
+def _utc(ts):
+    return datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc)
+
+
+def test_window_merges_minutes_and_sealed_hours():
+    """Old minutes are sealed into hours and still counted in long windows."""
+    live = LiveSnapshot(window_hours=24)
+    now_ts = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    start = now_ts - now_ts % 3600
+
+    # One request per 10 minutes over five hours
+    for i in range(30):
+        ts = start + i * 600
+        live.add_http(_utc(ts), "/a", "GET", 500 if i % 10 == 0 else 200, float(i + 1))
+    live.add_custom(_utc(start + 60), "revenue", 10.0)
+    live.add_custom(_utc(start + 120), "revenue", 30.0)
+
+    now = _utc(start + 5 * 3600)
+    total = live.window(now - datetime.timedelta(hours=24), now)
+    assert total.requests == 30
+    assert total.errors == 3
+    assert total.custom["revenue"] == [2, 40.0, 10.0, 30.0]
+    # Only minutes of the current and previous hour are kept
+    assert len(live._minutes) == 6  # pylint: disable=protected-access
+
+    last_hour = live.window(now - datetime.timedelta(hours=1), now)
+    assert last_hour.requests == 6
+    assert last_hour.endpoints == {("/a", "GET"): 6}
+
+    data = total.to_metrics()
+    assert data["http"]["status_codes"] == {200: 27, 500: 3}
+    assert data["http"]["error_rate"] == 0.1
+    assert data["custom"]["revenue"]["avg"] == 20.0
+
+
+def test_metrics_served_from_live_snapshot():
+    """/metrics reflects requests and custom metrics without querying storage."""
+    app = FastAPI()
+    metrics = Metrics(app, storage="memory://", live_metrics=True)
+
+    @app.get("/test")
+    async def test_endpoint():
+        await metrics.track("signups", 2)
+        return {"status": "ok"}
+
+    client = TestClient(app)
+    for _ in range(3):
+        client.get("/test")
+
+    # Storage is not consulted for the snapshot
+    metrics.storage.http.clear()
+    data = client.get("/metrics").json()
+    assert data["http"]["total_requests"] == 3
+    assert data["http"]["requests_per_endpoint"]["/test"]["GET"] == 3
+    assert data["custom"]["signups"]["total"] == 6
+    assert data["http"]["latency"]["p99"] > 0
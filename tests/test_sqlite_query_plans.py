@@ -0,0 +1,244 @@
+"""
+Query plan regression tests for the SQLite storage backend.
+
+Each test runs a storage method with statement tracing enabled and asserts on
+the ``EXPLAIN QUERY PLAN`` output of the SQL it executed, so a schema or query
+change that makes a hot path fall back to a table scan fails here.
+"""
+
+import datetime
+import sqlite3
+import pytest
+from fastapi_metrics.storage.sqlite import SQLiteStorage
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+HOUR_AGO = NOW - datetime.timedelta(hours=1)
+
+
+@pytest.fixture
+async def storage(tmp_path):
+    """SQLite storage with a few rows, reading on the writer connection."""
+    store = SQLiteStorage(str(tmp_path / "plans.db"), read_pool_size=0, analytics_pool_size=0)
+    await store.initialize()
+    for i in range(20):
+        await store.store_http_metric(NOW, f"/api/{i % 4}", "GET", 200, float(i))
+        await store.store_custom_metric(NOW, f"metric_{i % 4}", float(i))
+    await store.store_error(NOW, "/api/0", "GET", "ValueError", "boom", "abc", "trace")
+    yield store
+    await store.close()
+
+
+async def _plans(storage, call):
+    """Query plans of the SELECT statements executed by ``call``."""
+    statements = []
+    await storage.conn.set_trace_callback(statements.append)
+    try:
+        await call()
+    finally:
+        await storage.conn.set_trace_callback(None)
+
+    plans = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        cursor = await storage.conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+        plans.append(" | ".join(row[3] for row in await cursor.fetchall()))
+    assert plans, "no statements traced"
+    return plans
+
+
+@pytest.mark.asyncio
+async def test_http_query_by_endpoint_and_method(storage):
+    """Endpoint, method and time filters seek the composite index."""
+    (plan,) = await _plans(
+        storage,
+        lambda: storage.query_http_metrics(HOUR_AGO, NOW, endpoint="/api/1", method="GET"),
+    )
+    assert (
+        "idx_http_requests_endpoint_method_ts (endpoint_id=? AND method_id=? AND timestamp_ms>?"
+        in plan
+    )
+
+
+@pytest.mark.asyncio
+async def test_http_query_by_time(storage):
+    """Unfiltered range queries seek the timestamp index."""
+    (plan,) = await _plans(storage, lambda: storage.query_http_metrics(HOUR_AGO, NOW))
+    assert "idx_http_requests_ts_covering (timestamp_ms>? AND timestamp_ms<?)" in plan
+
+
+@pytest.mark.asyncio
+async def test_http_cursor_page_seeks(storage):
+    """Cursor pages seek the timestamp index instead of skipping rows."""
+    page = await storage.query_http_metrics(HOUR_AGO, NOW, limit=3)
+    (plan,) = await _plans(
+        storage, lambda: storage.query_http_metrics(HOUR_AGO, NOW, cursor=page.next_cursor)
+    )
+    assert "idx_http_requests_ts_covering (timestamp_ms>? AND timestamp_ms<?)" in plan
+
+
+@pytest.mark.asyncio
+async def test_endpoint_stats_use_covering_index(storage):
+    """Endpoint stats over a time range never touch the table."""
+    (plan,) = await _plans(storage, lambda: storage.get_endpoint_stats(HOUR_AGO, NOW))
+    assert "SEARCH http_requests USING COVERING INDEX idx_http_requests_ts_covering" in plan
+
+
+@pytest.mark.asyncio
+async def test_hourly_series_uses_covering_index(storage):
+    """The hourly series over all endpoints is computed from the index."""
+    (plan,) = await _plans(
+        storage, lambda: storage.query_http_metrics(HOUR_AGO, NOW, group_by="hour")
+    )
+    assert "USING COVERING INDEX idx_http_requests_ts_covering" in plan
+
+
+@pytest.mark.asyncio
+async def test_custom_query_by_name(storage):
+    """Custom metric queries by name seek the (name, timestamp) index."""
+    (plan,) = await _plans(
+        storage, lambda: storage.query_custom_metrics(HOUR_AGO, NOW, name="metric_1")
+    )
+    assert "idx_custom_name_ts (name=? AND timestamp>? AND timestamp<?)" in plan
+
+
+@pytest.mark.asyncio
+async def test_error_upsert_and_range_query(storage):
+    """Recording an error is one upsert; range queries use the timestamp index."""
+    statements = []
+    await storage.conn.set_trace_callback(statements.append)
+    await storage.store_error(NOW, "/api/0", "GET", "ValueError", "boom", "abc", "trace")
+    await storage.conn.set_trace_callback(None)
+    (upsert,) = [
+        sql for sql in statements if sql.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE"))
+    ]
+    assert "ON CONFLICT (error_hash) DO UPDATE" in upsert
+
+    (plan,) = await _plans(storage, lambda: storage.query_errors(HOUR_AGO, NOW))
+    assert "idx_errors_timestamp (timestamp>? AND timestamp<?)" in plan
+
+
+@pytest.mark.asyncio
+async def test_migration_from_unversioned_schema(tmp_path):
+    """Databases created before versioning are migrated in place."""
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE http_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL,
+            endpoint TEXT NOT NULL, method TEXT NOT NULL, status_code INTEGER NOT NULL,
+            latency_ms REAL NOT NULL, labels TEXT
+        );
+        CREATE INDEX idx_http_timestamp ON http_requests(timestamp);
+        CREATE INDEX idx_http_endpoint ON http_requests(endpoint);
+        CREATE TABLE errors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL,
+            endpoint TEXT NOT NULL, method TEXT NOT NULL, error_type TEXT NOT NULL,
+            error_message TEXT, error_hash TEXT NOT NULL, stack_trace TEXT,
+            user_agent TEXT, count INTEGER DEFAULT 1, first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL
+        );
+        INSERT INTO errors (timestamp, endpoint, method, error_type, error_hash,
+            count, first_seen, last_seen)
+        VALUES (1, '/a', 'GET', 'E', 'dup', 2, 1, 5), (3, '/a', 'GET', 'E', 'dup', 1, 3, 9);
+        """)
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStorage(str(db_path))
+    await store.initialize()
+    cursor = await store.conn.execute("PRAGMA user_version")
+    assert (await cursor.fetchone())[0] == len(SQLiteStorage._MIGRATIONS)
+
+    cursor = await store.conn.execute("SELECT count, first_seen, last_seen FROM errors")
+    assert await cursor.fetchall() == [(3, 1.0, 9.0)]
+
+    cursor = await store.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    indexes = {row[0] for row in await cursor.fetchall()}
+    assert {
+        "idx_http_requests_ts_covering",
+        "idx_http_requests_endpoint_method_ts",
+        "idx_errors_hash",
+    } <= indexes
+    assert not {"idx_http_timestamp", "idx_http_endpoint"} & indexes
+    await store.close()
+
+    # Reopening does not re-run migrations
+    store = SQLiteStorage(str(db_path))
+    await store.initialize()
+    cursor = await store.conn.execute("SELECT COUNT(*) FROM errors")
+    assert (await cursor.fetchone())[0] == 1
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_migration_to_compact_http_rows(tmp_path):
+    """Text HTTP rows are rewritten with integer timestamps and dimension ids."""
+    db_path = tmp_path / "v1.db"
+    store = SQLiteStorage(str(db_path), partition_by="hour")
+    await store.initialize()
+    await store.close()
+
+    # Roll the database back to the version 1 layout with a few rows
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        DROP TABLE http_requests;
+        DROP TABLE endpoints;
+        DROP TABLE http_methods;
+        CREATE TABLE http_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL,
+            endpoint TEXT NOT NULL, method TEXT NOT NULL, status_code INTEGER NOT NULL,
+            latency_ms REAL NOT NULL, labels TEXT, weight REAL NOT NULL DEFAULT 1.0
+        );
+        CREATE TABLE http_requests_2024013110 (
+            timestamp REAL NOT NULL, endpoint TEXT NOT NULL, method TEXT NOT NULL,
+            status_code INTEGER NOT NULL, latency_ms REAL NOT NULL, labels TEXT,
+            weight REAL NOT NULL DEFAULT 1.0
+        );
+        INSERT INTO http_requests (timestamp, endpoint, method, status_code, latency_ms, labels)
+        VALUES (1706695200.25, '/a', 'GET', 200, 5.0, '{"v": 1}'),
+            (1706695201.5, '/b', 'PURGE', 404, 7.0, NULL);
+        INSERT INTO http_requests_2024013110
+        VALUES (1706695300.125, '/a', 'POST', 500, 9.0, '{"v": 1}', 2.0);
+        PRAGMA user_version = 1;
+        """)
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStorage(str(db_path), partition_by="hour")
+    await store.initialize()
+    cursor = await store.conn.execute("SELECT endpoint FROM endpoints ORDER BY id")
+    assert [row[0] for row in await cursor.fetchall()] == ["/a", "/b"]
+    cursor = await store.conn.execute("SELECT labels FROM http_requests ORDER BY timestamp_ms")
+    assert [row[0] for row in await cursor.fetchall()] == ['{"v": 1}', None]
+    cursor = await store.conn.execute(
+        "SELECT timestamp_ms, method_id FROM http_requests_2024013110"
+    )
+    assert await cursor.fetchall() == [(1706695300125, 2)]
+
+    from_time = datetime.datetime.fromtimestamp(1706695000, tz=datetime.timezone.utc)
+    to_time = datetime.datetime.fromtimestamp(1706695400, tz=datetime.timezone.utc)
+    rows = await store.query_http_metrics(from_time, to_time)
+    assert [(r["endpoint"], r["method"], r["labels"], r["weight"]) for r in rows] == [
+        ("/a", "POST", {"v": 1}, 2.0),
+        ("/b", "PURGE", {}, 1.0),
+        ("/a", "GET", {"v": 1}, 1.0),
+    ]
+    assert rows[1]["timestamp"].timestamp() == pytest.approx(1706695201.5)
+
+    # New rows reuse the migrated dimension ids
+    await store.store_http_metric(to_time, "/b", "PURGE", 200, 1.0, labels={"v": 1})
+    cursor = await store.conn.execute(
+        "SELECT (SELECT COUNT(*) FROM endpoints), (SELECT COUNT(*) FROM http_methods)"
+    )
+    assert await cursor.fetchone() == (2, 10)
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_endpoint_pruning_seeks(storage):
+    """Finding unreferenced endpoints seeks the endpoint index per endpoint."""
+    plans = await _plans(storage, storage._prune_endpoints)
+    plan = next(p for p in plans if "endpoints" in p)
+    assert "idx_http_requests_endpoint_method_ts (endpoint_id=?)" in plan
+    assert "SCAN http_requests" not in plan
@@ -2,9 +2,12 @@
 Docstring for tests.test_storage
 """
 
+import asyncio
 import datetime
 import pytest
-from fastapi_metrics.storage.memory import MemoryStorage
+from fastapi import FastAPI
+from fastapi_metrics import Metrics
+from fastapi_metrics.storage.memory import HttpColumns, MemoryStorage
 from fastapi_metrics.storage.sqlite import SQLiteStorage
 
 
@@ -236,5 +239,511 @@ async def test_grouped_query(memory_store):
     assert "avg_latency_ms" in results[0]
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage_fixture", ["memory_storage", "sqlite_storage"])
+async def test_bucketed_query(storage_fixture, request):
+    """Arbitrary bucket widths, with and without gap filling."""
+    storage = request.getfixturevalue(storage_fixture)
+    await storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    start = datetime.datetime.fromtimestamp(now - now % 300 - 1800, tz=datetime.timezone.utc)
+    for seconds, latency in ((10, 10.0), (20, 30.0), (610, 50.0)):
+        ts = start + datetime.timedelta(seconds=seconds)
+        await storage.store_http_metric(ts, "/api/b", "GET", 200, latency)
+        await storage.store_custom_metric(ts, "orders", latency)
+    window = {"from_time": start, "to_time": start + datetime.timedelta(seconds=899)}
+
+    rows = await storage.query_http_metrics(**window, group_by="5m")
+    assert [(r["count"], r["avg_latency_ms"]) for r in rows] == [(2, 20.0), (1, 50.0)]
+    rows = await storage.query_http_metrics(**window, group_by="5m", fill_gaps=True)
+    assert [r["count"] for r in rows] == [2, 0, 1]
+    assert rows[1]["avg_latency_ms"] is None
+    rows = await storage.query_http_metrics(**window, group_by="5m", fill_gaps=True, offset=1)
+    assert [r["count"] for r in rows] == [0, 1]
+    rows = await storage.query_http_metrics(**window, group_by="10s", fill_gaps=True, limit=5)
+    assert [r["count"] for r in rows] == [0, 1, 1, 0, 0]
+
+    rows = await storage.query_custom_metrics(**window, group_by="5m", fill_gaps=True)
+    assert [(r["name"], r["count"], r["sum"]) for r in rows] == [
+        ("orders", 2, 40.0),
+        ("orders", 0, 0.0),
+        ("orders", 1, 50.0),
+    ]
+
+    with pytest.raises(ValueError, match="Invalid group_by"):
+        await storage.query_http_metrics(**window, group_by="5x")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage_fixture", ["memory_storage", "sqlite_storage"])
+async def test_cursor_pagination(storage_fixture, request):
+    """Cursors walk every row exactly once, including rows with equal timestamps."""
+    storage = request.getfixturevalue(storage_fixture)
+    await storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for i in range(23):
+        # Groups of three rows share a timestamp
+        ts = now - datetime.timedelta(seconds=i // 3)
+        await storage.store_http_metric(ts, f"/api/{i % 2}", "GET", 200, float(i))
+        await storage.store_custom_metric(ts, "orders", float(i))
+    window = {"from_time": now - datetime.timedelta(minutes=1), "to_time": now}
+
+    async def walk(query, **kwargs):
+        values, pages, cursor = [], 0, None
+        while True:
+            page = await query(**window, limit=4, cursor=cursor, **kwargs)
+            values.extend(r.get("latency_ms", r.get("value")) for r in page)
+            pages += 1
+            cursor = page.next_cursor
+            if cursor is None:
+                return values, pages
+
+    values, pages = await walk(storage.query_http_metrics)
+    assert sorted(values) == [float(i) for i in range(23)]
+    assert pages == 6
+    values, _ = await walk(storage.query_http_metrics, endpoint="/api/1")
+    assert sorted(values) == [float(i) for i in range(1, 23, 2)]
+    values, _ = await walk(storage.query_custom_metrics, name="orders")
+    assert sorted(values) == [float(i) for i in range(23)]
+
+    # Offset pages and cursor pages agree
+    first = await storage.query_http_metrics(**window, limit=5)
+    second = await storage.query_http_metrics(**window, limit=5, cursor=first.next_cursor)
+    assert second == await storage.query_http_metrics(**window, limit=5, offset=5)
+
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        await storage.query_http_metrics(**window, cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage_fixture", ["memory_storage", "sqlite_storage"])
+async def test_batch_writes(storage_fixture, request):
+    """Batch writes store every record in one call."""
+    storage = request.getfixturevalue(storage_fixture)
+    await storage.initialize()
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    await storage.store_http_metrics_batch(
+        [
+            {
+                "timestamp": now - datetime.timedelta(seconds=i),
+                "endpoint": "/api/batch",
+                "method": "GET",
+                "status_code": 200,
+                "latency_ms": float(i),
+                "labels": {"request_id": str(i)} if i % 2 else None,
+            }
+            for i in range(10)
+        ]
+    )
+    await storage.store_custom_metrics_batch(
+        [
+            {"timestamp": now, "name": "signups", "value": 1, "labels": None},
+            {"timestamp": now, "name": "signups", "value": 2, "labels": {"source": "ads"}},
+        ]
+    )
+
+    http = await storage.query_http_metrics(
+        from_time=now - datetime.timedelta(minutes=1),
+        to_time=now + datetime.timedelta(minutes=1),
+    )
+    custom = await storage.query_custom_metrics(
+        from_time=now - datetime.timedelta(minutes=1),
+        to_time=now + datetime.timedelta(minutes=1),
+        name="signups",
+    )
+
+    assert len(http) == 10
+    assert sorted(m["value"] for m in custom) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_memory_columnar_layout(memory_storage):
+    """Rows stay time-ordered, compact, and range queries bisect."""
+    await memory_storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    # Written out of order, as concurrent requests may finish
+    for minutes in (30, 10, 20, 5, 40):
+        await memory_storage.store_http_metric(
+            timestamp=now - datetime.timedelta(minutes=minutes),
+            endpoint=f"/api/{minutes % 20}",
+            method="GET",
+            status_code=200,
+            latency_ms=float(minutes),
+        )
+
+    http = memory_storage.http
+    assert list(http.timestamps) == sorted(http.timestamps)
+    assert http.endpoints == ["/api/10", "/api/0", "/api/5"]
+    columns = (
+        http.timestamps,
+        http.latencies,
+        http.status_codes,
+        http.endpoint_ids,
+        http.method_ids,
+        http.weights,
+    )
+    assert sum(column.itemsize for column in columns) < 40
+
+    results = await memory_storage.query_http_metrics(
+        from_time=now - datetime.timedelta(minutes=25),
+        to_time=now,
+        endpoint="/api/10",
+    )
+    assert [r["latency_ms"] for r in results] == [10.0]
+    assert results[0]["timestamp"].tzinfo is not None
+    assert not await memory_storage.query_http_metrics(
+        from_time=now - datetime.timedelta(hours=1), to_time=now, endpoint="/unknown"
+    )
+
+    deleted = await memory_storage.cleanup_old_data(now - datetime.timedelta(minutes=25))
+    assert deleted == 2
+    assert [m["latency_ms"] for m in memory_storage.http_metrics] == [20.0, 10.0, 5.0]
+
+
+@pytest.mark.asyncio
+async def test_memory_method_overflow(memory_storage):
+    """Methods past the single-byte id space share the ``OTHER`` id."""
+    await memory_storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    for i in range(300):
+        await memory_storage.store_http_metric(
+            timestamp=now, endpoint="/x", method=f"M{i}", status_code=200, latency_ms=1.0
+        )
+
+    http = memory_storage.http
+    assert len(http.methods) == HttpColumns.MAX_METHODS
+    assert http.methods[-1] == "OTHER"
+    results = await memory_storage.query_http_metrics(
+        from_time=now - datetime.timedelta(minutes=1),
+        to_time=now + datetime.timedelta(minutes=1),
+        method="OTHER",
+    )
+    assert len(results) == 300 - (HttpColumns.MAX_METHODS - 1)
+
+
+@pytest.mark.asyncio
+async def test_memory_ring_buffer():
+    """A bounded store overwrites the oldest events and counts evictions."""
+    storage = MemoryStorage(max_events=5)
+    await storage.initialize()
+    start = datetime.datetime.now(datetime.timezone.utc)
+
+    for i in range(12):
+        await storage.store_http_metric(
+            timestamp=start + datetime.timedelta(seconds=i),
+            endpoint="/api/ring",
+            method="GET",
+            status_code=200,
+            latency_ms=float(i),
+        )
+
+    assert len(storage.http.timestamps) == 5
+    assert [m["latency_ms"] for m in storage.http_metrics] == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert storage.stats() == {"http_events": 5, "capacity": 5, "evicted": 7}
+
+    # Range queries work across the wrap-around point
+    results = await storage.query_http_metrics(
+        from_time=start + datetime.timedelta(seconds=8),
+        to_time=start + datetime.timedelta(seconds=10),
+    )
+    assert [r["latency_ms"] for r in results] == [8.0, 9.0, 10.0]
+
+    # Cleanup only moves the head; freed slots are reused
+    assert await storage.cleanup_old_data(start + datetime.timedelta(seconds=10)) == 3
+    await storage.store_http_metric(
+        timestamp=start + datetime.timedelta(seconds=9, milliseconds=500),
+        endpoint="/api/ring",
+        method="GET",
+        status_code=200,
+        latency_ms=9.5,
+    )
+    assert [m["latency_ms"] for m in storage.http_metrics] == [9.5, 10.0, 11.0]
+    assert storage.http.evicted == 7
+
+
+def test_memory_ring_buffer_from_url():
+    """The memory:// URL accepts a ring buffer size."""
+    app = FastAPI()
+    metrics = Metrics(app, storage="memory://?max_bytes=3500")
+    assert metrics.storage.http.capacity == 3500 // HttpColumns.ROW_BYTES
+
+
+@pytest.mark.asyncio
+async def test_sqlite_wal_and_read_pool(sqlite_storage):
+    """SQLite runs in WAL mode and queries use the read-only pool."""
+    await sqlite_storage.initialize()
+    cursor = await sqlite_storage.conn.execute("PRAGMA journal_mode")
+    assert (await cursor.fetchone())[0] == "wal"
+    # Two short-query readers and one analytics reader
+    assert len(sqlite_storage._readers) == 3
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await sqlite_storage.store_http_metric(
+        timestamp=now, endpoint="/api/wal", method="GET", status_code=200, latency_ms=5.0
+    )
+
+    # Readers see committed writes and cannot write themselves
+    async with sqlite_storage._reader() as conn:
+        assert conn is not sqlite_storage.conn
+        with pytest.raises(Exception, match="readonly"):
+            await conn.execute("DELETE FROM http_requests")
+    results = await sqlite_storage.query_http_metrics(
+        from_time=now - datetime.timedelta(minutes=1), to_time=now
+    )
+    assert [r["endpoint"] for r in results] == ["/api/wal"]
+    await sqlite_storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_analytics_pool(tmp_path):
+    """Aggregations and large scans run on the analytics pool."""
+    storage = SQLiteStorage(str(tmp_path / "pools.db"), read_pool_size=1, analytics_pool_size=1)
+    await storage.initialize()
+    reader, analytics = storage._readers
+    now = datetime.datetime.now(datetime.timezone.utc)
+    hour_ago = now - datetime.timedelta(hours=1)
+    await storage.store_http_metric(now, "/api/a", "GET", 200, 5.0)
+
+    traced = {id(reader): [], id(analytics): []}
+    for conn in (reader, analytics):
+        await conn.set_trace_callback(traced[id(conn)].append)
+
+    await storage.query_http_metrics(hour_ago, now)
+    await storage.get_endpoint_stats(hour_ago, now)
+    await storage.query_http_metrics(hour_ago, now, group_by="5m")
+    await storage.query_custom_metrics(hour_ago, now, limit=50_000)
+
+    selects = {
+        key: [sql.split()[1] for sql in statements if sql.lstrip().startswith("SELECT")]
+        for key, statements in traced.items()
+    }
+    assert selects[id(reader)] == ["r.timestamp_ms,"]
+    assert len(selects[id(analytics)]) == 3
+
+    # Without an analytics pool every query shares the read pool
+    await storage.close()
+    storage = SQLiteStorage(str(tmp_path / "pools.db"), analytics_pool_size=0)
+    await storage.initialize()
+    assert len(storage._readers) == 2
+    async with storage._reader(analytics=True) as conn:
+        assert conn in storage._readers
+    await storage.close()
+
+
+def test_sqlite_pool_sizes_from_url(tmp_path):
+    """The sqlite:// URL accepts read and analytics pool sizes."""
+    app = FastAPI()
+    url = f"sqlite://{tmp_path / 'url.db'}?read_pool_size=4&analytics_pool_size=2"
+    metrics = Metrics(app, storage=url)
+    assert (metrics.storage.read_pool_size, metrics.storage.analytics_pool_size) == (4, 2)
+
+
+@pytest.mark.asyncio
+async def test_sqlite_in_memory_uses_writer():
+    """An in-memory database has no read pool."""
+    storage = SQLiteStorage(":memory:")
+    await storage.initialize()
+    async with storage._reader() as conn:
+        assert conn is storage.conn
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_group_commit(tmp_path):
+    """Group commit makes rows visible per batch, per interval or on flush."""
+    storage = SQLiteStorage(str(tmp_path / "group.db"), commit_batch_size=3, commit_interval_ms=50)
+    await storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    window = {"from_time": now - datetime.timedelta(minutes=1), "to_time": now}
+
+    async def store(n):
+        for _ in range(n):
+            await storage.store_http_metric(
+                timestamp=now, endpoint="/api/gc", method="GET", status_code=200, latency_ms=1.0
+            )
+
+    # Not committed until the batch is full
+    await store(2)
+    assert await storage.query_http_metrics(**window) == []
+    await store(1)
+    assert len(await storage.query_http_metrics(**window)) == 3
+
+    # A partial batch is committed once the interval has passed
+    await store(1)
+    await storage.store_custom_metric(timestamp=now, name="gc", value=1.0)
+    assert len(await storage.query_http_metrics(**window)) == 3
+    await asyncio.sleep(0.15)
+    assert len(await storage.query_http_metrics(**window)) == 4
+    assert len(await storage.query_custom_metrics(**window)) == 1
+
+    # close() flushes what is left
+    await store(1)
+    await storage.close()
+    storage = SQLiteStorage(str(tmp_path / "group.db"))
+    assert len(await storage.query_http_metrics(**window)) == 5
+    await storage.close()
+
+
+def test_sqlite_group_commit_from_url(tmp_path):
+    """The sqlite:// URL accepts group commit settings."""
+    app = FastAPI()
+    metrics = Metrics(
+        app, storage=f"sqlite://{tmp_path}/m.db?commit_batch_size=500&commit_interval_ms=20"
+    )
+    assert metrics.storage.db_path == f"{tmp_path}/m.db"
+    assert metrics.storage.commit_batch_size == 500
+    assert metrics.storage.commit_interval_ms == 20.0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_partitions(tmp_path):
+    """Partitioned tables are queried by time range and dropped on retention."""
+    storage = SQLiteStorage(str(tmp_path / "parts.db"), partition_by="hour")
+    await storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    hours = [now - datetime.timedelta(hours=h) for h in (5, 4, 0)]
+
+    for i, ts in enumerate(hours):
+        await storage.store_http_metric(
+            timestamp=ts, endpoint="/api/p", method="GET", status_code=200, latency_ms=float(i)
+        )
+        await storage.store_custom_metric(timestamp=ts, name="p", value=float(i))
+    assert len(storage._partitions["http_requests"]) == 3
+
+    # Only overlapping partitions are read
+    recent = {"from_time": now - datetime.timedelta(minutes=30), "to_time": now}
+    assert "UNION ALL" in storage._source("http_requests", now.timestamp() - 60)
+    assert storage._source("http_requests", now.timestamp() + 7200) == "http_requests"
+    assert [r["latency_ms"] for r in await storage.query_http_metrics(**recent)] == [2.0]
+    stats = await storage.get_endpoint_stats()
+    assert stats[0]["count"] == 3
+
+    # Retention drops whole partitions
+    deleted = await storage.cleanup_old_data(now - datetime.timedelta(hours=2))
+    assert deleted == 4
+    assert len(storage._partitions["http_requests"]) == 1
+    cursor = await storage.conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'http_requests_%'"
+    )
+    assert (await cursor.fetchone())[0] == 1
+    await storage.close()
+
+    # Partitions are discovered by an unpartitioned instance
+    storage = SQLiteStorage(str(tmp_path / "parts.db"))
+    results = await storage.query_custom_metrics(
+        from_time=now - datetime.timedelta(days=1), to_time=now
+    )
+    assert [r["value"] for r in results] == [2.0]
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cleanup_prunes_dimensions(tmp_path):
+    """Per-request labels stay inline and retention forgets unused endpoints."""
+    storage = SQLiteStorage(str(tmp_path / "dims.db"), partition_by="hour")
+    await storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    for i, hours in enumerate((5, 5, 0)):
+        await storage.store_http_metric(
+            timestamp=now - datetime.timedelta(hours=hours),
+            endpoint=f"/api/{hours}",
+            method="GET",
+            status_code=200,
+            latency_ms=1.0,
+            labels={"request_id": f"r{i}"},
+        )
+    assert set(storage._dimension_ids["endpoints"]) == {"/api/5", "/api/0"}
+
+    await storage.cleanup_old_data(now - datetime.timedelta(hours=2))
+    cursor = await storage.conn.execute("SELECT endpoint FROM endpoints")
+    assert await cursor.fetchall() == [("/api/0",)]
+    assert set(storage._dimension_ids["endpoints"]) == {"/api/0"}
+
+    # A pruned endpoint is interned again when it reappears
+    await storage.store_http_metric(now, "/api/5", "GET", 200, 2.0)
+    rows = await storage.query_http_metrics(now - datetime.timedelta(hours=1), now)
+    assert [(r["endpoint"], r["labels"]) for r in rows] == [
+        ("/api/5", {}),
+        ("/api/0", {"request_id": "r2"}),
+    ]
+    await storage.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("aggregate", [True, False])
+async def test_sqlite_percentiles(sqlite_storage, memory_storage, monkeypatch, aggregate):
+    """Endpoint stats and hourly series carry percentiles computed in SQLite.
+
+    Without the ``latency_sketch`` aggregate (an aiosqlite release changing
+    the internals it is registered through) the same percentiles are
+    computed from the grouped raw latencies.
+    """
+    assert not await SQLiteStorage._register_functions(object())
+    if not aggregate:
+
+        async def unavailable(conn):
+            return False
+
+        monkeypatch.setattr(SQLiteStorage, "_register_functions", staticmethod(unavailable))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    metrics = [
+        {
+            "timestamp": now,
+            "endpoint": "/api/p",
+            "method": "GET",
+            "status_code": 200,
+            "latency_ms": float(i),
+            "weight": 2.0 if i > 90 else 1.0,
+        }
+        for i in range(1, 101)
+    ]
+    for storage in (sqlite_storage, memory_storage):
+        await storage.initialize()
+        await storage.store_http_metrics_batch(metrics)
+
+    (stats,) = await sqlite_storage.get_endpoint_stats()
+    (expected,) = await memory_storage.get_endpoint_stats()
+    for key in ("p50_latency_ms", "p95_latency_ms", "p99_latency_ms"):
+        assert stats[key] == pytest.approx(expected[key])
+    assert stats["p50_latency_ms"] == pytest.approx(55, rel=0.02)
+    assert stats["p99_latency_ms"] == pytest.approx(100, rel=0.02)
+
+    (hour,) = await sqlite_storage.query_http_metrics(
+        from_time=now - datetime.timedelta(minutes=1), to_time=now, group_by="hour"
+    )
+    assert hour["count"] == 110
+    assert hour["p95_latency_ms"] == pytest.approx(stats["p95_latency_ms"])
+    await sqlite_storage.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage_fixture", ["memory_storage", "sqlite_storage"])
+async def test_store_error_upsert(storage_fixture, request):
+    """Errors are deduplicated by hash and counts are added up."""
+    storage = request.getfixturevalue(storage_fixture)
+    await storage.initialize()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    error = {
+        "endpoint": "/api/error",
+        "method": "GET",
+        "error_type": "ValueError",
+        "error_message": "boom",
+        "error_hash": "abc123",
+        "stack_trace": "Traceback",
+    }
+
+    await storage.store_error(timestamp=now - datetime.timedelta(seconds=30), **error)
+    await storage.store_error(timestamp=now, count=9, **error)
+
+    (result,) = await storage.query_errors(now - datetime.timedelta(minutes=1), now)
+    assert result["count"] == 10
+    assert result["error_type"] == "ValueError"
+
+
 if __name__ == "__main__":
     pytest.main([__file__])